@@ -1,8 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.orm import Session
 from typing import List, Optional
 
+from app.utils.conditional import conditional_response
+from app.utils.config import settings
 from app.utils.database import get_db
+from app.utils.serialization import fast_json_response
 from app.schemas.horoscope import HoroscopeResponse, TodayHoroscope
 from app.services.horoscope_service import HoroscopeService
 
@@ -10,63 +13,78 @@ from app.services.horoscope_service import HoroscopeService
 router = APIRouter()
 
 
+# 必须在/{sign}/today之前注册，否则/all/today会被当作星座"all"匹配
+@router.get("/all/today", response_model=List[TodayHoroscope], summary="获取所有星座今日运势")
+async def get_all_today_horoscopes(
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_db)
+):
+    """获取所有星座的今日星象运势数据
+
+    数据由每日预计算任务批量写入，请求时只需一次查询（缓存命中时不查询数据库）。
+    """
+    horoscope_service = HoroscopeService(db)
+    
+    horoscopes = await horoscope_service.get_all_today_horoscopes()
+    
+    if not horoscopes:
+        raise HTTPException(status_code=404, detail="未找到任何星座的运势数据")
+    
+    not_modified = conditional_response(request, response, ("horoscope_all_today",), *horoscopes)
+    if not_modified is not None:
+        return not_modified
+    
+    if settings.FAST_SERIALIZATION:
+        return fast_json_response(TodayHoroscope, horoscopes, response)
+    return horoscopes
+
+
 @router.get("/{sign}", response_model=HoroscopeResponse, summary="获取星座运势")
 async def get_horoscope(
     sign: str,
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db)
 ):
     """根据星座名称获取星象运势数据"""
     horoscope_service = HoroscopeService(db)
     
     # 尝试获取星象数据
-    horoscope = horoscope_service.get_or_fetch_horoscope(sign)
+    horoscope = await horoscope_service.get_or_fetch_horoscope(sign)
     
     if not horoscope:
         raise HTTPException(status_code=404, detail=f"未找到星座 {sign} 的运势数据")
     
+    not_modified = conditional_response(request, response, ("horoscope",), horoscope)
+    if not_modified is not None:
+        return not_modified
+    
+    if settings.FAST_SERIALIZATION:
+        return fast_json_response(HoroscopeResponse, horoscope, response)
     return horoscope
 
 
 @router.get("/{sign}/today", response_model=TodayHoroscope, summary="获取今日星座运势")
 async def get_today_horoscope(
     sign: str,
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db)
 ):
     """根据星座名称获取今日星象运势数据"""
     horoscope_service = HoroscopeService(db)
     
     # 尝试获取星象数据
-    horoscope = horoscope_service.get_or_fetch_horoscope(sign)
+    horoscope = await horoscope_service.get_or_fetch_horoscope(sign)
     
     if not horoscope:
         raise HTTPException(status_code=404, detail=f"未找到星座 {sign} 的运势数据")
     
-    return horoscope
-
-
-@router.get("/all/today", response_model=List[TodayHoroscope], summary="获取所有星座今日运势")
-async def get_all_today_horoscopes(
-    db: Session = Depends(get_db)
-):
-    """获取所有星座的今日星象运势数据"""
-    horoscope_service = HoroscopeService(db)
+    not_modified = conditional_response(request, response, ("horoscope_today",), horoscope)
+    if not_modified is not None:
+        return not_modified
     
-    # 从数据库获取所有星座的今日运势
-    horoscopes = horoscope_service.get_all_horoscopes()
-    
-    # 如果数据库中没有数据，则从API获取
-    if not horoscopes:
-        # 所有星座列表
-        signs = ["白羊座", "金牛座", "双子座", "巨蟹座", "狮子座", "处女座", 
-                 "天秤座", "天蝎座", "射手座", "摩羯座", "水瓶座", "双鱼座"]
-        
-        horoscopes = []
-        for sign in signs:
-            horoscope = horoscope_service.get_or_fetch_horoscope(sign)
-            if horoscope:
-                horoscopes.append(horoscope)
-    
-    if not horoscopes:
-        raise HTTPException(status_code=404, detail="未找到任何星座的运势数据")
-    
-    return horoscopes
+    if settings.FAST_SERIALIZATION:
+        return fast_json_response(TodayHoroscope, horoscope, response)
+    return horoscope
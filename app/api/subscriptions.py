@@ -0,0 +1,156 @@
+import asyncio
+import json
+from typing import Any, AsyncIterator, Dict, List
+
+from fastapi import APIRouter, Depends, HTTPException, Query, WebSocket, WebSocketDisconnect
+from sqlalchemy.orm import Session
+
+from app.services.subscription_service import SubscriptionService, format_event, update_hub
+from app.utils.config import settings
+from app.utils.database import close_db, get_db
+from app.utils.metrics import SUBSCRIPTION_EVENTS, SUBSCRIPTION_REJECTED
+from app.utils.subscriptions import EventStreamResponse, Subscription
+
+# 创建路由实例
+router = APIRouter()
+
+# 连接数已满时WebSocket的关闭码（Try Again Later）
+WS_TRY_AGAIN_LATER = 1013
+
+
+def _dumps(payload: Dict[str, Any]) -> str:
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+
+
+def _check_topics(cities: List[str], signs: List[str]) -> None:
+    """检查订阅的城市和星座数量"""
+    if not cities and not signs:
+        raise HTTPException(status_code=400, detail="至少订阅一个城市或星座")
+    if len(cities) + len(signs) > settings.SUBSCRIPTION_MAX_TOPICS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"每个连接最多订阅{settings.SUBSCRIPTION_MAX_TOPICS}个城市和星座"
+        )
+
+
+@router.get("/stream", summary="订阅天气与星座运势更新（Server-Sent Events）")
+async def stream_updates(
+    city: List[str] = Query(default=[], description="订阅的城市，可重复，如?city=Beijing&city=Tokyo"),
+    sign: List[str] = Query(default=[], description="订阅的星座，可重复"),
+    db: Session = Depends(get_db)
+):
+    """以Server-Sent Events推送订阅的城市天气和星座运势
+
+    连接建立后先发送subscribed事件（订阅结果），随后发送每个城市/星座的完整数据，
+    之后只在数据变化时发送变化的字段；没有变化时定期发送注释行作为心跳。
+    """
+    _check_topics(city, sign)
+    subscription = update_hub.connect()
+    if subscription is None:
+        raise HTTPException(status_code=503, detail="订阅连接数已满，请稍后重试")
+
+    try:
+        result = await SubscriptionService(db).subscribe(subscription, city, sign)
+    except BaseException:
+        update_hub.disconnect(subscription)
+        raise
+    # 长连接不占用数据库连接，之后的更新由后台任务统一获取
+    await close_db(db)
+
+    return EventStreamResponse(
+        _event_stream(subscription, result),
+        send_timeout=settings.SUBSCRIPTION_SEND_TIMEOUT_SECONDS,
+        on_close=lambda: update_hub.disconnect(subscription)
+    )
+
+
+async def _event_stream(subscription: Subscription, result: Dict[str, Any]) -> AsyncIterator[bytes]:
+    """将订阅的变化编码为Server-Sent Events"""
+    yield f"event: subscribed\ndata: {_dumps(result)}\n\n".encode()
+    while True:
+        batch = await subscription.next(settings.SUBSCRIPTION_KEEPALIVE_SECONDS)
+        if batch is None:
+            return
+        if not batch:
+            yield b": keepalive\n\n"
+            continue
+        chunks = []
+        for topic, changes in batch:
+            name, payload = format_event(topic, changes)
+            SUBSCRIPTION_EVENTS.labels(name).inc()
+            chunks.append(f"event: {name}\ndata: {_dumps(payload)}\n\n")
+        yield "".join(chunks).encode()
+
+
+@router.websocket("/ws")
+async def websocket_updates(websocket: WebSocket, db: Session = Depends(get_db)):
+    """以WebSocket推送订阅的城市天气和星座运势
+
+    客户端发送{"action": "subscribe" | "unsubscribe", "cities": [...], "signs": [...]}
+    随时增减订阅；服务端推送的消息格式见docs/API.md。
+    """
+    subscription = update_hub.connect()
+    if subscription is None:
+        await websocket.close(code=WS_TRY_AGAIN_LATER)
+        return
+    await websocket.accept()
+    service = SubscriptionService(db)
+    # 订阅回复与推送共用一个连接，回复需在新订阅的完整数据之前发送
+    send_lock = asyncio.Lock()
+
+    async def send(payload: Dict[str, Any]) -> None:
+        await asyncio.wait_for(websocket.send_text(_dumps(payload)), settings.SUBSCRIPTION_SEND_TIMEOUT_SECONDS)
+
+    async def read_messages() -> None:
+        while True:
+            try:
+                message = json.loads(await websocket.receive_text())
+                action = message.get("action")
+                cities = [str(city) for city in message.get("cities") or []]
+                signs = [str(sign) for sign in message.get("signs") or []]
+            except (ValueError, AttributeError, TypeError):
+                await send({"event": "error", "detail": "消息必须是包含action、cities和signs的JSON对象"})
+                continue
+
+            if action == "unsubscribe":
+                await service.unsubscribe(subscription, cities, signs)
+                await close_db(db)
+                continue
+            if action != "subscribe":
+                await send({"event": "error", "detail": f"未知的操作 {action}"})
+                continue
+            if len(subscription.topics) + len(cities) + len(signs) > settings.SUBSCRIPTION_MAX_TOPICS:
+                await send({
+                    "event": "error",
+                    "detail": f"每个连接最多订阅{settings.SUBSCRIPTION_MAX_TOPICS}个城市和星座"
+                })
+                continue
+            async with send_lock:
+                result = await service.subscribe(subscription, cities, signs)
+                await close_db(db)
+                await send({"event": "subscribed", **result})
+
+    reader = asyncio.ensure_future(read_messages())
+    # 客户端断开时结束推送，不必等到下一次心跳
+    reader.add_done_callback(lambda _: update_hub.disconnect(subscription))
+    try:
+        while True:
+            batch = await subscription.next(settings.SUBSCRIPTION_KEEPALIVE_SECONDS)
+            if batch is None:
+                break
+            async with send_lock:
+                if not batch:
+                    await send({"event": "keepalive"})
+                for topic, changes in batch:
+                    name, payload = format_event(topic, changes)
+                    SUBSCRIPTION_EVENTS.labels(name).inc()
+                    await send({"event": name, **payload})
+        await asyncio.wait([reader])
+        reader.result()
+    except asyncio.TimeoutError:
+        SUBSCRIPTION_REJECTED.labels("slow").inc()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        reader.cancel()
+        update_hub.disconnect(subscription)
@@ -1,9 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.orm import Session
-from typing import Optional
+from datetime import datetime
+from typing import List, Literal, Optional, Union
 
 from app.utils.database import get_db
-from app.schemas.weather import WeatherResponse, WeatherForecast
+from app.schemas.weather import (
+    WeatherResponse, WeatherObservationResponse, WeatherRollupResponse, WeatherForecast,
+    WeatherBatchRequest, WeatherBatchResponse
+)
+from app.utils.conditional import conditional_response
+from app.utils.config import settings
+from app.utils.serialization import fast_json_response
 from app.services.weather_service import WeatherService
 
 # 创建路由实例
@@ -13,57 +20,101 @@ router = APIRouter()
 @router.get("/{city}", response_model=WeatherResponse, summary="获取城市天气")
 async def get_weather(
     city: str,
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db)
 ):
-    """根据城市名称获取实时天气数据"""
+    """根据城市名称获取实时天气数据，支持If-None-Match/If-Modified-Since条件请求"""
     weather_service = WeatherService(db)
     
     # 尝试获取天气数据
-    weather = weather_service.get_or_fetch_weather(city)
+    weather = await weather_service.get_or_fetch_weather(city)
     
     if not weather:
         raise HTTPException(status_code=404, detail=f"未找到城市 {city} 的天气数据")
     
+    # 客户端缓存的数据未变化时直接返回304，不序列化响应体
+    not_modified = conditional_response(request, response, ("weather",), weather)
+    if not_modified is not None:
+        return not_modified
+    
+    if settings.FAST_SERIALIZATION:
+        return fast_json_response(WeatherResponse, weather, response)
     return weather
 
 
+@router.post("/batch", response_model=WeatherBatchResponse, summary="批量获取城市天气")
+async def get_weather_batch(
+    request: WeatherBatchRequest,
+    db: Session = Depends(get_db)
+):
+    """一次获取多个城市的实时天气数据，返回每个城市的结果和错误信息"""
+    if len(request.cities) > settings.WEATHER_BATCH_MAX_CITIES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"单次最多查询 {settings.WEATHER_BATCH_MAX_CITIES} 个城市"
+        )
+    
+    weather_service = WeatherService(db)
+    results, errors = await weather_service.get_or_fetch_weather_batch(request.cities)
+    
+    return {"results": results, "errors": errors}
+
+
 @router.get("/forecast/{city}", response_model=WeatherForecast, summary="获取天气预报")
 async def get_weather_forecast(
     city: str,
+    request: Request,
+    response: Response,
     days: int = Query(7, ge=1, le=14, description="预报天数，1-14天"),
     db: Session = Depends(get_db)
 ):
-    """根据城市名称获取天气预报数据"""
+    """根据城市名称获取天气预报数据，支持条件请求"""
     weather_service = WeatherService(db)
     
-    # 从API获取天气预报数据
-    api_data = weather_service.fetch_forecast_from_api(city)
+    # 获取天气预报数据并限制预报天数
+    forecast = await weather_service.get_or_fetch_forecast(city, days)
     
-    if not api_data:
+    if not forecast:
         raise HTTPException(status_code=404, detail=f"未找到城市 {city} 的天气预报数据")
     
-    # 解析API响应
-    forecast = weather_service.parse_forecast_api_response(api_data)
-    
-    # 限制预报天数
-    forecast.forecast = forecast.forecast[:days]
+    not_modified = conditional_response(
+        request, response, ("forecast", forecast.city, forecast.country, days), forecast
+    )
+    if not_modified is not None:
+        return not_modified
     
+    if settings.FAST_SERIALIZATION:
+        return fast_json_response(WeatherForecast, forecast, response)
     return forecast
 
 
-@router.get("/history/{city}", response_model=list[WeatherResponse], summary="获取天气历史数据")
+@router.get(
+    "/history/{city}",
+    response_model=Union[List[WeatherObservationResponse], List[WeatherRollupResponse]],
+    summary="获取天气历史数据"
+)
 async def get_weather_history(
     city: str,
-    limit: int = Query(10, ge=1, le=100, description="返回记录数，1-100条"),
+    limit: int = Query(10, ge=1, le=100, description="返回记录数，1-100条，仅对原始记录生效"),
+    resolution: Literal["raw", "hour", "day"] = Query(
+        "raw", description="raw为原始观测记录，hour/day为按小时/按天聚合的数据"
+    ),
+    start: Optional[datetime] = Query(None, alias="from", description="起始时间（含）"),
+    end: Optional[datetime] = Query(None, alias="to", description="结束时间（不含）"),
     db: Session = Depends(get_db)
 ):
-    """根据城市名称获取天气历史数据"""
-    from app.models.weather import Weather
+    """根据城市名称获取天气历史数据，可按时间范围查询原始观测记录或聚合数据"""
+    weather_service = WeatherService(db)
     
-    # 从数据库获取历史数据
-    history = db.query(Weather).filter(
-        Weather.city == city
-    ).order_by(Weather.created_at.desc()).limit(limit).all()
+    if resolution == "raw":
+        # 从观测记录中获取历史数据
+        history = await weather_service.get_weather_history(city, limit, start, end)
+        history = [WeatherObservationResponse.model_validate(item, from_attributes=True) for item in history]
+    else:
+        # 从按小时/按天的聚合数据中获取
+        history = await weather_service.get_weather_rollups(city, resolution, start, end)
+        history = [WeatherRollupResponse.model_validate(item, from_attributes=True) for item in history]
     
     if not history:
         raise HTTPException(status_code=404, detail=f"未找到城市 {city} 的天气历史数据")
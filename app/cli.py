@@ -0,0 +1,39 @@
+"""命令行任务入口
+
+用法：
+    python -m app.cli precompute-horoscopes   # 预计算所有星座当天的星象数据
+    python -m app.cli prune-observations      # 清理过期的天气观测记录
+"""
+import argparse
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from app.services.horoscope_service import precompute_daily_horoscopes
+from app.services.weather_service import prune_expired_observations
+from app.utils.http_client import close_http_client
+
+# 子命令名称 -> 任务函数，任务返回处理的记录数
+COMMANDS: Dict[str, Callable[[], Awaitable[int]]] = {
+    "precompute-horoscopes": precompute_daily_horoscopes,
+    "prune-observations": prune_expired_observations,
+}
+
+
+async def _run(command: str) -> int:
+    """执行任务并在结束后关闭共享的HTTP客户端"""
+    try:
+        return await COMMANDS[command]()
+    finally:
+        await close_http_client()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Stellar Weather API 后台任务")
+    parser.add_argument("command", choices=sorted(COMMANDS), help="要执行的任务")
+    args = parser.parse_args(argv)
+    count = asyncio.run(_run(args.command))
+    print(f"{args.command}: 处理了 {count} 条记录")
+
+
+if __name__ == "__main__":
+    main()
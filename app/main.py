@@ -1,8 +1,69 @@
-from fastapi import FastAPI
+import logging
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 
-from app.api import weather, horoscope, analysis
+from app.api import weather, horoscope, analysis, subscriptions
+from app.services.horoscope_service import precompute_daily_horoscopes
+from app.services.subscription_service import refresh_subscriptions
+from app.services.weather_service import weather_refresh_scheduler, prune_expired_observations
+from app.utils.cache_backend import close_cache_backend
 from app.utils.config import settings
+from app.utils.http_client import start_http_client, close_http_client
+from app.utils.metrics import CONTENT_TYPE, MetricsMiddleware, registry
+from app.utils.periodic import PeriodicTask, seconds_until_hour
+from app.utils.profiling import ProfilingMiddleware
+from app.utils.resilience import DeadlineMiddleware, upstream_status
+
+logging.basicConfig(
+    level=settings.LOG_LEVEL,
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+)
+
+# 定期清理过期的天气观测记录
+observation_retention_task = PeriodicTask(
+    "observation_retention",
+    prune_expired_observations,
+    interval=settings.WEATHER_OBSERVATION_PRUNE_INTERVAL_MINUTES * 60
+)
+
+# 每天在HOROSCOPE_PRECOMPUTE_HOUR点预计算所有星座的星象数据
+horoscope_precompute_task = PeriodicTask(
+    "horoscope_precompute",
+    precompute_daily_horoscopes,
+    interval=24 * 3600,
+    initial_delay=lambda: seconds_until_hour(settings.HOROSCOPE_PRECOMPUTE_HOUR)
+)
+
+# 定期检查被订阅的城市和星座，将变化推送给订阅连接
+subscription_refresh_task = PeriodicTask(
+    "subscription_refresh",
+    refresh_subscriptions,
+    interval=settings.SUBSCRIPTION_REFRESH_INTERVAL_SECONDS
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：启动时创建共享资源，关闭时释放"""
+    await start_http_client()
+    if settings.REFRESH_AHEAD_ENABLED:
+        weather_refresh_scheduler.start()
+    if settings.WEATHER_OBSERVATION_PRUNE_INTERVAL_MINUTES > 0:
+        observation_retention_task.start()
+    if settings.HOROSCOPE_PRECOMPUTE_ENABLED:
+        horoscope_precompute_task.start()
+    if settings.SUBSCRIPTION_REFRESH_INTERVAL_SECONDS > 0:
+        subscription_refresh_task.start()
+    yield
+    await subscription_refresh_task.stop()
+    await horoscope_precompute_task.stop()
+    await observation_retention_task.stop()
+    await weather_refresh_scheduler.stop()
+    await close_http_client()
+    await close_cache_backend()
+
 
 # 创建FastAPI应用实例
 app = FastAPI(
@@ -10,7 +71,8 @@ app = FastAPI(
     description="一个提供星象与天气趣味数据服务的API后端项目",
     version="0.1.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
 # 配置CORS
@@ -22,10 +84,20 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 限制每个请求等待上游的总时长
+app.add_middleware(DeadlineMiddleware)
+
+# 按需分析单个请求的CPU耗时和内存分配
+app.add_middleware(ProfilingMiddleware)
+
+# 记录每个路由的处理耗时
+app.add_middleware(MetricsMiddleware)
+
 # 注册路由
 app.include_router(weather.router, prefix="/api/weather", tags=["weather"])
 app.include_router(horoscope.router, prefix="/api/horoscope", tags=["horoscope"])
 app.include_router(analysis.router, prefix="/api/analysis", tags=["analysis"])
+app.include_router(subscriptions.router, prefix="/api/subscriptions", tags=["subscriptions"])
 
 
 @app.get("/")
@@ -41,5 +113,16 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    """健康检查接口"""
-    return {"status": "healthy"}
+    """健康检查接口，附带各上游的熔断器状态
+
+    上游熔断时状态为degraded，此时应用仍可返回已缓存的数据，因此不返回错误状态码。
+    """
+    upstreams = upstream_status()
+    degraded = any(item["state"] != "closed" for item in upstreams.values())
+    return {"status": "degraded" if degraded else "healthy", "upstreams": upstreams}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus格式的运行指标"""
+    return Response(content=registry.render(), media_type=CONTENT_TYPE)
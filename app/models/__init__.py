@@ -1,4 +1,8 @@
-from app.models.weather import Weather
+from app.models.weather import CityAlias, Weather, WeatherForecastCache, WeatherObservation
+from app.models.weather_rollup import WeatherRollupHourly, WeatherRollupDaily
 from app.models.horoscope import Horoscope
 
-__all__ = ["Weather", "Horoscope"]
+__all__ = [
+    "CityAlias", "Weather", "WeatherForecastCache", "WeatherObservation",
+    "WeatherRollupHourly", "WeatherRollupDaily", "Horoscope"
+]
@@ -9,7 +9,7 @@ class Horoscope(Base):
     __tablename__ = "horoscope"
     
     id = Column(Integer, primary_key=True, index=True)
-    sign = Column(String(50), index=True, nullable=False)  # 星座名称
+    sign = Column(String(50), unique=True, index=True, nullable=False)  # 星座名称
     date_range = Column(String(100), nullable=False)  # 日期范围
     today = Column(Text, nullable=False)  # 今日运势
     tomorrow = Column(Text, nullable=False)  # 明日运势
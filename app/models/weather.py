@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime
+from sqlalchemy import Column, Integer, String, Float, DateTime, Text, Index
 from sqlalchemy.sql import func
 
 from app.utils.database import Base
@@ -9,7 +9,7 @@ class Weather(Base):
     __tablename__ = "weather"
     
     id = Column(Integer, primary_key=True, index=True)
-    city = Column(String(100), index=True, nullable=False)
+    city = Column(String(100), unique=True, index=True, nullable=False)  # 规范城市名称
     country = Column(String(100), nullable=False)
     temperature = Column(Float, nullable=False)
     humidity = Column(Integer, nullable=False)
@@ -18,3 +18,44 @@ class Weather(Base):
     icon = Column(String(50), nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+
+class CityAlias(Base):
+    """城市别名模型，将用户输入的各种写法映射到规范城市名称（外部API返回的城市名称）"""
+    __tablename__ = "city_alias"
+    
+    id = Column(Integer, primary_key=True)
+    alias = Column(String(100), unique=True, index=True, nullable=False)  # 规范化后的用户输入
+    city = Column(String(100), index=True, nullable=False)  # 规范城市名称
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class WeatherForecastCache(Base):
+    """天气预报缓存模型，保存解析后的预报数据"""
+    __tablename__ = "weather_forecast"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    city_key = Column(String(100), unique=True, index=True, nullable=False)  # 规范城市名称
+    city = Column(String(100), nullable=False)
+    country = Column(String(100), nullable=False)
+    forecast = Column(Text, nullable=False)  # WeatherForecast的JSON序列化结果
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+
+class WeatherObservation(Base):
+    """天气观测记录模型，每次从外部API获取天气时追加一条，只增不改"""
+    __tablename__ = "weather_observation"
+    __table_args__ = (
+        Index("ix_weather_observation_city_observed_at", "city", "observed_at"),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    city = Column(String(100), nullable=False)
+    country = Column(String(100), nullable=False)
+    temperature = Column(Float, nullable=False)
+    humidity = Column(Integer, nullable=False)
+    wind_speed = Column(Float, nullable=False)
+    description = Column(String(200), nullable=False)
+    icon = Column(String(50), nullable=False)
+    observed_at = Column(DateTime(timezone=True), nullable=False, index=True)  # 观测时间
@@ -0,0 +1,51 @@
+from sqlalchemy import Column, Integer, String, Float, DateTime, UniqueConstraint
+
+from app.utils.database import Base
+
+
+class WeatherRollupMixin:
+    """天气观测聚合的公共字段，按城市和时间桶累计观测值"""
+    
+    id = Column(Integer, primary_key=True)
+    city = Column(String(100), nullable=False)
+    bucket_start = Column(DateTime(timezone=True), nullable=False)  # 时间桶起点
+    sample_count = Column(Integer, nullable=False, default=0)  # 观测次数
+    temperature_sum = Column(Float, nullable=False, default=0.0)
+    temperature_min = Column(Float, nullable=False)
+    temperature_max = Column(Float, nullable=False)
+    humidity_sum = Column(Integer, nullable=False, default=0)
+    humidity_min = Column(Integer, nullable=False)
+    humidity_max = Column(Integer, nullable=False)
+    wind_speed_sum = Column(Float, nullable=False, default=0.0)
+    wind_speed_max = Column(Float, nullable=False)
+    
+    @property
+    def temperature_avg(self) -> float:
+        """平均气温"""
+        return round(self.temperature_sum / self.sample_count, 2)
+    
+    @property
+    def humidity_avg(self) -> float:
+        """平均湿度"""
+        return round(self.humidity_sum / self.sample_count, 2)
+    
+    @property
+    def wind_speed_avg(self) -> float:
+        """平均风速"""
+        return round(self.wind_speed_sum / self.sample_count, 2)
+
+
+class WeatherRollupHourly(WeatherRollupMixin, Base):
+    """按小时聚合的天气观测"""
+    __tablename__ = "weather_rollup_hourly"
+    __table_args__ = (
+        UniqueConstraint("city", "bucket_start", name="uq_weather_rollup_hourly_city_bucket"),
+    )
+
+
+class WeatherRollupDaily(WeatherRollupMixin, Base):
+    """按天聚合的天气观测"""
+    __tablename__ = "weather_rollup_daily"
+    __table_args__ = (
+        UniqueConstraint("city", "bucket_start", name="uq_weather_rollup_daily_city_bucket"),
+    )
@@ -4,8 +4,12 @@ from app.schemas.weather import (
     WeatherUpdate,
     WeatherInDB,
     WeatherResponse,
+    WeatherObservationResponse,
+    WeatherRollupResponse,
     ForecastDay,
-    WeatherForecast
+    WeatherForecast,
+    WeatherBatchRequest,
+    WeatherBatchResponse
 )
 from app.schemas.horoscope import (
     HoroscopeBase,
@@ -23,8 +27,12 @@ __all__ = [
     "WeatherUpdate",
     "WeatherInDB",
     "WeatherResponse",
+    "WeatherObservationResponse",
+    "WeatherRollupResponse",
     "ForecastDay",
     "WeatherForecast",
+    "WeatherBatchRequest",
+    "WeatherBatchResponse",
     
     # Horoscope schemas
     "HoroscopeBase",
@@ -1,6 +1,6 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import Optional
+from typing import Dict, List, Optional
 
 
 class WeatherBase(BaseModel):
@@ -47,11 +47,38 @@ class WeatherResponse(WeatherBase):
         orm_mode = True
 
 
+class WeatherObservationResponse(WeatherBase):
+    """API响应的天气观测记录模式"""
+    observed_at: datetime
+    
+    class Config:
+        orm_mode = True
+
+
+class WeatherRollupResponse(BaseModel):
+    """API响应的按小时/按天聚合天气数据模式"""
+    city: str
+    bucket_start: datetime
+    sample_count: int
+    temperature_avg: float
+    temperature_min: float
+    temperature_max: float
+    humidity_avg: float
+    humidity_min: int
+    humidity_max: int
+    wind_speed_avg: float
+    wind_speed_max: float
+    
+    class Config:
+        orm_mode = True
+
+
 class ForecastDay(BaseModel):
     """天气预报的单日数据模式"""
     date: str
     temperature_min: float
     temperature_max: float
+    temperature_avg: Optional[float] = None  # 当日平均气温
     humidity: int
     wind_speed: float
     description: str
@@ -63,3 +90,16 @@ class WeatherForecast(BaseModel):
     city: str
     country: str
     forecast: list[ForecastDay]
+    # 预报数据的最后更新时间，只用于生成ETag/Last-Modified，不出现在响应中
+    updated_at: Optional[datetime] = Field(None, exclude=True)
+
+
+class WeatherBatchRequest(BaseModel):
+    """批量查询天气的请求模式"""
+    cities: List[str] = Field(..., min_length=1, description="城市名称列表")
+
+
+class WeatherBatchResponse(BaseModel):
+    """批量查询天气的响应模式"""
+    results: Dict[str, WeatherResponse]  # 城市名称 -> 天气数据
+    errors: Dict[str, str]               # 城市名称 -> 错误信息
@@ -1,4 +1,12 @@
 from app.services.weather_service import WeatherService
 from app.services.horoscope_service import HoroscopeService
+from app.services.forecast_aggregation import aggregate_forecasts
+from app.services.analysis_engine import AnalysisRuleEngine, analysis_engine
 
-__all__ = ["WeatherService", "HoroscopeService"]
+__all__ = [
+    "WeatherService",
+    "HoroscopeService",
+    "aggregate_forecasts",
+    "AnalysisRuleEngine",
+    "analysis_engine",
+]
@@ -0,0 +1,130 @@
+import hashlib
+import json
+import math
+from bisect import bisect_right
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+from app.utils.config import settings
+
+# 默认的分析规则文件
+DEFAULT_RULES_PATH = Path(__file__).with_name("analysis_rules.json")
+
+# 规则中表示“其他元素”的键
+ANY_ELEMENT = "*"
+
+
+class AnalysisRuleEngine:
+    """天气与星象趣味分析的规则引擎
+
+    温度区间、星座元素、天气关键词及对应的文本都来自规则数据，构造时编译为查找表：
+    星座→元素、（温度区间，星座）→文本片段，温度区间的分界点按升序保存。
+    生成一条分析只需一次二分查找和几次字典查找，运势摘要和天气描述的匹配结果会被缓存。
+    """
+
+    def __init__(self, rules: Dict[str, Any], memo_size: int = 1024):
+        # 规则内容的摘要，规则变化时分析结果的ETag随之变化
+        self.version = hashlib.sha1(
+            json.dumps(rules, sort_keys=True, ensure_ascii=False).encode("utf-8")
+        ).hexdigest()[:12]
+        self.summary: str = rules["summary"]
+        self.today_separator: str = rules["today_separator"]
+        self.sign_element: Dict[str, str] = {
+            sign: element
+            for element, signs in rules["elements"].items()
+            for sign in signs
+        }
+        self.bands, self._cuts = self._compile_bands(rules["temperature_bands"])
+        self._band_defaults, self._band_fragments = self._compile_fragments(
+            rules.get("band_fragments", {})
+        )
+        self._keywords: List[Tuple[str, str]] = [
+            (item["keyword"], item["fragment"]) for item in rules.get("description_keywords", [])
+        ]
+        self.today_fragment = lru_cache(maxsize=memo_size)(self._today_fragment)
+        self.description_fragment = lru_cache(maxsize=memo_size)(self._description_fragment)
+
+    @classmethod
+    def from_file(cls, path: Union[str, Path], memo_size: int = 1024) -> "AnalysisRuleEngine":
+        """从JSON规则文件创建规则引擎"""
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f), memo_size=memo_size)
+
+    @staticmethod
+    def _compile_bands(bands: List[Dict[str, Any]]) -> Tuple[List[str], List[float]]:
+        """将按温度从低到高排列的区间编译为分界点列表
+
+        相邻两个区间之间由前一个区间的below（不含）或后一个区间的above（不含）分隔；
+        above的分界点取其后的下一个浮点数，使所有分界点都可以用bisect_right查找。
+        """
+        if not bands:
+            raise ValueError("至少需要一个温度区间")
+        cuts = []
+        for lower, upper in zip(bands, bands[1:]):
+            if "below" in lower:
+                cuts.append(float(lower["below"]))
+            elif "above" in upper:
+                cuts.append(math.nextafter(float(upper["above"]), math.inf))
+            else:
+                raise ValueError(f"温度区间{lower['band']}和{upper['band']}之间缺少分界温度")
+        if cuts != sorted(cuts):
+            raise ValueError("温度区间必须按温度从低到高排列")
+        return [band["band"] for band in bands], cuts
+
+    def _compile_fragments(
+        self, band_fragments: Dict[str, Dict[str, str]]
+    ) -> Tuple[Dict[str, str], Dict[Tuple[str, str], str]]:
+        """将（温度区间，元素）的文本展开为（温度区间，星座）的查找表"""
+        defaults = {}
+        table = {}
+        for band in self.bands:
+            fragments = band_fragments.get(band, {})
+            defaults[band] = fragments.get(ANY_ELEMENT, "")
+            for sign, element in self.sign_element.items():
+                table[(band, sign)] = fragments.get(element, defaults[band])
+        return defaults, table
+
+    def _today_fragment(self, today: str) -> str:
+        """取今日运势中分隔符之后的部分"""
+        return today.split(self.today_separator)[1]
+
+    def _description_fragment(self, description: str) -> str:
+        """按顺序匹配天气描述中的关键词，返回第一个匹配的文本"""
+        for keyword, fragment in self._keywords:
+            if keyword in description:
+                return fragment
+        return ""
+
+    def element(self, sign: str) -> Optional[str]:
+        """获取星座所属的元素"""
+        return self.sign_element.get(sign)
+
+    def temperature_band(self, temperature: float) -> str:
+        """获取温度所在的区间"""
+        return self.bands[bisect_right(self._cuts, temperature)]
+
+    def analyze(self, weather, horoscope) -> str:
+        """生成一条天气与星象的趣味分析"""
+        band = self.temperature_band(weather.temperature)
+        sign = horoscope.sign
+        summary = self.summary.format(
+            city=weather.city,
+            description=weather.description,
+            temperature=weather.temperature,
+            sign=sign,
+            today=self.today_fragment(horoscope.today)
+        )
+        return (
+            summary
+            + self._band_fragments.get((band, sign), self._band_defaults[band])
+            + self.description_fragment(weather.description)
+        )
+
+    def analyze_many(self, pairs: Iterable[Tuple[Any, Any]]) -> List[str]:
+        """批量生成（天气，星象）组合的趣味分析，例如预计算所有城市×星座"""
+        return [self.analyze(weather, horoscope) for weather, horoscope in pairs]
+
+
+# 应用使用的规则引擎，配置了ANALYSIS_RULES_PATH时从该文件加载规则
+analysis_engine = AnalysisRuleEngine.from_file(settings.ANALYSIS_RULES_PATH or DEFAULT_RULES_PATH)
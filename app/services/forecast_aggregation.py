@@ -0,0 +1,71 @@
+from bisect import bisect_left
+from typing import List, Sequence, Tuple
+
+from app.schemas.weather import ForecastDay, WeatherForecast
+
+
+def _day_runs(dates: List[str]) -> List[Tuple[int, int]]:
+    """已排序的日期列中每个日期的区间[start, end)
+
+    区间边界用二分查找得到，不逐条比较相邻的日期。
+    """
+    starts = [bisect_left(dates, date) for date in sorted(set(dates))]
+    return list(zip(starts, starts[1:] + [len(dates)]))
+
+
+def _most_common(values: List[Tuple[str, str]]) -> Tuple[str, str]:
+    """出现次数最多的值，次数相同时取最早出现的"""
+    return max(values, key=values.count)
+
+
+def _aggregate_city(api_response: dict) -> WeatherForecast:
+    """将一个城市的3小时预报按列展开，再按日期区间切片归约"""
+    items = api_response["list"]
+    dates = [item["dt_txt"][:10] for item in items]
+    # 外部API的条目按时间排序，未排序时先按日期稳定排序
+    if dates != sorted(dates):
+        items = sorted(items, key=lambda item: item["dt_txt"][:10])
+        dates = [item["dt_txt"][:10] for item in items]
+
+    mains = [item["main"] for item in items]
+    temp_min = [main["temp_min"] for main in mains]
+    temp_max = [main["temp_max"] for main in mains]
+    temp = [main.get("temp") for main in mains]
+    if None in temp:
+        temp = [
+            (low + high) / 2 if value is None else value
+            for value, low, high in zip(temp, temp_min, temp_max)
+        ]
+    humidity = [main["humidity"] for main in mains]
+    wind = [item["wind"]["speed"] for item in items]
+    weathers = [(item["weather"][0]["description"], item["weather"][0]["icon"]) for item in items]
+
+    forecast_list = []
+    for start, end in _day_runs(dates):
+        count = end - start
+        description, icon = _most_common(weathers[start:end])
+        forecast_list.append(ForecastDay(
+            date=dates[start],
+            temperature_min=min(temp_min[start:end]),
+            temperature_max=max(temp_max[start:end]),
+            temperature_avg=round(sum(temp[start:end]) / count, 2),
+            humidity=round(sum(humidity[start:end]) / count),
+            wind_speed=max(wind[start:end]),
+            description=description,
+            icon=icon
+        ))
+    return WeatherForecast(
+        city=api_response["city"]["name"],
+        country=api_response["city"]["country"],
+        forecast=forecast_list
+    )
+
+
+def aggregate_forecasts(api_responses: Sequence[dict]) -> List[WeatherForecast]:
+    """将一个或多个城市的3小时预报响应聚合为按天的预报
+
+    每个城市的预报条目按列展开（气温、湿度、风速等各一列），日期区间由二分查找得到，
+    每天的极值和均值由内置的min/max/sum对列切片归约，逐条目执行的Python代码只剩列的提取。
+    列按城市构建而不是把所有城市平铺成一列：每列只有几十个条目，多次遍历时数据仍在CPU缓存中。
+    """
+    return [_aggregate_city(api_response) for api_response in api_responses]
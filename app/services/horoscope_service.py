@@ -1,92 +1,159 @@
-import requests
+import asyncio
+import logging
 from datetime import datetime, timedelta
-from typing import Optional, List
+from typing import Callable, Dict, Optional, List, Sequence, Union
 
 from sqlalchemy.orm import Session
 
 from app.models.horoscope import Horoscope
-from app.schemas.horoscope import HoroscopeCreate, HoroscopeUpdate
+from app.schemas.horoscope import HoroscopeCreate, HoroscopeUpdate, HoroscopeInDB
+from app.utils.cache import TTLCache, horoscope_cache
 from app.utils.config import settings
+from app.utils.database import LazySession, get_session_factory, run_db
+from app.utils.metrics import CacheMetrics, track_upstream
+from app.utils.resilience import UpstreamError, horoscope_upstream, request_deadline
+from app.utils.shared_cache import SharedCache
+from app.utils.singleflight import SingleFlight, horoscope_flight
+from app.utils.upsert import upsert
+
+logger = logging.getLogger(__name__)
+
+horoscope_cache_metrics = CacheMetrics("horoscope")
+
+# 所有工作进程共用的星象缓存，未配置CACHE_BACKEND_URL时不生效
+horoscope_shared_cache = SharedCache("horoscope", HoroscopeInDB)
+
+# 十二星座及其日期范围，顺序即所有星座接口返回的顺序
+SIGN_DATE_RANGES: Dict[str, str] = {
+    "白羊座": "3月21日-4月19日",
+    "金牛座": "4月20日-5月20日",
+    "双子座": "5月21日-6月21日",
+    "巨蟹座": "6月22日-7月22日",
+    "狮子座": "7月23日-8月22日",
+    "处女座": "8月23日-9月22日",
+    "天秤座": "9月23日-10月23日",
+    "天蝎座": "10月24日-11月22日",
+    "射手座": "11月23日-12月21日",
+    "摩羯座": "12月22日-1月19日",
+    "水瓶座": "1月20日-2月18日",
+    "双鱼座": "2月19日-3月20日"
+}
+ZODIAC_SIGNS: List[str] = list(SIGN_DATE_RANGES)
+
+# 批量加载/预计算所有星座时在合并器中使用的键，以及预计算时在共享缓存中使用的锁
+ALL_SIGNS_KEY = ("all",)
+ALL_SIGNS_LOCK = "all"
 
 class HoroscopeService:
     """星象服务类，处理星象数据的获取和业务逻辑"""
     
-    def __init__(self, db: Session):
+    def __init__(
+        self,
+        db: Session,
+        cache: Optional[TTLCache] = None,
+        flight: Optional[SingleFlight] = None,
+        session_factory: Optional[Callable] = None
+    ):
         self.db = db
+        self.cache = horoscope_cache if cache is None else cache
+        self.flight = horoscope_flight if flight is None else flight
+        self.shared_cache = horoscope_shared_cache
+        # 后台刷新使用独立的会话，默认取应用的会话工厂
+        self.session_factory = session_factory
         self.api_key = settings.HOROSCOPE_API_KEY
         self.base_url = "https://api.example.com/horoscope"
     
-    def get_horoscope_by_sign(self, sign: str) -> Optional[Horoscope]:
+    async def get_horoscope_by_sign(self, sign: str) -> Optional[Horoscope]:
         """根据星座名称获取星象数据"""
-        return self.db.query(Horoscope).filter(Horoscope.sign == sign).first()
+        return await run_db(
+            self.db, lambda db: db.query(Horoscope).filter(Horoscope.sign == sign).first()
+        )
     
-    def get_all_horoscopes(self) -> List[Horoscope]:
+    async def get_all_horoscopes(self) -> List[Horoscope]:
         """获取所有星座的星象数据"""
-        return self.db.query(Horoscope).all()
+        return await run_db(self.db, lambda db: db.query(Horoscope).all())
     
-    def create_horoscope(self, horoscope_data: HoroscopeCreate) -> Horoscope:
+    async def create_horoscope(self, horoscope_data: HoroscopeCreate) -> Horoscope:
         """创建星象数据"""
-        db_horoscope = Horoscope(**horoscope_data.model_dump())
-        self.db.add(db_horoscope)
-        self.db.commit()
-        self.db.refresh(db_horoscope)
-        return db_horoscope
+        return await self._save_horoscope(horoscope_data)
     
-    def update_horoscope(self, horoscope_id: int, horoscope_data: HoroscopeUpdate) -> Optional[Horoscope]:
+    async def update_horoscope(self, horoscope_id: int, horoscope_data: HoroscopeUpdate) -> Optional[Horoscope]:
         """更新星象数据"""
-        db_horoscope = self.db.query(Horoscope).filter(Horoscope.id == horoscope_id).first()
+        def update(db: Session) -> Optional[Horoscope]:
+            db_horoscope = db.query(Horoscope).filter(Horoscope.id == horoscope_id).first()
+            if db_horoscope:
+                update_data = horoscope_data.model_dump(exclude_unset=True)
+                for field, value in update_data.items():
+                    setattr(db_horoscope, field, value)
+                db.commit()
+                db.refresh(db_horoscope)
+            return db_horoscope
+        
+        db_horoscope = await run_db(self.db, update)
         if db_horoscope:
-            update_data = horoscope_data.model_dump(exclude_unset=True)
-            for field, value in update_data.items():
-                setattr(db_horoscope, field, value)
-            self.db.commit()
-            self.db.refresh(db_horoscope)
+            self.cache.delete(db_horoscope.sign)
+            await self.shared_cache.delete(db_horoscope.sign)
         return db_horoscope
     
-    def delete_horoscope(self, horoscope_id: int) -> bool:
+    async def delete_horoscope(self, horoscope_id: int) -> bool:
         """删除星象数据"""
-        db_horoscope = self.db.query(Horoscope).filter(Horoscope.id == horoscope_id).first()
-        if db_horoscope:
-            self.db.delete(db_horoscope)
-            self.db.commit()
-            return True
-        return False
+        def delete(db: Session) -> Optional[str]:
+            db_horoscope = db.query(Horoscope).filter(Horoscope.id == horoscope_id).first()
+            if not db_horoscope:
+                return None
+            db.delete(db_horoscope)
+            db.commit()
+            return db_horoscope.sign
+        
+        sign = await run_db(self.db, delete)
+        if sign is None:
+            return False
+        self.cache.delete(sign)
+        await self.shared_cache.delete(sign)
+        return True
     
-    def fetch_horoscope_from_api(self, sign: str) -> Optional[dict]:
-        """从外部API获取星象数据"""
+    async def _save_horoscope(self, horoscope_data: HoroscopeCreate) -> Horoscope:
+        """写入星象数据：星座没有记录时新建，否则更新已有记录"""
+        return (await self._save_horoscopes([horoscope_data]))[0]
+    
+    async def _save_horoscopes(self, items: List[HoroscopeCreate]) -> List[Horoscope]:
+        """在一个事务中批量写入多个星座的星象数据，已存在的星座更新，不存在的新建
+
+        按星座upsert，所有星座只需一条语句和一次提交，不需要先查询已有记录或在提交后重新加载；
+        内容与前一天相同时也会更新时间，否则数据会一直被视为过期。
+        """
+        def save(db: Session) -> List[Horoscope]:
+            saved = upsert(db, Horoscope, [item.model_dump() for item in items], key="sign")
+            db.commit()
+            return [saved[item.sign] for item in items]
+        
+        return await run_db(self.db, save)
+    
+    async def fetch_horoscope_from_api(self, sign: str) -> Optional[dict]:
+        """从外部API获取星象数据，失败、超时或上游熔断时返回None"""
         try:
-            # 这里使用模拟数据，实际项目中应该调用真实的星象API
-            mock_data = {
-                "sign": sign,
-                "date_range": self._get_date_range(sign),
-                "today": f"{sign}今日运势：整体运势良好，工作顺利，感情稳定。",
-                "tomorrow": f"{sign}明日运势：运势一般，需要注意人际关系。",
-                "week": f"{sign}本周运势：本周整体运势上升，适合开展新项目。",
-                "month": f"{sign}本月运势：本月运势平稳，财运不错。",
-                "year": f"{sign}本年运势：本年运势起伏较大，需要注意健康。"
-            }
-            return mock_data
-        except Exception as e:
-            print(f"获取星象数据失败: {e}")
+            return await horoscope_upstream.call(lambda: self._request_horoscope(sign))
+        except (UpstreamError, asyncio.TimeoutError) as e:
+            logger.warning("获取星象数据失败: %s: %r", sign, e)
             return None
     
+    @track_upstream("horoscope")
+    async def _request_horoscope(self, sign: str) -> dict:
+        """请求外部API的星象数据"""
+        # 这里使用模拟数据，实际项目中应该调用真实的星象API
+        return {
+            "sign": sign,
+            "date_range": self._get_date_range(sign),
+            "today": f"{sign}今日运势：整体运势良好，工作顺利，感情稳定。",
+            "tomorrow": f"{sign}明日运势：运势一般，需要注意人际关系。",
+            "week": f"{sign}本周运势：本周整体运势上升，适合开展新项目。",
+            "month": f"{sign}本月运势：本月运势平稳，财运不错。",
+            "year": f"{sign}本年运势：本年运势起伏较大，需要注意健康。"
+        }
+    
     def _get_date_range(self, sign: str) -> str:
         """根据星座名称获取日期范围"""
-        date_ranges = {
-            "白羊座": "3月21日-4月19日",
-            "金牛座": "4月20日-5月20日",
-            "双子座": "5月21日-6月21日",
-            "巨蟹座": "6月22日-7月22日",
-            "狮子座": "7月23日-8月22日",
-            "处女座": "8月23日-9月22日",
-            "天秤座": "9月23日-10月23日",
-            "天蝎座": "10月24日-11月22日",
-            "射手座": "11月23日-12月21日",
-            "摩羯座": "12月22日-1月19日",
-            "水瓶座": "1月20日-2月18日",
-            "双鱼座": "2月19日-3月20日"
-        }
-        return date_ranges.get(sign, "")
+        return SIGN_DATE_RANGES.get(sign, "")
     
     def parse_horoscope_api_response(self, api_response: dict) -> HoroscopeCreate:
         """解析外部API的星象数据响应"""
@@ -100,27 +167,222 @@ class HoroscopeService:
             year=api_response["year"]
         )
     
-    def get_or_fetch_horoscope(self, sign: str) -> Optional[Horoscope]:
-        """获取星象数据，如果数据库中没有则从API获取"""
-        # 先从数据库获取
-        horoscope = self.get_horoscope_by_sign(sign)
-        settings = Settings()
-        # 如果数据库中没有，或者数据超过1天，则从API获取
-        if not horoscope or (
-            datetime.utcnow() - horoscope.updated_at.replace(tzinfo=None) > timedelta(days=settings.HOROSCOPE_CACHE_TTL_DAYS)
-        ):
-            api_data = self.fetch_horoscope_from_api(sign)
-            if api_data:
-                horoscope_data = self.parse_horoscope_api_response(api_data)
-                if horoscope:
-                    # 更新现有数据
-                    update_data = horoscope_data.model_dump(exclude_unset=True)
-                    for field, value in update_data.items():
-                        setattr(horoscope, field, value)
-                    self.db.commit()
-                    self.db.refresh(horoscope)
-                else:
-                    # 创建新数据
-                    horoscope = self.create_horoscope(horoscope_data)
+    def _get_age(self, horoscope) -> timedelta:
+        """计算星象数据距上次更新的时长"""
+        last_updated = horoscope.updated_at or horoscope.created_at
+        if last_updated is None:
+            return timedelta.max
+        return datetime.utcnow() - last_updated.replace(tzinfo=None)
+    
+    def _should_update(self, horoscope) -> bool:
+        """判断星象数据是否超过缓存时长，需要重新获取"""
+        return self._get_age(horoscope) > timedelta(days=settings.HOROSCOPE_CACHE_TTL_DAYS)
+    
+    def _max_stale_age(self) -> timedelta:
+        """数据可以先返回、再在后台刷新的最大时长"""
+        return timedelta(
+            days=settings.HOROSCOPE_CACHE_TTL_DAYS, hours=settings.HOROSCOPE_STALE_WINDOW_HOURS
+        )
+    
+    def _is_expired(self, horoscope) -> bool:
+        """判断星象数据是否已超出可以先返回旧数据的时间窗口，必须等待刷新"""
+        return self._get_age(horoscope) > self._max_stale_age()
+    
+    async def get_or_fetch_horoscope(self, sign: str) -> Optional[HoroscopeInDB]:
+        """获取星象数据，依次查询进程内缓存、数据库，都没有可用数据时从API获取
+
+        数据过期但仍在HOROSCOPE_STALE_WINDOW_HOURS窗口内时直接返回旧数据，
+        同时在后台刷新。
+        """
+        # 先从进程内缓存获取
+        horoscope = self.cache.get(sign)
+        if horoscope is None:
+            horoscope_cache_metrics.miss.inc()
+            # 缓存未命中时，同一星座的并发请求只执行一次查询和更新
+            horoscope = await self.flight.do(sign, lambda: self._load_horoscope(sign))
+        else:
+            horoscope_cache_metrics.hit.inc()
         
+        if horoscope is not None and self._should_update(horoscope):
+            horoscope_cache_metrics.stale.inc()
+            self._schedule_refresh(sign)
         return horoscope
+    
+    def _schedule_refresh(self, sign: str) -> None:
+        """在后台刷新星象数据，同一星座同时只有一个刷新任务"""
+        if not self.flight.in_flight(sign):
+            self.flight.spawn(sign, lambda: self._refresh_in_background(sign))
+    
+    async def _refresh_in_background(self, sign: str) -> Optional[HoroscopeInDB]:
+        """使用独立的数据库会话刷新星象数据，请求结束后会话仍然可用"""
+        db = LazySession(self.session_factory or get_session_factory())
+        try:
+            service = HoroscopeService(db, cache=self.cache, flight=self.flight)
+            # 后台刷新不受触发它的请求的时间预算限制
+            with request_deadline(None):
+                return await service._load_horoscope(sign, refresh=True)
+        except Exception:
+            logger.exception("后台刷新星象数据失败: %s", sign)
+            return None
+        finally:
+            await db.close()
+    
+    async def _load_horoscope(self, sign: str, refresh: bool = False) -> Optional[HoroscopeInDB]:
+        """依次从共享缓存、数据库加载星象数据，需要时从API获取并写回数据库和缓存
+
+        refresh为False时只有数据不存在或超出旧数据窗口才请求API；
+        为True时（后台刷新）只要数据超过缓存时长就请求API。
+        """
+        def needs_fetch(horoscope: Optional[Union[Horoscope, HoroscopeInDB]]) -> bool:
+            return not horoscope or (
+                self._should_update(horoscope) if refresh else self._is_expired(horoscope)
+            )
+        
+        # 其他进程已加载到共享缓存的数据可用时不访问数据库
+        shared = await self.shared_cache.get(sign)
+        if not needs_fetch(shared):
+            return self._cache_horoscope(shared)
+        
+        horoscope = await self.get_horoscope_by_sign(sign)
+        if not needs_fetch(horoscope):
+            snapshot = self._cache_horoscope(horoscope)
+            await self._share_horoscopes([snapshot])
+            return snapshot
+        
+        fetched = await self._fetch_horoscope(sign)
+        if fetched is not None:
+            return fetched
+        if not horoscope:
+            return None
+        return self._cache_horoscope(horoscope)
+    
+    async def _fetch_horoscope(self, sign: str) -> Optional[HoroscopeInDB]:
+        """从API获取星象数据并写回数据库和缓存，失败时返回None；所有进程中同一星座同时只有一个请求"""
+        async with self.shared_cache.fetch_lock(sign) as owner:
+            if not owner:
+                shared = await self.shared_cache.wait_for(
+                    [sign], lambda horoscope: not self._should_update(horoscope)
+                )
+                if sign in shared:
+                    return self._cache_horoscope(shared[sign])
+            
+            api_data = await self.fetch_horoscope_from_api(sign)
+            if not api_data:
+                return None
+            # 新建或更新已有数据
+            horoscope = await self._save_horoscope(self.parse_horoscope_api_response(api_data))
+            snapshot = self._cache_horoscope(horoscope)
+            await self._share_horoscopes([snapshot])
+            return snapshot
+    
+    def _cache_horoscope(self, horoscope: Union[Horoscope, HoroscopeInDB]) -> HoroscopeInDB:
+        """生成与会话无关的星象数据快照并写入进程内缓存"""
+        # 缓存剩余的有效时长（含旧数据窗口），完全过期的数据不写入缓存
+        snapshot = HoroscopeInDB.model_validate(horoscope, from_attributes=True)
+        remaining = self._max_stale_age() - self._get_age(snapshot)
+        if remaining > timedelta(0):
+            self.cache.set(snapshot.sign, snapshot, ttl=remaining.total_seconds())
+        return snapshot
+    
+    async def _share_horoscopes(self, snapshots: Sequence[HoroscopeInDB]) -> None:
+        """用一次往返将星象数据快照写入共享缓存，TTL与进程内缓存相同"""
+        max_age = self._max_stale_age()
+        await self.shared_cache.set_many([
+            (snapshot.sign, snapshot, (max_age - self._get_age(snapshot)).total_seconds())
+            for snapshot in snapshots
+        ])
+    
+    async def precompute_daily_horoscopes(self) -> List[HoroscopeInDB]:
+        """获取所有星座当天的星象数据，在一个事务中写入数据库并更新缓存
+
+        所有进程中同时只有一个预计算，其余进程等待它写入共享缓存的结果。
+        """
+        async with self.shared_cache.fetch_lock(ALL_SIGNS_LOCK) as owner:
+            if not owner:
+                shared = await self.shared_cache.wait_for(
+                    ZODIAC_SIGNS, lambda horoscope: not self._should_update(horoscope)
+                )
+                if len(shared) == len(ZODIAC_SIGNS):
+                    return [self._cache_horoscope(shared[sign]) for sign in ZODIAC_SIGNS]
+            
+            api_results = await asyncio.gather(
+                *(self.fetch_horoscope_from_api(sign) for sign in ZODIAC_SIGNS)
+            )
+            items = [self.parse_horoscope_api_response(result) for result in api_results if result]
+            if not items:
+                return []
+            horoscopes = await self._save_horoscopes(items)
+            snapshots = [self._cache_horoscope(horoscope) for horoscope in horoscopes]
+            await self._share_horoscopes(snapshots)
+            return snapshots
+    
+    async def get_all_today_horoscopes(self) -> List[HoroscopeInDB]:
+        """获取所有星座的星象数据
+
+        所有星座都在进程内缓存中时不访问数据库；否则用一次查询加载全部星座，
+        数据缺失或超出旧数据窗口时才同步执行预计算。
+        """
+        cached = [self.cache.get(sign) for sign in ZODIAC_SIGNS]
+        if all(horoscope is not None for horoscope in cached):
+            horoscope_cache_metrics.hit.inc()
+            if any(self._should_update(horoscope) for horoscope in cached):
+                horoscope_cache_metrics.stale.inc()
+                self._schedule_precompute()
+            return cached
+        horoscope_cache_metrics.miss.inc()
+        return await self.flight.do(ALL_SIGNS_KEY, self._load_all_horoscopes)
+    
+    async def _load_all_horoscopes(self) -> List[HoroscopeInDB]:
+        """用一次往返从共享缓存、或用一次查询从数据库加载所有星座，需要时执行预计算"""
+        by_sign = await self.shared_cache.get_many(ZODIAC_SIGNS)
+        from_shared = self._is_complete(by_sign)
+        if not from_shared:
+            horoscopes = await run_db(
+                self.db,
+                lambda db: db.query(Horoscope).filter(Horoscope.sign.in_(ZODIAC_SIGNS)).all()
+            )
+            by_sign = {horoscope.sign: horoscope for horoscope in horoscopes}
+            if not self._is_complete(by_sign):
+                return await self.precompute_daily_horoscopes()
+        
+        snapshots = [self._cache_horoscope(by_sign[sign]) for sign in ZODIAC_SIGNS]
+        if not from_shared:
+            await self._share_horoscopes(snapshots)
+        if any(self._should_update(snapshot) for snapshot in snapshots):
+            horoscope_cache_metrics.stale.inc()
+            self._schedule_precompute()
+        return snapshots
+    
+    def _is_complete(self, by_sign: Dict[str, Union[Horoscope, HoroscopeInDB]]) -> bool:
+        """所有星座都有数据，且都没有超出旧数据窗口"""
+        return len(by_sign) == len(ZODIAC_SIGNS) and not any(
+            self._is_expired(horoscope) for horoscope in by_sign.values()
+        )
+    
+    def _schedule_precompute(self) -> None:
+        """在后台预计算所有星座的星象数据，同时只有一个预计算任务"""
+        if not self.flight.in_flight(ALL_SIGNS_KEY):
+            self.flight.spawn(ALL_SIGNS_KEY, self._precompute_in_background)
+    
+    async def _precompute_in_background(self) -> List[HoroscopeInDB]:
+        """使用独立的数据库会话预计算所有星座的星象数据"""
+        db = LazySession(self.session_factory or get_session_factory())
+        try:
+            service = HoroscopeService(db, cache=self.cache, flight=self.flight)
+            with request_deadline(None):
+                return await service.precompute_daily_horoscopes()
+        except Exception:
+            logger.exception("后台预计算星象数据失败")
+            return []
+        finally:
+            await db.close()
+
+
+async def precompute_daily_horoscopes() -> int:
+    """预计算所有星座当天的星象数据，返回写入的星座数"""
+    db = LazySession(get_session_factory())
+    try:
+        return len(await HoroscopeService(db).precompute_daily_horoscopes())
+    finally:
+        await db.close()
+
@@ -0,0 +1,69 @@
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Type
+
+from sqlalchemy.orm import Session
+
+from app.models.weather import WeatherObservation
+from app.models.weather_rollup import WeatherRollupMixin, WeatherRollupHourly, WeatherRollupDaily
+from app.utils.upsert import accumulate
+
+# 聚合粒度 -> (聚合模型, 计算时间桶起点的函数)
+ROLLUP_RESOLUTIONS = {
+    "hour": (WeatherRollupHourly, lambda at: at.replace(minute=0, second=0, microsecond=0)),
+    "day": (WeatherRollupDaily, lambda at: at.replace(hour=0, minute=0, second=0, microsecond=0)),
+}
+
+# 聚合记录的唯一键，以及累加时相加、取较小值、取较大值的列
+ROLLUP_KEYS = ("city", "bucket_start")
+ROLLUP_SUMS = ("sample_count", "temperature_sum", "humidity_sum", "wind_speed_sum")
+ROLLUP_MINIMUMS = ("temperature_min", "humidity_min")
+ROLLUP_MAXIMUMS = ("temperature_max", "humidity_max", "wind_speed_max")
+
+
+def apply_observations(db: Session, observations: Iterable[WeatherObservation]) -> None:
+    """将新的观测记录累计到小时和天聚合中
+
+    在调用方的事务中执行，不单独提交；每种粒度只执行一条INSERT ... ON CONFLICT DO UPDATE，
+    计数和合计在数据库中累加、极值取较小/较大值，多个进程同时写入同一个时间桶时不会冲突或丢失观测。
+    """
+    rows: Dict[Type[WeatherRollupMixin], List[Dict[str, Any]]] = {}
+    for observation in observations:
+        observed_at = observation.observed_at.replace(tzinfo=None)
+        for model, bucket_of in ROLLUP_RESOLUTIONS.values():
+            rows.setdefault(model, []).append({
+                "city": observation.city,
+                "bucket_start": bucket_of(observed_at),
+                "sample_count": 1,
+                "temperature_sum": observation.temperature,
+                "temperature_min": observation.temperature,
+                "temperature_max": observation.temperature,
+                "humidity_sum": observation.humidity,
+                "humidity_min": observation.humidity,
+                "humidity_max": observation.humidity,
+                "wind_speed_sum": observation.wind_speed,
+                "wind_speed_max": observation.wind_speed,
+            })
+    for model, model_rows in rows.items():
+        accumulate(db, model, model_rows, keys=ROLLUP_KEYS, sums=ROLLUP_SUMS,
+                   minimums=ROLLUP_MINIMUMS, maximums=ROLLUP_MAXIMUMS)
+
+
+def query_rollups(
+    db: Session,
+    city: str,
+    resolution: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = 1000
+) -> List[WeatherRollupMixin]:
+    """查询城市在时间范围内的聚合数据，按时间桶升序；未指定起始时间时返回最近的limit条"""
+    model, _ = ROLLUP_RESOLUTIONS[resolution]
+    query = db.query(model).filter(model.city == city)
+    if start is not None:
+        query = query.filter(model.bucket_start >= start)
+    if end is not None:
+        query = query.filter(model.bucket_start < end)
+    if start is None:
+        rows = query.order_by(model.bucket_start.desc()).limit(limit).all()
+        return rows[::-1]
+    return query.order_by(model.bucket_start).limit(limit).all()
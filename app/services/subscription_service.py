@@ -0,0 +1,127 @@
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.schemas.horoscope import HoroscopeResponse
+from app.schemas.weather import WeatherResponse
+from app.services.horoscope_service import HoroscopeService, SIGN_DATE_RANGES
+from app.services.weather_service import WeatherService
+from app.utils.config import settings
+from app.utils.database import LazySession, get_session_factory
+from app.utils.subscriptions import Subscription, SubscriptionHub, Topic
+
+# 订阅的主题类型，以及事件中标识主题的字段名
+WEATHER = "weather"
+HOROSCOPE = "horoscope"
+TOPIC_KEYS: Dict[str, str] = {WEATHER: "city", HOROSCOPE: "sign"}
+
+
+def weather_state(weather: Any) -> Dict[str, Any]:
+    """推送给订阅者的天气数据，字段与获取城市天气接口的响应相同"""
+    return WeatherResponse.model_validate(weather, from_attributes=True).model_dump(mode="json")
+
+
+def horoscope_state(horoscope: Any) -> Dict[str, Any]:
+    """推送给订阅者的星象数据，字段与获取星座完整运势接口的响应相同"""
+    return HoroscopeResponse.model_validate(horoscope, from_attributes=True).model_dump(mode="json")
+
+
+def format_event(topic: Topic, changes: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    """生成推送的事件：（事件名称，内容），如("weather", {"city": "Beijing", "changes": {...}})"""
+    kind, name = topic
+    return kind, {TOPIC_KEYS[kind]: name, "changes": changes}
+
+
+class SubscriptionService:
+    """推送订阅服务类，解析订阅的城市和星座、加载初始数据，并检查被订阅数据的变化"""
+
+    def __init__(self, db: Session, hub: Optional[SubscriptionHub] = None):
+        self.db = db
+        self.hub = update_hub if hub is None else hub
+        self.weather_service = WeatherService(db)
+        self.horoscope_service = HoroscopeService(db)
+
+    async def subscribe(
+        self, subscription: Subscription, cities: Sequence[str], signs: Sequence[str]
+    ) -> Dict[str, Any]:
+        """订阅城市和星座，返回订阅结果
+
+        城市名称解析为规范城市名称后订阅，同一城市的不同写法只订阅一次；
+        还没有订阅者的城市和星座加载一次数据并发布，新订阅者随后收到完整数据。
+        返回{"cities": 城市 -> 规范城市名称, "signs": 星座列表, "errors": 城市或星座 -> 错误信息}。
+        """
+        errors = {sign: f"未知的星座 {sign}" for sign in signs if sign not in SIGN_DATE_RANGES}
+        signs = [sign for sign in dict.fromkeys(signs) if sign in SIGN_DATE_RANGES]
+        canonical = await self.weather_service.resolve_cities(
+            list(dict.fromkeys(cities)), self.weather_service.cache
+        ) if cities else {}
+
+        topics = [(WEATHER, city) for city in dict.fromkeys(canonical.values())]
+        topics += [(HOROSCOPE, sign) for sign in signs]
+        self.hub.subscribe(subscription, topics)
+
+        missing = [topic for topic in topics if not self.hub.has_state(topic)]
+        await self._publish(missing)
+        # 没有数据的城市（如城市不存在或外部API不可用）不保留订阅
+        failed = {topic for topic in missing if not self.hub.has_state(topic)}
+        self.hub.unsubscribe(subscription, failed)
+        for city, key in canonical.items():
+            if (WEATHER, key) in failed:
+                errors[city] = f"未找到城市 {city} 的天气数据"
+        return {
+            "cities": {city: key for city, key in canonical.items() if (WEATHER, key) not in failed},
+            "signs": [sign for sign in signs if (HOROSCOPE, sign) not in failed],
+            "errors": errors,
+        }
+
+    async def unsubscribe(self, subscription: Subscription, cities: Sequence[str], signs: Sequence[str]) -> None:
+        """取消订阅城市和星座"""
+        canonical = await self.weather_service.resolve_cities(
+            list(dict.fromkeys(cities)), self.weather_service.cache
+        ) if cities else {}
+        topics = [(WEATHER, city) for city in canonical.values()] + [(HOROSCOPE, sign) for sign in signs]
+        self.hub.unsubscribe(subscription, topics)
+
+    async def refresh(self) -> int:
+        """检查所有被订阅的城市和星座，将变化推送给订阅者，返回有变化的主题数"""
+        topics = [(WEATHER, city) for city in self.hub.topics(WEATHER)]
+        topics += [(HOROSCOPE, sign) for sign in self.hub.topics(HOROSCOPE)]
+        return await self._publish(topics)
+
+    async def _publish(self, topics: List[Topic]) -> int:
+        """获取主题的最新数据并发布，返回有变化的主题数
+
+        城市按WEATHER_BATCH_MAX_CITIES分批批量获取（先查缓存，过期的城市以批量优先级请求外部API），
+        星座用一次查询获取全部。
+        """
+        changed = 0
+        cities = [name for kind, name in topics if kind == WEATHER]
+        for start in range(0, len(cities), settings.WEATHER_BATCH_MAX_CITIES):
+            results, _ = await self.weather_service.get_or_fetch_weather_batch(
+                cities[start:start + settings.WEATHER_BATCH_MAX_CITIES]
+            )
+            for city, weather in results.items():
+                changed += bool(self.hub.publish((WEATHER, city), weather_state(weather)))
+
+        signs = {name for kind, name in topics if kind == HOROSCOPE}
+        if signs:
+            for horoscope in await self.horoscope_service.get_all_today_horoscopes():
+                if horoscope.sign in signs:
+                    changed += bool(self.hub.publish((HOROSCOPE, horoscope.sign), horoscope_state(horoscope)))
+        return changed
+
+
+async def refresh_subscriptions() -> int:
+    """检查被订阅的数据并推送变化，由后台任务按SUBSCRIPTION_REFRESH_INTERVAL_SECONDS定期执行"""
+    if not update_hub:
+        return 0
+    db = LazySession(get_session_factory())
+    try:
+        return await SubscriptionService(db).refresh()
+    finally:
+        await db.close()
+
+
+# 进程内的订阅中心，所有推送连接共用
+update_hub = SubscriptionHub(settings.SUBSCRIPTION_MAX_CONNECTIONS)
+update_hub.export_metrics(TOPIC_KEYS)
@@ -1,87 +1,316 @@
-import requests
+import asyncio
+import logging
+import httpx
 from datetime import datetime, timedelta
-from typing import Optional, List
+from typing import Callable, Dict, Iterable, Optional, List, Sequence, Tuple, Union
 
 from sqlalchemy.orm import Session
 
-from app.models.weather import Weather
-from app.schemas.weather import WeatherCreate, WeatherUpdate, ForecastDay, WeatherForecast
+from app.models.weather import CityAlias, Weather, WeatherForecastCache, WeatherObservation
+from app.schemas.weather import WeatherCreate, WeatherUpdate, WeatherInDB, WeatherForecast
+from app.services.forecast_aggregation import aggregate_forecasts
+from app.services.rollup_service import apply_observations, query_rollups
+from app.utils.cache import TTLCache, city_alias_cache, weather_cache, forecast_cache
 from app.utils.config import settings
+from app.utils.database import LazySession, get_session_factory, run_db
+from app.utils.http_client import get_http_client
+from app.utils.metrics import CacheMetrics, upstream_request
+from app.utils.refresh_ahead import RefreshAheadScheduler
+from app.utils.resilience import UpstreamError, forecast_upstream, request_deadline, weather_upstream
+from app.utils.shared_cache import SharedCache
+from app.utils.singleflight import SingleFlight, weather_flight, forecast_flight
+from app.utils.upsert import upsert
+from app.utils.upstream_quota import Priority, upstream_priority
+
+logger = logging.getLogger(__name__)
+
+weather_cache_metrics = CacheMetrics("weather")
+forecast_cache_metrics = CacheMetrics("forecast")
+city_alias_metrics = CacheMetrics("city_alias")
+
+# 所有工作进程共用的天气与天气预报缓存，未配置CACHE_BACKEND_URL时不生效
+weather_shared_cache = SharedCache("weather", WeatherInDB)
+forecast_shared_cache = SharedCache("forecast", WeatherForecast)
 
 
 class WeatherService:
     """天气服务类，处理天气数据的获取和业务逻辑"""
     
-    def __init__(self, db: Session):
+    def __init__(
+        self,
+        db: Session,
+        cache: Optional[TTLCache] = None,
+        flight: Optional[SingleFlight] = None,
+        http_client: Optional[httpx.AsyncClient] = None,
+        session_factory: Optional[Callable] = None,
+        refresh_scheduler: Optional[RefreshAheadScheduler] = None
+    ):
         self.db = db
+        self.cache = weather_cache if cache is None else cache
+        self.flight = weather_flight if flight is None else flight
+        self.forecast_cache = forecast_cache
+        self.forecast_flight = forecast_flight
+        self.shared_cache = weather_shared_cache
+        self.forecast_shared_cache = forecast_shared_cache
+        self.alias_cache = city_alias_cache
+        self._http_client = http_client
+        # 后台刷新使用独立的会话，默认取应用的会话工厂
+        self.session_factory = session_factory
+        self.refresh_scheduler = (
+            weather_refresh_scheduler if refresh_scheduler is None else refresh_scheduler
+        )
         self.api_key = settings.WEATHER_API_KEY
-        self.base_url = "https://api.openweathermap.org/data/2.5"
-    
-    def get_weather_by_city(self, city: str) -> Optional[Weather]:
-        """根据城市名称获取天气数据"""
-        return self.db.query(Weather).filter(Weather.city == city).first()
-    
-    def create_weather(self, weather_data: WeatherCreate) -> Weather:
-        """创建天气数据"""
-        db_weather = Weather(**weather_data.model_dump())
-        self.db.add(db_weather)
-        self.db.commit()
-        self.db.refresh(db_weather)
+        self.base_url = settings.WEATHER_API_BASE_URL
+    
+    @staticmethod
+    def normalize_city(city: str) -> str:
+        """规范化用户输入的城市名称（合并空白、忽略大小写），作为别名使用"""
+        return " ".join(city.split()).casefold()
+    
+    async def resolve_cities(self, cities: Sequence[str], cache: Optional[TTLCache] = None) -> Dict[str, str]:
+        """将用户输入的城市名称解析为规范城市名称，返回输入 -> 规范城市名称
+
+        输入本身就是cache中的键（规范城市名称）时直接使用，缓存命中的请求不访问数据库；
+        其余的先查进程内的别名缓存，未命中的别名用一次IN查询从别名表获取；
+        还没有从外部API学到的别名按去掉多余空白后的输入处理。
+        """
+        resolved: Dict[str, str] = {}
+        unknown: Dict[str, List[str]] = {}
+        for city in cities:
+            name = " ".join(city.split())
+            if cache is not None and name in cache:
+                resolved[city] = name
+                continue
+            alias = self.normalize_city(city)
+            canonical = self.alias_cache.get(alias)
+            if canonical is None:
+                unknown.setdefault(alias, []).append(city)
+            else:
+                city_alias_metrics.hit.inc()
+                resolved[city] = canonical
+        if not unknown:
+            return resolved
+        
+        rows = await run_db(
+            self.db,
+            lambda db: dict(
+                db.query(CityAlias.alias, CityAlias.city).filter(CityAlias.alias.in_(list(unknown))).all()
+            )
+        )
+        for alias, inputs in unknown.items():
+            canonical = rows.get(alias)
+            if canonical is not None:
+                city_alias_metrics.hit.inc()
+                self.alias_cache.set(alias, canonical)
+            else:
+                city_alias_metrics.miss.inc()
+                canonical = " ".join(inputs[0].split())
+                self.alias_cache.set(alias, canonical, ttl=settings.CITY_ALIAS_MISS_TTL_SECONDS)
+            for city in inputs:
+                resolved[city] = canonical
+        return resolved
+    
+    async def resolve_city(self, city: str, cache: Optional[TTLCache] = None) -> str:
+        """将用户输入的城市名称解析为规范城市名称"""
+        return (await self.resolve_cities([city], cache))[city]
+    
+    @staticmethod
+    def _record_aliases(db: Session, aliases: Dict[str, str]) -> None:
+        """在调用方的事务中写入别名 -> 规范城市名称，已有的别名指向新的城市名称"""
+        rows = [{"alias": alias, "city": city} for alias, city in aliases.items()]
+        upsert(db, CityAlias, rows, key="alias", touch=None)
+    
+    def _aliases_for(self, city: str, names: Iterable[str]) -> Dict[str, str]:
+        """外部API返回规范城市名称city时，请求使用的名称names及city本身都是它的别名"""
+        return {self.normalize_city(name): city for name in (*names, city)}
+    
+    def _cache_aliases(self, aliases: Dict[str, str]) -> None:
+        """别名写入数据库后更新进程内缓存"""
+        for alias, city in aliases.items():
+            self.alias_cache.set(alias, city)
+    
+    async def get_weather_by_city(self, city: str) -> Optional[Weather]:
+        """根据规范城市名称获取天气数据"""
+        return await run_db(
+            self.db, lambda db: db.query(Weather).filter(Weather.city == city).first()
+        )
+    
+    async def get_weathers_by_cities(self, cities: Sequence[str]) -> Dict[str, Weather]:
+        """用一次IN查询获取多个城市的天气数据，返回规范城市名称到数据的映射"""
+        rows = await run_db(
+            self.db, lambda db: db.query(Weather).filter(Weather.city.in_(list(cities))).all()
+        )
+        weathers = {}
+        for row in rows:
+            weathers.setdefault(row.city, row)
+        return weathers
+    
+    async def get_weather_history(
+        self,
+        city: str,
+        limit: int = 10,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None
+    ) -> List[WeatherObservation]:
+        """根据城市名称获取天气观测记录，可按观测时间范围过滤，按观测时间倒序"""
+        city = await self.resolve_city(city)
+        
+        def query(db: Session) -> List[WeatherObservation]:
+            q = db.query(WeatherObservation).filter(WeatherObservation.city == city)
+            if start is not None:
+                q = q.filter(WeatherObservation.observed_at >= start)
+            if end is not None:
+                q = q.filter(WeatherObservation.observed_at < end)
+            return q.order_by(WeatherObservation.observed_at.desc()).limit(limit).all()
+        
+        return await run_db(self.db, query)
+    
+    async def get_weather_rollups(
+        self,
+        city: str,
+        resolution: str,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None
+    ) -> list:
+        """获取城市按小时（hour）或按天（day）聚合的历史天气数据"""
+        city = await self.resolve_city(city)
+        return await run_db(
+            self.db,
+            lambda db: query_rollups(
+                db, city, resolution, start, end, limit=settings.WEATHER_ROLLUP_MAX_POINTS
+            )
+        )
+    
+    async def prune_observations(self, before: datetime, batch_size: int) -> int:
+        """分批删除观测时间早于before的观测记录，每批单独提交，返回删除的总数"""
+        def delete_batch(db: Session) -> int:
+            ids = [
+                row.id for row in db.query(WeatherObservation.id).filter(
+                    WeatherObservation.observed_at < before
+                ).limit(batch_size)
+            ]
+            if ids:
+                db.query(WeatherObservation).filter(
+                    WeatherObservation.id.in_(ids)
+                ).delete(synchronize_session=False)
+                db.commit()
+            return len(ids)
+        
+        total = 0
+        while True:
+            deleted = await run_db(self.db, delete_batch)
+            total += deleted
+            if deleted < batch_size:
+                return total
+    
+    async def create_weather(self, weather_data: WeatherCreate) -> Weather:
+        """创建天气数据，城市已有记录时更新该记录"""
+        db_weather = await self._save_weather(weather_data)
+        self.cache.delete(db_weather.city)
+        await self.shared_cache.delete(db_weather.city)
         return db_weather
     
-    def update_weather(self, weather_id: int, weather_data: WeatherUpdate) -> Optional[Weather]:
+    async def update_weather(self, weather_id: int, weather_data: WeatherUpdate) -> Optional[Weather]:
         """更新天气数据"""
-        db_weather = self.db.query(Weather).filter(Weather.id == weather_id).first()
+        def update(db: Session) -> Optional[Weather]:
+            db_weather = db.query(Weather).filter(Weather.id == weather_id).first()
+            if db_weather:
+                update_data = weather_data.model_dump(exclude_unset=True)
+                for field, value in update_data.items():
+                    setattr(db_weather, field, value)
+                db.commit()
+                db.refresh(db_weather)
+            return db_weather
+        
+        db_weather = await run_db(self.db, update)
         if db_weather:
-            update_data = weather_data.model_dump(exclude_unset=True)
-            for field, value in update_data.items():
-                setattr(db_weather, field, value)
-            self.db.commit()
-            self.db.refresh(db_weather)
+            self.cache.delete(db_weather.city)
+            await self.shared_cache.delete(db_weather.city)
         return db_weather
     
-    def delete_weather(self, weather_id: int) -> bool:
+    async def delete_weather(self, weather_id: int) -> bool:
         """删除天气数据"""
-        db_weather = self.db.query(Weather).filter(Weather.id == weather_id).first()
-        if db_weather:
-            self.db.delete(db_weather)
-            self.db.commit()
-            return True
-        return False
+        def delete(db: Session) -> Optional[str]:
+            db_weather = db.query(Weather).filter(Weather.id == weather_id).first()
+            if not db_weather:
+                return None
+            db.delete(db_weather)
+            db.commit()
+            return db_weather.city
+        
+        city = await run_db(self.db, delete)
+        if city is None:
+            return False
+        self.cache.delete(city)
+        await self.shared_cache.delete(city)
+        return True
+    
+    @staticmethod
+    def _make_observation(weather_data: WeatherCreate) -> WeatherObservation:
+        """根据获取到的天气数据生成一条观测记录"""
+        return WeatherObservation(**weather_data.model_dump(), observed_at=datetime.utcnow())
     
-    def fetch_weather_from_api(self, city: str) -> Optional[dict]:
-        """从外部API获取天气数据"""
+    async def _save_weather(self, weather_data: WeatherCreate, aliases: Optional[Dict[str, str]] = None) -> Weather:
+        """写入天气数据：规范城市名称没有记录时新建，否则更新已有记录，同时写入别名"""
+        return (await self._save_weathers([weather_data], aliases))[0]
+    
+    async def _save_weathers(
+        self, items: List[WeatherCreate], aliases: Optional[Dict[str, str]] = None
+    ) -> List[Weather]:
+        """在同一个事务中批量写入天气数据、观测记录和别名
+
+        天气数据按城市名称upsert，所有城市只需一条语句，不需要先查询已有记录或在提交后重新加载；
+        返回的记录与items一一对应，同一城市的多项对应同一条记录。
+        """
+        def save_all(db: Session) -> List[Weather]:
+            saved = upsert(db, Weather, [item.model_dump() for item in items], key="city")
+            # 同一事务中追加观测记录并更新聚合数据
+            observations = [self._make_observation(item) for item in items]
+            db.add_all(observations)
+            apply_observations(db, observations)
+            if aliases:
+                self._record_aliases(db, aliases)
+            db.commit()
+            return [saved[item.city] for item in items]
+        
+        saved = await run_db(self.db, save_all)
+        if aliases:
+            self._cache_aliases(aliases)
+        return saved
+    
+    @property
+    def http_client(self) -> httpx.AsyncClient:
+        """上游HTTP客户端，默认使用应用共享的连接池"""
+        return self._http_client or get_http_client()
+    
+    async def fetch_weather_from_api(self, city: str) -> Optional[dict]:
+        """从外部API获取天气数据，失败、超时或上游熔断时返回None"""
         try:
-            url = f"{self.base_url}/weather"
-            params = {
-                "q": city,
-                "appid": self.api_key,
-                "units": "metric",  # 使用摄氏度
-                "lang": "zh_cn"  # 使用中文
-            }
-            response = requests.get(url, params=params)
-            response.raise_for_status()
-            return response.json()
-        except requests.RequestException as e:
-            print(f"获取天气数据失败: {e}")
+            return await weather_upstream.call(lambda: self._get_json("weather", city))
+        except (httpx.HTTPError, UpstreamError, asyncio.TimeoutError) as e:
+            logger.warning("获取天气数据失败: %s: %r", city, e)
             return None
     
-    def fetch_forecast_from_api(self, city: str) -> Optional[dict]:
-        """从外部API获取天气预报数据"""
+    async def fetch_forecast_from_api(self, city: str) -> Optional[dict]:
+        """从外部API获取天气预报数据，失败、超时或上游熔断时返回None"""
         try:
-            url = f"{self.base_url}/forecast"
-            params = {
-                "q": city,
-                "appid": self.api_key,
-                "units": "metric",  # 使用摄氏度
-                "lang": "zh_cn"  # 使用中文
-            }
-            response = requests.get(url, params=params)
+            return await forecast_upstream.call(lambda: self._get_json("forecast", city))
+        except (httpx.HTTPError, UpstreamError, asyncio.TimeoutError) as e:
+            logger.warning("获取天气预报数据失败: %s: %r", city, e)
+            return None
+    
+    async def _get_json(self, endpoint: str, city: str) -> dict:
+        """请求外部API的某个接口，返回解析后的JSON；每次实际发出的请求按接口名记录次数和耗时"""
+        params = {
+            "q": city,
+            "appid": self.api_key,
+            "units": "metric",  # 使用摄氏度
+            "lang": "zh_cn"  # 使用中文
+        }
+        with upstream_request(endpoint):
+            response = await self.http_client.get(f"{self.base_url}/{endpoint}", params=params)
             response.raise_for_status()
             return response.json()
-        except requests.RequestException as e:
-            print(f"获取天气预报数据失败: {e}")
-            return None
     
     def parse_weather_api_response(self, api_response: dict) -> WeatherCreate:
         """解析外部API的天气数据响应"""
@@ -96,58 +325,387 @@ class WeatherService:
         )
     
     def parse_forecast_api_response(self, api_response: dict) -> WeatherForecast:
-        """解析外部API的天气预报数据响应"""
-        city = api_response["city"]["name"]
-        country = api_response["city"]["country"]
-        
-        # 按日期分组，只保留每天的第一个预测
-        daily_forecasts = {}
-        for item in api_response["list"]:
-            date = item["dt_txt"].split(" ")[0]  # 获取日期部分
-            if date not in daily_forecasts:
-                daily_forecasts[date] = item
-        
-        # 转换为ForecastDay列表
-        forecast_list = []
-        for date, data in sorted(daily_forecasts.items()):
-            forecast_day = ForecastDay(
-                date=date,
-                temperature_min=data["main"]["temp_min"],
-                temperature_max=data["main"]["temp_max"],
-                humidity=data["main"]["humidity"],
-                wind_speed=data["wind"]["speed"],
-                description=data["weather"][0]["description"],
-                icon=data["weather"][0]["icon"]
+        """解析外部API的天气预报数据响应，将3小时预报聚合为每日预报"""
+        return aggregate_forecasts([api_response])[0]
+    
+    def _get_age(self, weather) -> timedelta:
+        """计算天气数据距上次更新的时长"""
+        last_updated = weather.updated_at or weather.created_at
+        if last_updated is None:
+            return timedelta.max
+        return datetime.utcnow() - last_updated.replace(tzinfo=None)
+    
+    def _should_update(self, weather) -> bool:
+        """判断天气数据是否超过缓存时长，需要重新获取"""
+        return self._get_age(weather) > timedelta(minutes=settings.WEATHER_CACHE_TTL_MINUTES)
+    
+    def _max_stale_age(self) -> timedelta:
+        """数据可以先返回、再在后台刷新的最大时长"""
+        return timedelta(
+            minutes=settings.WEATHER_CACHE_TTL_MINUTES + settings.WEATHER_STALE_WINDOW_MINUTES
+        )
+    
+    def _is_expired(self, weather) -> bool:
+        """判断天气数据是否已超出可以先返回旧数据的时间窗口，必须等待刷新"""
+        return self._get_age(weather) > self._max_stale_age()
+    
+    async def get_or_fetch_weather(self, city: str) -> Optional[WeatherInDB]:
+        """获取天气数据，依次查询进程内缓存、数据库，都没有可用数据时从API获取
+
+        city的各种写法（大小写、空白、已学到的其他语言名称）先解析为规范城市名称，
+        缓存、数据库和后台刷新都使用规范城市名称。
+        数据过期但仍在WEATHER_STALE_WINDOW_MINUTES窗口内时直接返回旧数据，
+        同时在后台刷新。
+        """
+        city = await self.resolve_city(city, self.cache)
+        # 先从进程内缓存获取
+        weather = self.cache.get(city)
+        if weather is None:
+            weather_cache_metrics.miss.inc()
+            # 缓存未命中时，同一城市的并发请求只执行一次查询和更新
+            weather = await self.flight.do(city, lambda: self._load_weather(city))
+        else:
+            weather_cache_metrics.hit.inc()
+        
+        if weather is not None:
+            self.refresh_scheduler.record_access(weather.city, weather)
+            if self._should_update(weather):
+                weather_cache_metrics.stale.inc()
+                self._schedule_refresh(weather.city)
+        return weather
+    
+    def _schedule_refresh(self, city: str) -> None:
+        """在后台刷新天气数据，同一城市同时只有一个刷新任务"""
+        if not self.flight.in_flight(city):
+            max_age = timedelta(minutes=settings.WEATHER_CACHE_TTL_MINUTES)
+            self.flight.spawn(city, lambda: self._refresh_in_background(city, max_age))
+    
+    async def refresh_weather(
+        self, city: str, max_age: timedelta = timedelta(0), priority: Priority = Priority.REFRESH
+    ) -> Optional[WeatherInDB]:
+        """使用独立的数据库会话刷新规范城市名称为city的天气数据，数据时长不超过max_age时不请求API"""
+        return await self.flight.do(city, lambda: self._refresh_in_background(city, max_age, priority))
+    
+    async def _refresh_in_background(
+        self, city: str, max_age: timedelta, priority: Priority = Priority.REFRESH
+    ) -> Optional[WeatherInDB]:
+        """使用独立的数据库会话刷新天气数据，请求结束后会话仍然可用，上游调用以priority排队"""
+        db = LazySession(self.session_factory or get_session_factory())
+        try:
+            service = WeatherService(
+                db, cache=self.cache, flight=self.flight, http_client=self._http_client
             )
-            forecast_list.append(forecast_day)
+            # 后台刷新不受触发它的请求的时间预算限制
+            with request_deadline(None), upstream_priority(priority):
+                return await service._load_weather(city, max_age=max_age)
+        except Exception:
+            logger.exception("后台刷新天气数据失败: %s", city)
+            return None
+        finally:
+            await db.close()
+    
+    async def _load_weather(self, city: str, max_age: Optional[timedelta] = None) -> Optional[WeatherInDB]:
+        """依次从共享缓存、数据库加载天气数据，需要时从API获取并写回数据库和缓存
+
+        数据不存在或时长超过max_age时请求API，max_age默认为缓存时长加旧数据窗口；
+        API返回的城市名称与city不同时，数据写入返回的规范城市名称下，并记录city为它的别名；
+        API不可用（如熔断中）时返回数据库中的旧数据。
+        """
+        if max_age is None:
+            max_age = self._max_stale_age()
+        # 其他进程已加载到共享缓存的数据可用时不访问数据库
+        shared = await self.shared_cache.get(city)
+        if shared is not None and self._get_age(shared) <= max_age:
+            return self._cache_weather(shared)
+        
+        weather = await self.get_weather_by_city(city)
+        if weather and self._get_age(weather) <= max_age:
+            snapshot = self._cache_weather(weather)
+            await self._share_weathers([snapshot])
+            return snapshot
         
-        return WeatherForecast(
-            city=city,
-            country=country,
-            forecast=forecast_list
+        fetched = await self._fetch_weather(city, max_age)
+        if fetched is not None:
+            return fetched
+        if not weather:
+            return None
+        return self._cache_weather(weather)
+    
+    async def _fetch_weather(self, city: str, max_age: timedelta) -> Optional[WeatherInDB]:
+        """从API获取天气数据并写回数据库和缓存，失败时返回None
+
+        所有进程中同一城市同时只有一个请求外部API，其余进程等待它写入共享缓存的结果，
+        等待超时（如持有锁的进程异常退出）后再自行请求。
+        """
+        async with self.shared_cache.fetch_lock(city) as owner:
+            if not owner:
+                # 等待期间其他进程刚获取的数据即使超过了max_age（如强制刷新时为0）也可以使用
+                fresh = max(max_age, timedelta(seconds=settings.UPSTREAM_TIMEOUT_SECONDS))
+                shared = await self.shared_cache.wait_for([city], lambda w: self._get_age(w) <= fresh)
+                if city in shared:
+                    return self._cache_weather(shared[city])
+            
+            api_data = await self.fetch_weather_from_api(city)
+            if not api_data:
+                return None
+            weather_data = self.parse_weather_api_response(api_data)
+            # 新建或更新已有数据
+            weather = await self._save_weather(
+                weather_data, self._aliases_for(weather_data.city, [city])
+            )
+            snapshot = self._cache_weather(weather)
+            await self._share_weathers([snapshot])
+            return snapshot
+    
+    def _cache_weather(self, weather: Union[Weather, WeatherInDB]) -> WeatherInDB:
+        """生成天气数据快照并以规范城市名称写入进程内缓存，缓存剩余的有效时长（含旧数据窗口）"""
+        snapshot = WeatherInDB.model_validate(weather, from_attributes=True)
+        remaining = self._max_stale_age() - self._get_age(snapshot)
+        # 完全过期的数据不写入缓存
+        if remaining > timedelta(0):
+            self.cache.set(snapshot.city, snapshot, ttl=remaining.total_seconds())
+        return snapshot
+    
+    async def _share_weathers(self, snapshots: Sequence[WeatherInDB]) -> None:
+        """用一次往返将天气数据快照写入共享缓存，TTL与进程内缓存相同"""
+        max_age = self._max_stale_age()
+        await self.shared_cache.set_many([
+            (snapshot.city, snapshot, (max_age - self._get_age(snapshot)).total_seconds())
+            for snapshot in snapshots
+        ])
+    
+    async def get_forecast_by_city(self, city_key: str) -> Optional[WeatherForecastCache]:
+        """根据规范城市名称获取缓存的天气预报"""
+        return await run_db(
+            self.db,
+            lambda db: db.query(WeatherForecastCache).filter(
+                WeatherForecastCache.city_key == city_key
+            ).first()
         )
     
-    def get_or_fetch_weather(self, city: str) -> Optional[Weather]:
-        """获取天气数据，如果数据库中没有则从API获取"""
-        # 先从数据库获取
-        weather = self.get_weather_by_city(city)
-        settings = Settings()
-        # 如果数据库中没有，或者数据超过1小时，则从API获取
-        if not weather or (
-            datetime.utcnow() - weather.updated_at.replace(tzinfo=None) > timedelta(minutes=settings.WEATHER_CACHE_TTL_MINUTES)
-        ):
-            api_data = self.fetch_weather_from_api(city)
+    async def _save_forecast(
+        self, forecast: WeatherForecast, aliases: Optional[Dict[str, str]] = None
+    ) -> WeatherForecastCache:
+        """以预报的规范城市名称写入天气预报缓存：没有记录时新建，否则更新已有记录，同时写入别名"""
+        def save(db: Session) -> WeatherForecastCache:
+            row = upsert(db, WeatherForecastCache, [{
+                "city_key": forecast.city,
+                "city": forecast.city,
+                "country": forecast.country,
+                "forecast": forecast.model_dump_json(),
+            }], key="city_key")[forecast.city]
+            if aliases:
+                self._record_aliases(db, aliases)
+            db.commit()
+            return row
+        
+        saved = await run_db(self.db, save)
+        if aliases:
+            self._cache_aliases(aliases)
+        return saved
+    
+    async def get_or_fetch_forecast(self, city: str, days: Optional[int] = None) -> Optional[WeatherForecast]:
+        """获取天气预报，依次查询进程内缓存、数据库，都没有可用数据时从API获取
+
+        与天气数据共用城市别名，缓存和数据库都以规范城市名称为键；
+        缓存中保存的是解析后的完整预报，days只对缓存结果做切片。
+        """
+        city_key = await self.resolve_city(city, self.forecast_cache)
+        forecast = self.forecast_cache.get(city_key)
+        if forecast is None:
+            forecast_cache_metrics.miss.inc()
+            # 缓存未命中时，同一城市的并发请求只执行一次查询和更新
+            forecast = await self.forecast_flight.do(city_key, lambda: self._load_forecast(city_key))
+        else:
+            forecast_cache_metrics.hit.inc()
+        if forecast is None or days is None:
+            return forecast
+        return forecast.model_copy(update={"forecast": forecast.forecast[:days]})
+    
+    async def _load_forecast(self, city_key: str) -> Optional[WeatherForecast]:
+        """依次从共享缓存、数据库加载天气预报，不存在或超过缓存时长时从API获取并写回
+
+        API不可用（如熔断中）时返回数据库中的旧预报，旧预报不写入缓存。
+        """
+        ttl = timedelta(minutes=settings.FORECAST_CACHE_TTL_MINUTES)
+        # 其他进程已加载到共享缓存的预报可用时不访问数据库
+        shared = await self.forecast_shared_cache.get(city_key)
+        if shared is not None and self._get_age(shared) <= ttl:
+            return await self._cache_forecast(city_key, shared, share=False)
+        
+        db_forecast = await self.get_forecast_by_city(city_key)
+        if db_forecast and self._get_age(db_forecast) <= ttl:
+            return await self._cache_forecast(
+                db_forecast.city_key, self._forecast_from_row(db_forecast)
+            )
+        
+        fetched = await self._fetch_forecast(city_key, ttl)
+        if fetched is not None:
+            return fetched
+        if not db_forecast:
+            return None
+        return self._forecast_from_row(db_forecast)
+    
+    async def _fetch_forecast(self, city_key: str, ttl: timedelta) -> Optional[WeatherForecast]:
+        """从API获取天气预报并写回数据库和缓存，失败时返回None；所有进程中同一城市同时只有一个请求"""
+        async with self.forecast_shared_cache.fetch_lock(city_key) as owner:
+            if not owner:
+                shared = await self.forecast_shared_cache.wait_for(
+                    [city_key], lambda forecast: self._get_age(forecast) <= ttl
+                )
+                if city_key in shared:
+                    return await self._cache_forecast(city_key, shared[city_key], share=False)
+            
+            api_data = await self.fetch_forecast_from_api(city_key)
+            if not api_data:
+                return None
+            forecast = self.parse_forecast_api_response(api_data)
+            db_forecast = await self._save_forecast(
+                forecast, self._aliases_for(forecast.city, [city_key])
+            )
+            forecast = forecast.model_copy(
+                update={"updated_at": db_forecast.updated_at or db_forecast.created_at}
+            )
+            return await self._cache_forecast(db_forecast.city_key, forecast)
+    
+    @staticmethod
+    def _forecast_from_row(db_forecast: WeatherForecastCache) -> WeatherForecast:
+        """解析数据库中保存的预报，带上最后更新时间"""
+        forecast = WeatherForecast.model_validate_json(db_forecast.forecast)
+        return forecast.model_copy(
+            update={"updated_at": db_forecast.updated_at or db_forecast.created_at}
+        )
+    
+    async def _cache_forecast(self, city_key: str, forecast: WeatherForecast, share: bool = True) -> WeatherForecast:
+        """以规范城市名称将预报写入进程内缓存，share为True时同时写入共享缓存，缓存剩余的有效时长"""
+        ttl = timedelta(minutes=settings.FORECAST_CACHE_TTL_MINUTES)
+        remaining = (ttl - self._get_age(forecast)).total_seconds()
+        if remaining > 0:
+            self.forecast_cache.set(city_key, forecast, ttl=remaining)
+            if share:
+                await self.forecast_shared_cache.set(city_key, forecast, remaining)
+        return forecast
+    
+    async def get_or_fetch_weather_batch(
+        self, cities: Sequence[str]
+    ) -> Tuple[Dict[str, WeatherInDB], Dict[str, str]]:
+        """批量获取多个城市的天气数据
+
+        先查进程内缓存，未命中的城市用一次往返从共享缓存获取，再用一次IN查询从数据库获取，
+        仍然缺失或完全过期的城市并发请求外部API（并发数受WEATHER_BATCH_CONCURRENCY限制），
+        最后在同一个事务中写回数据库，并用一次往返写入共享缓存。返回（城市 -> 天气数据，城市 -> 错误信息）。
+        批量查询不等待其他进程正在进行的请求，以免单个城市拖慢整批。
+        """
+        unique_cities = list(dict.fromkeys(cities))
+        # 不同写法的输入解析为同一个规范城市名称时只查询一次
+        canonical = await self.resolve_cities(unique_cities, self.cache)
+        keys = list(dict.fromkeys(canonical.values()))
+        results: Dict[str, WeatherInDB] = {}
+        
+        # 先从进程内缓存获取
+        misses = []
+        for key in keys:
+            cached = self.cache.get(key)
+            if cached is not None:
+                weather_cache_metrics.hit.inc()
+                results[key] = cached
+            else:
+                weather_cache_metrics.miss.inc()
+                misses.append(key)
+        
+        # 再从共享缓存获取其他进程已加载的城市
+        shared = await self.shared_cache.get_many(misses)
+        db_misses = []
+        for key in misses:
+            weather = shared.get(key)
+            if weather is not None and not self._is_expired(weather):
+                results[key] = self._cache_weather(weather)
+            else:
+                db_misses.append(key)
+        
+        # 再用一次查询从数据库获取
+        rows = await self.get_weathers_by_cities(db_misses) if db_misses else {}
+        to_fetch = []
+        to_share = []
+        for key in db_misses:
+            weather = rows.get(key)
+            if weather and not self._is_expired(weather):
+                results[key] = self._cache_weather(weather)
+                to_share.append(results[key])
+            else:
+                to_fetch.append(key)
+        
+        # 剩余的城市并发请求外部API
+        semaphore = asyncio.Semaphore(settings.WEATHER_BATCH_CONCURRENCY)
+        
+        async def fetch(city: str) -> Optional[dict]:
+            # 批量查询的上游调用排在单个城市的请求之后
+            async with semaphore:
+                with upstream_priority(Priority.BULK):
+                    return await self.fetch_weather_from_api(city)
+        
+        api_results = await asyncio.gather(*(fetch(key) for key in to_fetch))
+        fetched = []
+        aliases: Dict[str, str] = {}
+        for key, api_data in zip(to_fetch, api_results):
             if api_data:
                 weather_data = self.parse_weather_api_response(api_data)
-                if weather:
-                    # 更新现有数据
-                    update_data = weather_data.model_dump(exclude_unset=True)
-                    for field, value in update_data.items():
-                        setattr(weather, field, value)
-                    self.db.commit()
-                    self.db.refresh(weather)
-                else:
-                    # 创建新数据
-                    weather = self.create_weather(weather_data)
+                aliases.update(self._aliases_for(weather_data.city, [key]))
+                fetched.append((key, weather_data))
+            elif key in rows:
+                # 请求失败时退回数据库中的旧数据
+                results[key] = self._cache_weather(rows[key])
         
-        return weather
+        if fetched:
+            saved = await self._save_weathers([item for _, item in fetched], aliases)
+            for (key, _), weather in zip(fetched, saved):
+                results[key] = self._cache_weather(weather)
+                to_share.append(results[key])
+        await self._share_weathers(to_share)
+        
+        for weather in {weather.city: weather for weather in results.values()}.values():
+            self.refresh_scheduler.record_access(weather.city, weather)
+            if self._should_update(weather):
+                weather_cache_metrics.stale.inc()
+                self._schedule_refresh(weather.city)
+        
+        # 按请求顺序返回，键为请求中的城市名称
+        ordered = {city: results[canonical[city]] for city in unique_cities if canonical[city] in results}
+        errors = {
+            city: f"未找到城市 {city} 的天气数据" for city in unique_cities if canonical[city] not in results
+        }
+        return ordered, errors
+
+
+async def _refresh_ahead(city: str) -> Optional[WeatherInDB]:
+    """提前刷新热点城市的天气数据，其他进程刚刷新过的数据不会重复请求API"""
+    max_age = timedelta(
+        minutes=settings.WEATHER_CACHE_TTL_MINUTES, seconds=-settings.REFRESH_AHEAD_LEAD_SECONDS
+    )
+    return await WeatherService(None).refresh_weather(city, max_age=max_age, priority=Priority.BULK)
+
+
+async def prune_expired_observations() -> int:
+    """删除超过WEATHER_OBSERVATION_RETENTION_DAYS的观测记录"""
+    before = datetime.utcnow() - timedelta(days=settings.WEATHER_OBSERVATION_RETENTION_DAYS)
+    db = LazySession(get_session_factory())
+    try:
+        return await WeatherService(db).prune_observations(
+            before, settings.WEATHER_OBSERVATION_PRUNE_BATCH_SIZE
+        )
+    finally:
+        await db.close()
+
+
+# 热点城市天气的提前刷新调度器，由应用生命周期启动
+weather_refresh_scheduler = RefreshAheadScheduler(
+    refresh=_refresh_ahead,
+    ttl=timedelta(minutes=settings.WEATHER_CACHE_TTL_MINUTES),
+    lead=timedelta(seconds=settings.REFRESH_AHEAD_LEAD_SECONDS),
+    jitter=timedelta(seconds=settings.REFRESH_AHEAD_JITTER_SECONDS),
+    interval=settings.REFRESH_AHEAD_INTERVAL_SECONDS,
+    concurrency=settings.REFRESH_AHEAD_CONCURRENCY,
+    calls_per_minute=settings.REFRESH_AHEAD_CALLS_PER_MINUTE,
+    idle=timedelta(minutes=settings.REFRESH_AHEAD_IDLE_MINUTES),
+    max_tracked=settings.REFRESH_AHEAD_MAX_TRACKED
+)
@@ -1,4 +1,9 @@
 from app.utils.config import settings
-from app.utils.database import engine, Base, SessionLocal, get_db
+from app.utils.database import (
+    engine, Base, SessionLocal, AsyncSessionLocal, LazySession, run_db, get_db
+)
 
-__all__ = ["settings", "engine", "Base", "SessionLocal", "get_db"]
+__all__ = [
+    "settings", "engine", "Base", "SessionLocal", "AsyncSessionLocal",
+    "LazySession", "run_db", "get_db"
+]
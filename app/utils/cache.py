@@ -0,0 +1,107 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+from app.utils.config import settings
+from app.utils.metrics import CACHE_ENTRIES
+
+
+class TTLCache:
+    """进程内的LRU缓存，条目在超过TTL后失效
+
+    容量满时淘汰最久未使用的条目，并记录命中、未命中、淘汰与过期次数。
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        if maxsize <= 0:
+            raise ValueError("maxsize必须大于0")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """获取缓存值，不存在或已过期时返回default"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """写入缓存值，必要时淘汰最久未使用的条目"""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+            self._data[key] = (expires_at, value)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: Hashable) -> bool:
+        """删除缓存值"""
+        with self._lock:
+            return self._data.pop(key, None) is not None
+
+    def clear(self) -> None:
+        """清空缓存并重置统计"""
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        entry = self._data.get(key)
+        return entry is not None and entry[0] > time.monotonic()
+
+    def stats(self) -> Dict[str, int]:
+        """返回缓存统计信息"""
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+# 天气、天气预报与星象数据的进程内缓存
+weather_cache = TTLCache(
+    maxsize=settings.WEATHER_CACHE_MAX_SIZE,
+    ttl=settings.WEATHER_CACHE_TTL_MINUTES * 60
+)
+forecast_cache = TTLCache(
+    maxsize=settings.FORECAST_CACHE_MAX_SIZE,
+    ttl=settings.FORECAST_CACHE_TTL_MINUTES * 60
+)
+horoscope_cache = TTLCache(
+    maxsize=settings.HOROSCOPE_CACHE_MAX_SIZE,
+    ttl=settings.HOROSCOPE_CACHE_TTL_DAYS * 24 * 3600
+)
+# 城市别名（规范化的用户输入）-> 规范城市名称
+city_alias_cache = TTLCache(
+    maxsize=settings.CITY_ALIAS_CACHE_MAX_SIZE,
+    ttl=settings.CITY_ALIAS_CACHE_TTL_MINUTES * 60
+)
+CACHE_ENTRIES.labels("weather").set_function(weather_cache.__len__)
+CACHE_ENTRIES.labels("forecast").set_function(forecast_cache.__len__)
+CACHE_ENTRIES.labels("horoscope").set_function(horoscope_cache.__len__)
+CACHE_ENTRIES.labels("city_alias").set_function(city_alias_cache.__len__)
@@ -0,0 +1,279 @@
+import asyncio
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, List, Optional, Sequence, Tuple
+from urllib.parse import unquote, urlsplit
+
+from app.utils.config import settings
+
+
+class CacheBackend(ABC):
+    """跨进程共享的缓存后端，键为字符串，值为编码后的字节串
+
+    所有方法都是异步的；后端不可用时抛出CacheBackendError、OSError或asyncio.TimeoutError，
+    由调用方当作未命中处理。
+    """
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return (await self.get_many([key]))[0]
+
+    @abstractmethod
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        """一次往返获取多个键，返回与keys一一对应的值，不存在的为None"""
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        await self.set_many([(key, value, ttl)])
+
+    @abstractmethod
+    async def set_many(self, items: Sequence[Tuple[str, bytes, float]]) -> None:
+        """一次往返写入多个（键，值，TTL秒数）"""
+
+    @abstractmethod
+    async def add(self, key: str, value: bytes, ttl: float) -> bool:
+        """键不存在时写入并返回True，已存在时不写入并返回False"""
+
+    @abstractmethod
+    async def delete(self, *keys: str) -> None:
+        """删除多个键，不存在的键忽略"""
+
+    @abstractmethod
+    async def delete_if_equals(self, key: str, value: bytes) -> bool:
+        """键的当前值等于value时删除并返回True，否则不删除并返回False，检查和删除是一次原子操作"""
+
+    async def close(self) -> None:
+        """释放连接"""
+
+
+class CacheBackendError(Exception):
+    """缓存后端返回了错误"""
+
+
+class MemoryCacheBackend(CacheBackend):
+    """进程内的缓存后端，用于单进程部署和测试，不能在进程间共享"""
+
+    def __init__(self, maxsize: int = 10000):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+
+    def _get(self, key: str) -> Optional[bytes]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return entry[1]
+
+    def _set(self, key: str, value: bytes, ttl: float) -> None:
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        return [self._get(key) for key in keys]
+
+    async def set_many(self, items: Sequence[Tuple[str, bytes, float]]) -> None:
+        for key, value, ttl in items:
+            self._set(key, value, ttl)
+
+    async def add(self, key: str, value: bytes, ttl: float) -> bool:
+        if self._get(key) is not None:
+            return False
+        self._set(key, value, ttl)
+        return True
+
+    async def delete(self, *keys: str) -> None:
+        for key in keys:
+            self._data.pop(key, None)
+
+    async def delete_if_equals(self, key: str, value: bytes) -> bool:
+        if self._get(key) != value:
+            return False
+        del self._data[key]
+        return True
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+# 值相等时才删除的Lua脚本，释放锁时使用：锁已过期并被其他进程获取时不会删除别人的锁
+COMPARE_AND_DELETE_SCRIPT = (
+    'if redis.call("GET", KEYS[1]) == ARGV[1] then return redis.call("DEL", KEYS[1]) else return 0 end'
+)
+
+
+def _ttl_ms(ttl: float) -> bytes:
+    return str(max(int(ttl * 1000), 1)).encode()
+
+
+class _RespConnection:
+    """一个使用RESP协议的连接，支持流水线：一次写出多条命令后依次读取回复"""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    @staticmethod
+    def encode(command: Sequence[Any]) -> bytes:
+        parts = [b"*%d\r\n" % len(command)]
+        for arg in command:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        return b"".join(parts)
+
+    async def execute(self, commands: Sequence[Sequence[Any]]) -> List[Any]:
+        """执行多条命令，返回各自的回复；服务端错误以CacheBackendError实例的形式返回"""
+        self.writer.write(b"".join(self.encode(command) for command in commands))
+        await self.writer.drain()
+        return [await self._read_reply() for _ in commands]
+
+    async def _read_reply(self) -> Any:
+        line = await self.reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("缓存后端关闭了连接")
+        prefix, body = line[:1], line[1:-2]
+        if prefix == b"+":
+            return body.decode()
+        if prefix == b"-":
+            return CacheBackendError(body.decode())
+        if prefix == b":":
+            return int(body)
+        if prefix == b"$":
+            length = int(body)
+            if length < 0:
+                return None
+            return (await self.reader.readexactly(length + 2))[:-2]
+        if prefix == b"*":
+            length = int(body)
+            if length < 0:
+                return None
+            return [await self._read_reply() for _ in range(length)]
+        raise CacheBackendError(f"无法解析的回复: {line!r}")
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+class RespCacheBackend(CacheBackend):
+    """使用Redis协议（RESP）的共享缓存后端，可连接Redis、Valkey、KeyDB等服务
+
+    地址形如redis://[:password@]host:6379/0。连接按需建立并复用，最多pool_size个；
+    每次操作（包括流水线中的多条命令）最多等待timeout秒，超时或出错的连接直接关闭。
+    """
+
+    def __init__(self, url: str, pool_size: int = 10, timeout: float = 0.2):
+        parts = urlsplit(url)
+        self.host = parts.hostname or "localhost"
+        self.port = parts.port or 6379
+        self.username = unquote(parts.username) if parts.username else None
+        self.password = unquote(parts.password) if parts.password else None
+        self.db = int(parts.path.lstrip("/") or 0)
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._idle: List[_RespConnection] = []
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    async def _connect(self) -> _RespConnection:
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        connection = _RespConnection(reader, writer)
+        setup = []
+        if self.password is not None:
+            setup.append(["AUTH", self.username, self.password] if self.username else ["AUTH", self.password])
+        if self.db:
+            setup.append(["SELECT", self.db])
+        if setup:
+            for reply in await connection.execute(setup):
+                if isinstance(reply, CacheBackendError):
+                    connection.close()
+                    raise reply
+        return connection
+
+    async def execute(self, commands: Sequence[Sequence[Any]]) -> List[Any]:
+        """在一个连接上以流水线执行多条命令，任一命令出错时抛出CacheBackendError"""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.pool_size)
+        async with self._slots:
+            connection = self._idle.pop() if self._idle else None
+            try:
+                if connection is None:
+                    connection = await asyncio.wait_for(self._connect(), self.timeout)
+                replies = await asyncio.wait_for(connection.execute(commands), self.timeout)
+            except BaseException:
+                # 回复可能只读了一部分，连接不能再复用
+                if connection is not None:
+                    connection.close()
+                raise
+            self._idle.append(connection)
+        for reply in replies:
+            if isinstance(reply, CacheBackendError):
+                raise reply
+        return replies
+
+    async def get_many(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        if not keys:
+            return []
+        return (await self.execute([["MGET", *keys]]))[0]
+
+    async def set_many(self, items: Sequence[Tuple[str, bytes, float]]) -> None:
+        if items:
+            await self.execute([["SET", key, value, "PX", _ttl_ms(ttl)] for key, value, ttl in items])
+
+    async def add(self, key: str, value: bytes, ttl: float) -> bool:
+        return (await self.execute([["SET", key, value, "PX", _ttl_ms(ttl), "NX"]]))[0] == "OK"
+
+    async def delete(self, *keys: str) -> None:
+        if keys:
+            await self.execute([["DEL", *keys]])
+
+    async def delete_if_equals(self, key: str, value: bytes) -> bool:
+        return (await self.execute([["EVAL", COMPARE_AND_DELETE_SCRIPT, 1, key, value]]))[0] == 1
+
+    async def close(self) -> None:
+        idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+
+def create_cache_backend(url: str) -> Optional[CacheBackend]:
+    """根据地址创建缓存后端：空字符串表示不使用共享缓存，memory://为进程内后端，redis://为RESP后端"""
+    if not url:
+        return None
+    scheme = urlsplit(url).scheme
+    if scheme == "memory":
+        return MemoryCacheBackend(settings.CACHE_BACKEND_MEMORY_MAX_ENTRIES)
+    if scheme in ("redis", "resp"):
+        return RespCacheBackend(
+            url, pool_size=settings.CACHE_BACKEND_POOL_SIZE, timeout=settings.CACHE_BACKEND_TIMEOUT_SECONDS
+        )
+    raise ValueError(f"不支持的缓存后端: {url}")
+
+
+# 进程内共享的缓存后端，由应用生命周期关闭
+_cache_backend: Optional[CacheBackend] = None
+_configured = False
+
+
+def get_cache_backend() -> Optional[CacheBackend]:
+    """获取配置的缓存后端，未配置CACHE_BACKEND_URL时返回None"""
+    global _cache_backend, _configured
+    if not _configured:
+        _cache_backend = create_cache_backend(settings.CACHE_BACKEND_URL)
+        _configured = True
+    return _cache_backend
+
+
+def set_cache_backend(backend: Optional[CacheBackend]) -> None:
+    """替换缓存后端，例如测试时换成本地的替身"""
+    global _cache_backend, _configured
+    _cache_backend = backend
+    _configured = True
+
+
+async def close_cache_backend() -> None:
+    """应用关闭时释放缓存后端的连接"""
+    if _cache_backend is not None:
+        await _cache_backend.close()
@@ -0,0 +1,88 @@
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Dict, Iterable, Optional
+
+from fastapi import Request, Response
+
+
+def _row_version(row: Any) -> Optional[datetime]:
+    """读取数据的最后更新时间（UTC），数据库中无时区的时间按UTC处理"""
+    last_updated = getattr(row, "updated_at", None) or getattr(row, "created_at", None)
+    if last_updated is None:
+        return None
+    if last_updated.tzinfo is None:
+        return last_updated.replace(tzinfo=timezone.utc)
+    return last_updated.astimezone(timezone.utc)
+
+
+class Validators:
+    """条件GET请求的校验信息：强ETag和Last-Modified
+
+    ETag由表示方式（路由名和影响响应内容的参数）以及每条数据的id和更新时间计算，
+    数据或参数不变时ETag就不变，不需要序列化响应体。
+    """
+
+    def __init__(self, etag: str, last_modified: Optional[datetime] = None):
+        self.etag = etag
+        self.last_modified = last_modified
+
+    @classmethod
+    def for_rows(cls, variant: Iterable[Any], rows: Iterable[Any]) -> "Validators":
+        """根据表示方式和数据行生成校验信息"""
+        tokens = [str(part) for part in variant]
+        last_modified = None
+        for row in rows:
+            version = _row_version(row)
+            tokens.append(f"{getattr(row, 'id', '')}@{version.isoformat() if version else ''}")
+            if version is not None and (last_modified is None or version > last_modified):
+                last_modified = version
+        digest = hashlib.sha1("\x1f".join(tokens).encode("utf-8")).hexdigest()
+        return cls(f'"{digest}"', last_modified)
+
+    def headers(self) -> Dict[str, str]:
+        """响应中需要携带的校验头"""
+        headers = {"ETag": self.etag}
+        if self.last_modified is not None:
+            headers["Last-Modified"] = format_datetime(self.last_modified, usegmt=True)
+        return headers
+
+    def is_not_modified(self, request: Request) -> bool:
+        """判断客户端缓存的版本是否仍然有效
+
+        请求带有If-None-Match时只比较ETag（弱比较），否则比较If-Modified-Since。
+        """
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None:
+            tags = [tag.strip() for tag in if_none_match.split(",")]
+            return any(
+                tag == "*" or (tag[2:] if tag.startswith("W/") else tag) == self.etag
+                for tag in tags
+            )
+
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since is None or self.last_modified is None:
+            return False
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        # Last-Modified只精确到秒
+        return self.last_modified.replace(microsecond=0) <= since
+
+
+def conditional_response(
+    request: Request, response: Response, variant: Iterable[Any], *rows: Any
+) -> Optional[Response]:
+    """处理条件GET请求
+
+    客户端的缓存仍然有效时返回只含校验头的304响应；
+    否则把校验头写入response并返回None，由路由照常返回数据。
+    """
+    validators = Validators.for_rows(variant, rows)
+    if validators.is_not_modified(request):
+        return Response(status_code=304, headers=validators.headers())
+    response.headers.update(validators.headers())
+    return None
@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from typing import List
+from typing import List, Optional
 
 
 class Settings(BaseSettings):
@@ -12,6 +12,9 @@ class Settings(BaseSettings):
     
     # 数据库配置
     DATABASE_URL: str
+    ASYNC_DATABASE_URL: Optional[str] = None  # 如 postgresql+asyncpg://...，配置后使用异步会话
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
     
     # API配置
     API_V1_STR: str = "/api/v1"
@@ -24,12 +27,96 @@ class Settings(BaseSettings):
     # 外部API配置
     WEATHER_API_KEY: str = ""
     HOROSCOPE_API_KEY: str = ""
+    WEATHER_API_BASE_URL: str = "https://api.openweathermap.org/data/2.5"  # 负载测试时可指向模拟上游
+    
+    # 上游HTTP客户端配置
+    UPSTREAM_TIMEOUT_SECONDS: float = 10.0           # 单次请求的读写超时
+    UPSTREAM_CONNECT_TIMEOUT_SECONDS: float = 3.0    # 建立连接的超时
+    UPSTREAM_MAX_CONNECTIONS: int = 100              # 连接池最大连接数
+    UPSTREAM_MAX_KEEPALIVE_CONNECTIONS: int = 20     # 连接池最大保活连接数
+    UPSTREAM_KEEPALIVE_EXPIRY_SECONDS: float = 30.0  # 空闲保活连接的过期时间
+    
+    # 上游保护配置
+    REQUEST_BUDGET_SECONDS: float = 5.0              # 每个请求等待上游的总时长上限，0表示不限制
+    CIRCUIT_BREAKER_FAILURE_THRESHOLD: int = 5       # 连续失败多少次后熔断
+    CIRCUIT_BREAKER_RECOVERY_SECONDS: float = 30.0   # 熔断后多久放行一个试探请求
+    UPSTREAM_HEDGE_AFTER_SECONDS: float = 0.0        # 上游超过该时长未响应时再发一次请求，0表示关闭
+    
+    # 上游配额调度（每个进程独立计算，多进程部署时按进程数分摊账号的配额）
+    UPSTREAM_CALLS_PER_MINUTE: int = 60                     # 每分钟最多调用天气API的次数，0表示不限制
+    UPSTREAM_QUOTA_BURST: int = 10                          # 令牌桶容量，允许的突发调用次数
+    UPSTREAM_QUOTA_REFRESH_RESERVE: float = 0.2             # 后台刷新需为用户请求保留的令牌比例
+    UPSTREAM_QUOTA_BULK_RESERVE: float = 0.5                # 提前刷新和批量查询需保留的令牌比例
+    UPSTREAM_QUOTA_INTERACTIVE_MAX_WAIT_SECONDS: float = 2.0  # 用户请求最多等待配额的时长
+    UPSTREAM_QUOTA_REFRESH_MAX_WAIT_SECONDS: float = 30.0   # 后台刷新最多等待配额的时长
+    UPSTREAM_QUOTA_BULK_MAX_WAIT_SECONDS: float = 120.0     # 提前刷新和批量查询最多等待配额的时长
+    UPSTREAM_QUOTA_MAX_QUEUE: int = 1000                    # 每个优先级最多排队的调用数
     
     # 日志配置
     LOG_LEVEL: str = "INFO"
 
     WEATHER_CACHE_TTL_MINUTES: int = 60  # 天气缓存默认60分钟
     HOROSCOPE_CACHE_TTL_DAYS: int = 1    # 星象缓存默认1天
+    WEATHER_CACHE_MAX_SIZE: int = 1024   # 进程内天气缓存最多保存的城市数
+    HOROSCOPE_CACHE_MAX_SIZE: int = 64   # 进程内星象缓存最多保存的星座数
+    FORECAST_CACHE_TTL_MINUTES: int = 180   # 天气预报缓存默认3小时
+    FORECAST_CACHE_MAX_SIZE: int = 512      # 进程内预报缓存最多保存的城市数
+    CITY_ALIAS_CACHE_MAX_SIZE: int = 4096   # 进程内城市别名缓存最多保存的别名数
+    CITY_ALIAS_CACHE_TTL_MINUTES: int = 1440  # 已知别名在进程内缓存的时长
+    CITY_ALIAS_MISS_TTL_SECONDS: int = 60   # 未知别名在进程内缓存的时长，其他进程学到后最迟在该时长后生效
+    # 进程间共享的缓存后端，如redis://cache:6379/0；memory://只在进程内共享，空表示不使用
+    CACHE_BACKEND_URL: str = ""
+    CACHE_BACKEND_TIMEOUT_SECONDS: float = 0.2   # 每次访问共享缓存的超时，超时按未命中处理
+    CACHE_BACKEND_POOL_SIZE: int = 10            # 每个进程到共享缓存的最大连接数
+    CACHE_BACKEND_MEMORY_MAX_ENTRIES: int = 10000  # memory://后端最多保存的条目数
+    CACHE_KEY_PREFIX: str = "stellar:"           # 共享缓存键的前缀，多个环境共用一个实例时区分
+    CACHE_FETCH_LOCK_POLL_SECONDS: float = 0.05  # 其他进程正在请求外部API时检查共享缓存的间隔
+    # 数据过期后的这段时间内先返回旧数据并在后台刷新，超过后阻塞等待刷新，0表示关闭
+    WEATHER_STALE_WINDOW_MINUTES: int = 10
+    HOROSCOPE_STALE_WINDOW_HOURS: int = 6
+    
+    # 天气观测记录保留配置
+    WEATHER_OBSERVATION_RETENTION_DAYS: int = 180        # 观测记录保留天数
+    WEATHER_OBSERVATION_PRUNE_BATCH_SIZE: int = 1000     # 每批删除的记录数
+    WEATHER_OBSERVATION_PRUNE_INTERVAL_MINUTES: int = 60 # 清理任务的执行间隔，0表示不自动清理
+    WEATHER_ROLLUP_MAX_POINTS: int = 2000                # 按小时/按天查询历史时最多返回的条数
+    
+    # 每日星象预计算配置
+    HOROSCOPE_PRECOMPUTE_ENABLED: bool = True
+    HOROSCOPE_PRECOMPUTE_HOUR: int = 0    # 每天几点（本地时间）预计算所有星座的星象数据
+    
+    # 使用预编译的编码器直接生成天气/星象响应的JSON，跳过逐请求的响应模型校验（输出相同）
+    FAST_SERIALIZATION: bool = False
+    
+    # 按需性能分析：请求头X-Profile携带该密钥时分析该请求，未配置时不能通过请求头开启
+    PROFILING_ADMIN_KEY: Optional[str] = None
+    PROFILING_SAMPLE_RATE: float = 0.0         # 随机分析的请求比例，0表示不采样
+    PROFILING_TRACE_ALLOCATIONS: bool = False  # 分析时是否总是记录内存分配
+    PROFILING_OUTPUT_DIR: str = "profiles"     # 分析结果的输出目录
+    
+    # 趣味分析规则文件，未配置时使用内置规则
+    ANALYSIS_RULES_PATH: Optional[str] = None
+    
+    # 批量天气查询配置
+    WEATHER_BATCH_MAX_CITIES: int = 500   # 单次批量查询最多城市数
+    WEATHER_BATCH_CONCURRENCY: int = 10   # 批量查询时并发请求外部API的数量
+    
+    # 热点城市天气提前刷新配置
+    REFRESH_AHEAD_ENABLED: bool = True
+    REFRESH_AHEAD_LEAD_SECONDS: int = 120       # 到期前多久开始刷新
+    REFRESH_AHEAD_JITTER_SECONDS: int = 60      # 刷新时间的随机抖动范围，避免同时到期
+    REFRESH_AHEAD_INTERVAL_SECONDS: float = 5.0 # 调度循环的间隔
+    REFRESH_AHEAD_CONCURRENCY: int = 4          # 并发刷新数
+    REFRESH_AHEAD_CALLS_PER_MINUTE: int = 60    # 每分钟最多刷新次数
+    REFRESH_AHEAD_IDLE_MINUTES: int = 30        # 超过该时长未被读取的城市不再刷新
+    REFRESH_AHEAD_MAX_TRACKED: int = 1000       # 最多跟踪的城市数
+
+    # 天气与星座运势推送订阅配置
+    SUBSCRIPTION_REFRESH_INTERVAL_SECONDS: float = 30.0  # 检查被订阅数据变化的间隔，0表示不推送更新
+    SUBSCRIPTION_MAX_CONNECTIONS: int = 10000            # 每个进程最多的订阅连接数
+    SUBSCRIPTION_MAX_TOPICS: int = 50                    # 每个连接最多订阅的城市和星座数
+    SUBSCRIPTION_SEND_TIMEOUT_SECONDS: float = 10.0      # 客户端超过该时长未接收数据时断开连接
+    SUBSCRIPTION_KEEPALIVE_SECONDS: float = 15.0         # 没有变化时发送心跳的间隔
 
     model_config = SettingsConfigDict(
         env_file=".env",
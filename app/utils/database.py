@@ -1,28 +1,147 @@
+import time
+from typing import Any, Callable, Optional, TypeVar, Union
+
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool, QueuePool
 
 from app.utils.config import settings
+from app.utils.metrics import DB_POOL_CHECKED_OUT, DB_POOL_CHECKOUT_WAIT, DB_POOL_SATURATION
+
+T = TypeVar("T")
+
+
+class _CheckoutTimingMixin:
+    """记录从连接池获取连接的等待时间，连接池已满时的排队时间也计算在内"""
+
+    metrics_name: str
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_CHECKOUT_WAIT.labels(self.metrics_name).observe(time.perf_counter() - started)
+
+
+class InstrumentedQueuePool(_CheckoutTimingMixin, QueuePool):
+    """记录获取连接等待时间的同步连接池"""
+    metrics_name = "sync"
+
+
+class InstrumentedAsyncQueuePool(_CheckoutTimingMixin, AsyncAdaptedQueuePool):
+    """记录获取连接等待时间的异步连接池"""
+    metrics_name = "async"
+
+
+def _export_pool_metrics(name: str, pool: Pool) -> None:
+    """导出连接池已取出的连接数和饱和度，导出指标时才读取"""
+    capacity = max(settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW, 1)
+    DB_POOL_CHECKED_OUT.labels(name).set_function(pool.checkedout)
+    DB_POOL_SATURATION.labels(name).set_function(lambda: pool.checkedout() / capacity)
+
 
 # 创建数据库引擎
 engine = create_engine(
     settings.DATABASE_URL,
     pool_pre_ping=True,
-    pool_size=10,
-    max_overflow=20
+    poolclass=InstrumentedQueuePool,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW
 )
+_export_pool_metrics("sync", engine.pool)
 
 # 创建会话工厂
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 配置了ASYNC_DATABASE_URL时创建异步引擎和会话工厂
+async_engine = None
+AsyncSessionLocal = None
+if settings.ASYNC_DATABASE_URL:
+    async_engine = create_async_engine(
+        settings.ASYNC_DATABASE_URL,
+        pool_pre_ping=True,
+        poolclass=InstrumentedAsyncQueuePool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW
+    )
+    _export_pool_metrics("async", async_engine.pool)
+    AsyncSessionLocal = async_sessionmaker(
+        async_engine, autoflush=False, expire_on_commit=False
+    )
+
 # 创建基础模型类
 Base = declarative_base()
 
 
-def get_db():
-    """获取数据库会话的依赖函数"""
-    db = SessionLocal()
+class LazySession:
+    """惰性数据库会话
+
+    直到第一次真正使用时才从会话工厂创建会话，完全由缓存响应的请求不会创建会话、
+    也不会占用连接池。会话工厂可以是同步的sessionmaker或异步的async_sessionmaker。
+    """
+
+    def __init__(self, factory: Union[sessionmaker, async_sessionmaker]):
+        self._factory = factory
+        self._session: Optional[Union[Session, AsyncSession]] = None
+
+    @property
+    def session(self) -> Union[Session, AsyncSession]:
+        """获取底层会话，首次访问时创建"""
+        if self._session is None:
+            self._session = self._factory()
+        return self._session
+
+    @property
+    def is_active(self) -> bool:
+        """会话是否已经被创建"""
+        return self._session is not None
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.session, name)
+
+    async def close(self) -> None:
+        """关闭已创建的会话，未创建时不做任何事"""
+        if self._session is None:
+            return
+        session, self._session = self._session, None
+        if isinstance(session, AsyncSession):
+            await session.close()
+        else:
+            session.close()
+
+
+def get_session_factory() -> Union[sessionmaker, async_sessionmaker]:
+    """获取当前使用的会话工厂，配置了异步数据库时优先使用异步会话"""
+    return AsyncSessionLocal if AsyncSessionLocal is not None else SessionLocal
+
+
+async def run_db(db: Union[Session, AsyncSession, LazySession], fn: Callable[..., T], *args: Any) -> T:
+    """在数据库会话上执行同步的ORM操作
+
+    fn的第一个参数为同步Session；异步会话通过run_sync在其连接上执行fn，
+    服务层因此只需编写一份查询代码即可同时支持同步和异步数据库。
+    """
+    session = db.session if isinstance(db, LazySession) else db
+    if isinstance(session, AsyncSession):
+        return await session.run_sync(fn, *args)
+    return fn(session, *args)
+
+
+async def close_db(db: Union[Session, AsyncSession, LazySession]) -> None:
+    """提前关闭会话并归还连接，例如长连接在加载初始数据之后；会话之后仍可使用，会重新获取连接"""
+    if isinstance(db, (LazySession, AsyncSession)):
+        await db.close()
+    else:
+        db.close()
+
+
+async def get_db():
+    """获取数据库会话的依赖函数，会话在第一次查询时才创建"""
+    db = LazySession(get_session_factory())
     try:
         yield db
     finally:
-        db.close()
+        await db.close()
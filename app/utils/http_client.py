@@ -0,0 +1,50 @@
+from typing import Optional
+
+import httpx
+
+from app.utils.config import settings
+
+# 进程内共享的上游HTTP客户端，由应用生命周期创建和关闭
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def create_http_client() -> httpx.AsyncClient:
+    """根据配置创建带连接池和超时设置的异步HTTP客户端"""
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=settings.UPSTREAM_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.UPSTREAM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.UPSTREAM_KEEPALIVE_EXPIRY_SECONDS
+        ),
+        timeout=httpx.Timeout(
+            settings.UPSTREAM_TIMEOUT_SECONDS,
+            connect=settings.UPSTREAM_CONNECT_TIMEOUT_SECONDS
+        )
+    )
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """获取共享的HTTP客户端，尚未创建时（如在应用之外使用服务）按需创建"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = create_http_client()
+    return _http_client
+
+
+def set_http_client(client: Optional[httpx.AsyncClient]) -> None:
+    """替换共享的HTTP客户端，例如负载测试时换成指向模拟上游的客户端"""
+    global _http_client
+    _http_client = client
+
+
+async def start_http_client() -> httpx.AsyncClient:
+    """应用启动时创建共享的HTTP客户端"""
+    return get_http_client()
+
+
+async def close_http_client() -> None:
+    """应用关闭时释放连接池"""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
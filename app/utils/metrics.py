@@ -0,0 +1,367 @@
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# 默认的延迟分桶（秒）
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+# Prometheus文本格式的Content-Type
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    """转义标签值"""
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    """生成{name="value",...}形式的标签，extra为额外追加的标签（如le）"""
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric(ABC):
+    """指标基类：按标签值保存子指标
+
+    子指标在第一次使用时创建并缓存，之后的记录只是一次字典查找和一次加法，
+    不加锁（依赖GIL，极端并发下计数可能有少量误差），适合放在请求路径上。
+    """
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+
+    def labels(self, *values: str) -> Any:
+        """获取某组标签值对应的子指标"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"指标{self.name}需要标签{self.labelnames}")
+            child = self._children[values] = self._new_child()
+        return child
+
+    @abstractmethod
+    def _new_child(self) -> Any:
+        """创建一个子指标"""
+
+    @abstractmethod
+    def _samples(self) -> Iterable[str]:
+        """生成所有子指标的样本行"""
+
+    def render(self) -> List[str]:
+        """生成该指标的Prometheus文本"""
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        lines.extend(self._samples())
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+
+    kind = "counter"
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        """无标签计数器加一"""
+        self.labels().inc(amount)
+
+    def _samples(self) -> Iterable[str]:
+        for values, child in list(self._children.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+
+
+class _GaugeChild:
+    __slots__ = ("value", "function")
+
+    def __init__(self):
+        self.value = 0.0
+        self.function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """导出指标时调用function取值，适合连接池大小等已有状态"""
+        self.function = function
+
+    def get(self) -> float:
+        return self.function() if self.function is not None else self.value
+
+
+class Gauge(_Metric):
+    """可增可减的当前值"""
+
+    kind = "gauge"
+
+    def _new_child(self) -> _GaugeChild:
+        return _GaugeChild()
+
+    def _samples(self) -> Iterable[str]:
+        for values, child in list(self._children.items()):
+            try:
+                value = child.get()
+            except Exception:
+                continue
+            yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(value)}"
+
+
+class _HistogramChild:
+    __slots__ = ("upper_bounds", "counts", "sum", "count")
+
+    def __init__(self, upper_bounds: Tuple[float, ...]):
+        self.upper_bounds = upper_bounds
+        self.counts = [0] * (len(upper_bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        """记录一次观测：二分查找所在分桶，导出时再累加为累计计数"""
+        self.counts[bisect_left(self.upper_bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram(_Metric):
+    """分桶直方图，用于延迟等分布"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        """无标签直方图记录一次观测"""
+        self.labels().observe(value)
+
+    def _samples(self) -> Iterable[str]:
+        for values, child in list(self._children.items()):
+            cumulative = 0
+            for upper_bound, count in zip(self.buckets + (float("inf"),), child.counts):
+                cumulative += count
+                le = f'le="{_format_value(upper_bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}"
+            labels = _format_labels(self.labelnames, values)
+            yield f"{self.name}_sum{labels} {_format_value(child.sum)}"
+            yield f"{self.name}_count{labels} {child.count}"
+
+
+class Registry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"指标{metric.name}已注册")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """生成所有指标的Prometheus文本格式"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# 应用使用的指标注册表和指标
+registry = Registry()
+
+HTTP_REQUEST_DURATION = registry.histogram(
+    "http_request_duration_seconds", "HTTP请求处理耗时", ("method", "route", "status")
+)
+UPSTREAM_REQUESTS = registry.counter(
+    "upstream_requests_total", "外部API调用次数", ("service", "outcome")
+)
+UPSTREAM_DURATION = registry.histogram(
+    "upstream_request_duration_seconds", "外部API调用耗时", ("service",)
+)
+UPSTREAM_CIRCUIT_STATE = registry.gauge(
+    "upstream_circuit_state", "上游熔断器状态：0关闭，1半开，2打开", ("service",)
+)
+UPSTREAM_RESILIENCE_EVENTS = registry.counter(
+    "upstream_resilience_events_total",
+    "上游保护层事件：rejected为熔断拒绝，deadline_exceeded为预算用完未调用，timeout为超时，"
+    "hedged为发起对冲请求，hedge_won为对冲请求先返回，shed为配额不足未调用",
+    ("service", "event")
+)
+UPSTREAM_QUOTA_TOKENS = registry.gauge("upstream_quota_tokens", "上游配额令牌桶中可用的令牌数", ("quota",))
+UPSTREAM_QUOTA_QUEUED = registry.gauge(
+    "upstream_quota_queued", "等待上游配额的调用数", ("quota", "priority")
+)
+UPSTREAM_QUOTA_WAIT = registry.histogram(
+    "upstream_quota_wait_seconds", "取得上游配额的等待时间", ("quota", "priority"),
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 120.0)
+)
+UPSTREAM_QUOTA_SHED = registry.counter(
+    "upstream_quota_shed_total", "因配额不足（排队已满或等待超时）被放弃的上游调用次数", ("quota", "priority")
+)
+CACHE_REQUESTS = registry.counter(
+    "cache_requests_total", "数据读取结果：hit为缓存命中，miss为未命中，stale为返回了待刷新的旧数据",
+    ("cache", "result")
+)
+CACHE_ENTRIES = registry.gauge("cache_entries", "进程内缓存的条目数", ("cache",))
+SHARED_CACHE_REQUESTS = registry.counter(
+    "shared_cache_requests_total",
+    "共享缓存的读取结果：hit为命中，miss为未命中，error为后端不可用（按未命中处理）",
+    ("cache", "result")
+)
+SHARED_CACHE_FETCH_LOCKS = registry.counter(
+    "shared_cache_fetch_locks_total",
+    "请求外部API前的跨进程去重：acquired为由本进程请求，waited为等到了其他进程的结果，"
+    "timeout为等待超时后自行请求",
+    ("cache", "result")
+)
+SUBSCRIPTION_CONNECTIONS = registry.gauge("subscription_connections", "当前的推送订阅连接数")
+SUBSCRIPTION_TOPICS = registry.gauge("subscription_topics", "至少有一个订阅者的城市或星座数", ("kind",))
+SUBSCRIPTION_EVENTS = registry.counter("subscription_events_total", "推送给订阅者的事件数", ("event",))
+SUBSCRIPTION_COALESCED = registry.counter(
+    "subscription_coalesced_total", "订阅者尚未接收上一次变化时被合并的变化数"
+)
+SUBSCRIPTION_REJECTED = registry.counter(
+    "subscription_rejected_total",
+    "被拒绝或断开的订阅连接：limit为连接数已满，slow为客户端长时间未接收数据",
+    ("reason",)
+)
+DB_POOL_CHECKOUT_WAIT = registry.histogram(
+    "db_pool_checkout_wait_seconds", "从连接池获取连接的等待时间", ("engine",),
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+)
+DB_POOL_CHECKED_OUT = registry.gauge("db_pool_checked_out", "连接池中已被取出的连接数", ("engine",))
+DB_POOL_SATURATION = registry.gauge(
+    "db_pool_saturation", "已取出的连接数占连接池容量（pool_size + max_overflow）的比例", ("engine",)
+)
+
+
+class CacheMetrics:
+    """某个缓存的命中、未命中与旧数据计数，子指标预先取出以减少请求路径上的开销"""
+
+    def __init__(self, cache: str):
+        self.hit = CACHE_REQUESTS.labels(cache, "hit")
+        self.miss = CACHE_REQUESTS.labels(cache, "miss")
+        self.stale = CACHE_REQUESTS.labels(cache, "stale")
+
+
+@contextmanager
+def upstream_request(service: str) -> Iterator[None]:
+    """记录一次实际发出的外部API请求的次数和耗时，抛出异常（包括超时后被取消）计为error
+
+    只应包住真正发送请求的代码：熔断拒绝、预算用完和配额不足时没有请求发出，
+    由upstream_resilience_events_total记录，不计入外部API的调用次数和耗时。
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        UPSTREAM_REQUESTS.labels(service, "error").inc()
+        raise
+    else:
+        UPSTREAM_REQUESTS.labels(service, "success").inc()
+    finally:
+        UPSTREAM_DURATION.labels(service).observe(time.perf_counter() - started)
+
+
+def track_upstream(service: str) -> Callable[[Callable[..., Awaitable[T]]], Callable[..., Awaitable[T]]]:
+    """以upstream_request记录被装饰的请求函数每次调用的次数和耗时的装饰器"""
+    def decorator(fn: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+        @wraps(fn)
+        async def wrapper(*args: Any, **kwargs: Any) -> T:
+            with upstream_request(service):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class MetricsMiddleware:
+    """记录每个路由处理耗时的ASGI中间件
+
+    按路由模板（如/api/weather/{city}）而不是实际路径分组，避免标签数量随城市名增长。
+    """
+
+    def __init__(self, app: Any):
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = "500"
+
+        async def send_wrapper(message: Dict[str, Any]) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "<unmatched>"
+            HTTP_REQUEST_DURATION.labels(scope["method"], path, status).observe(
+                time.perf_counter() - started
+            )
@@ -0,0 +1,62 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def seconds_until_hour(hour: int, now: Optional[datetime] = None) -> float:
+    """计算距离下一个本地时间hour点整的秒数"""
+    now = now or datetime.now()
+    next_run = now.replace(hour=hour, minute=0, second=0, microsecond=0)
+    if next_run <= now:
+        next_run += timedelta(days=1)
+    return (next_run - now).total_seconds()
+
+
+class PeriodicTask:
+    """按固定间隔在后台重复执行的任务，由应用生命周期启动和停止
+
+    initial_delay返回首次执行前需要等待的秒数，每次启动时调用（例如计算到下一个整点的时长），
+    未设置时首次执行同样等待interval。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        fn: Callable[[], Awaitable[object]],
+        interval: float,
+        initial_delay: Optional[Callable[[], float]] = None
+    ):
+        self.name = name
+        self.fn = fn
+        self.interval = interval
+        self.initial_delay = initial_delay
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    async def _run(self) -> None:
+        """后台循环，单次执行失败不会中断循环"""
+        delay = self.initial_delay() if self.initial_delay is not None else self.interval
+        while True:
+            await asyncio.sleep(delay)
+            delay = self.interval
+            try:
+                await self.fn()
+            except Exception:
+                logger.exception("后台任务%s执行失败", self.name)
+
+    def start(self) -> None:
+        """启动后台循环"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        """停止后台循环"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
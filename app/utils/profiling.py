@@ -0,0 +1,117 @@
+import asyncio
+import cProfile
+import hmac
+import logging
+import os
+import random
+import re
+import time
+import tracemalloc
+import uuid
+from typing import Any, Dict, Optional
+
+from app.utils.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 携带管理密钥以开启本次请求的性能分析
+PROFILE_HEADER = "x-profile"
+# 值为1时同时记录内存分配
+PROFILE_ALLOCATIONS_HEADER = "x-profile-allocations"
+# 响应中返回的分析文件名（不含扩展名）
+PROFILE_ID_HEADER = "X-Profile-Id"
+
+
+def _should_profile(scope: Dict[str, Any]) -> bool:
+    """判断本次请求是否需要分析：携带正确的管理密钥，或被采样命中"""
+    admin_key = settings.PROFILING_ADMIN_KEY
+    if admin_key:
+        for name, value in scope["headers"]:
+            if name == PROFILE_HEADER.encode():
+                return hmac.compare_digest(value.decode("latin-1"), admin_key)
+    rate = settings.PROFILING_SAMPLE_RATE
+    return rate > 0 and random.random() < rate
+
+
+def _trace_allocations(scope: Dict[str, Any]) -> bool:
+    """判断是否同时记录内存分配"""
+    if settings.PROFILING_TRACE_ALLOCATIONS:
+        return True
+    return any(
+        name == PROFILE_ALLOCATIONS_HEADER.encode() and value == b"1"
+        for name, value in scope["headers"]
+    )
+
+
+def _profile_id(scope: Dict[str, Any]) -> str:
+    """生成分析文件名：时间_方法_路径_随机串"""
+    path = re.sub(r"[^A-Za-z0-9]+", "_", scope["path"]).strip("_") or "root"
+    return f"{time.strftime('%Y%m%d-%H%M%S')}_{scope['method']}_{path[:60]}_{uuid.uuid4().hex[:8]}"
+
+
+class ProfilingMiddleware:
+    """按需分析单个请求的ASGI中间件
+
+    请求带有X-Profile: <PROFILING_ADMIN_KEY>，或按PROFILING_SAMPLE_RATE被采样时，
+    用cProfile分析请求的CPU耗时，结果以pstats格式写入PROFILING_OUTPUT_DIR下的.prof文件，
+    可以用snakeviz、flameprof等工具生成火焰图；同时带有X-Profile-Allocations: 1
+    （或开启PROFILING_TRACE_ALLOCATIONS）时还会用tracemalloc记录内存分配，快照写入.tracemalloc文件。
+
+    cProfile记录的是整个线程，分析期间同一事件循环中其他请求的执行也会被计入；
+    同一时刻只分析一个请求，其余请求照常处理。未开启时每个请求只多两次配置读取。
+    """
+
+    def __init__(self, app: Any):
+        self.app = app
+        self._active = False
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if (
+            scope["type"] != "http"
+            or not (settings.PROFILING_ADMIN_KEY or settings.PROFILING_SAMPLE_RATE > 0)
+            or self._active
+            or not _should_profile(scope)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = _profile_id(scope)
+        trace_allocations = _trace_allocations(scope)
+
+        async def send_wrapper(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((PROFILE_ID_HEADER.lower().encode(), profile_id.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        self._active = True
+        started_tracing = trace_allocations and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        profiler = cProfile.Profile()
+        profiler.enable()
+        snapshot: Optional[tracemalloc.Snapshot] = None
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profiler.disable()
+            if trace_allocations:
+                snapshot = tracemalloc.take_snapshot()
+            if started_tracing:
+                tracemalloc.stop()
+            self._active = False
+            await asyncio.to_thread(self._write, profile_id, profiler, snapshot)
+
+    @staticmethod
+    def _write(profile_id: str, profiler: cProfile.Profile, snapshot: Optional[tracemalloc.Snapshot]) -> None:
+        """写入分析结果，写入失败只记录日志"""
+        try:
+            os.makedirs(settings.PROFILING_OUTPUT_DIR, exist_ok=True)
+            base = os.path.join(settings.PROFILING_OUTPUT_DIR, profile_id)
+            profiler.dump_stats(base + ".prof")
+            if snapshot is not None:
+                snapshot.dump(base + ".tracemalloc")
+            logger.info("已写入性能分析结果: %s", base)
+        except OSError:
+            logger.exception("写入性能分析结果失败: %s", profile_id)
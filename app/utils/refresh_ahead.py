@@ -0,0 +1,171 @@
+import asyncio
+import logging
+import random
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _TrackedKey:
+    """被跟踪的热点键"""
+    refresh_at: datetime
+    last_read: float
+    refreshing: bool = False
+
+
+class RefreshAheadScheduler:
+    """提前刷新调度器
+
+    记录最近被读取的键，在数据到期（更新时间 + TTL）之前的lead时长内于后台刷新。
+    每个键的刷新时间额外减去一个随机抖动，避免同一批写入的数据同时到期；
+    同时限制并发刷新数和每分钟的刷新次数。
+    """
+
+    def __init__(
+        self,
+        refresh: Callable[[Hashable], Awaitable[Any]],
+        ttl: timedelta,
+        lead: timedelta,
+        jitter: timedelta,
+        interval: float,
+        concurrency: int,
+        calls_per_minute: int,
+        idle: timedelta,
+        max_tracked: int
+    ):
+        self.refresh = refresh
+        self.ttl = ttl
+        self.lead = lead
+        self.jitter = jitter
+        self.interval = interval
+        self.calls_per_minute = calls_per_minute
+        self.idle = idle
+        self.max_tracked = max_tracked
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._entries: "OrderedDict[Hashable, _TrackedKey]" = OrderedDict()
+        self._window_start = time.monotonic()
+        self._window_calls = 0
+        self._task: Optional["asyncio.Task[None]"] = None
+        self.refreshes = 0
+        self.failures = 0
+        self.skipped_over_budget = 0
+
+    def _refresh_at(self, updated_at: datetime) -> datetime:
+        """根据数据的更新时间计算带随机抖动的刷新时间"""
+        spread = self.jitter.total_seconds() * random.random()
+        return updated_at + self.ttl - self.lead - timedelta(seconds=spread)
+
+    @staticmethod
+    def _updated_at(value: Any) -> Optional[datetime]:
+        """读取数据的最后更新时间"""
+        last_updated = getattr(value, "updated_at", None) or getattr(value, "created_at", None)
+        return last_updated.replace(tzinfo=None) if last_updated else None
+
+    def record_access(self, key: Hashable, value: Any) -> None:
+        """记录一次读取，value为读取到的数据（需带有updated_at或created_at）"""
+        updated_at = self._updated_at(value)
+        if updated_at is None:
+            return
+        entry = self._entries.get(key)
+        if entry is None:
+            self._entries[key] = _TrackedKey(
+                refresh_at=self._refresh_at(updated_at), last_read=time.monotonic()
+            )
+            while len(self._entries) > self.max_tracked:
+                self._entries.popitem(last=False)
+        else:
+            entry.last_read = time.monotonic()
+            self._entries.move_to_end(key)
+
+    def _take_budget(self, wanted: int) -> int:
+        """按每分钟的调用预算取出可用的刷新次数"""
+        now = time.monotonic()
+        if now - self._window_start >= 60:
+            self._window_start = now
+            self._window_calls = 0
+        granted = max(0, min(wanted, self.calls_per_minute - self._window_calls))
+        self._window_calls += granted
+        return granted
+
+    def due_keys(self) -> List[Hashable]:
+        """返回需要刷新的键，按刷新时间排序，同时清理长时间未被读取的键"""
+        now = datetime.utcnow()
+        idle_before = time.monotonic() - self.idle.total_seconds()
+        due = []
+        for key, entry in list(self._entries.items()):
+            if entry.last_read < idle_before:
+                del self._entries[key]
+            elif not entry.refreshing and entry.refresh_at <= now:
+                due.append((entry.refresh_at, key))
+        due.sort(key=lambda item: item[0])
+        return [key for _, key in due]
+
+    async def run_once(self) -> int:
+        """执行一轮刷新，返回本轮刷新的键数量"""
+        due = self.due_keys()
+        granted = self._take_budget(len(due))
+        self.skipped_over_budget += len(due) - granted
+        keys = due[:granted]
+        for key in keys:
+            self._entries[key].refreshing = True
+        await asyncio.gather(*(self._refresh_key(key) for key in keys))
+        return len(keys)
+
+    async def _refresh_key(self, key: Hashable) -> None:
+        """刷新单个键，并根据新的更新时间安排下一次刷新"""
+        try:
+            async with self._semaphore:
+                value = await self.refresh(key)
+        except Exception as e:
+            logger.warning("提前刷新失败: %s: %s", key, e)
+            value = None
+        entry = self._entries.get(key)
+        if entry is None:
+            return
+        entry.refreshing = False
+        updated_at = self._updated_at(value)
+        if updated_at is not None:
+            self.refreshes += 1
+            entry.refresh_at = self._refresh_at(updated_at)
+        else:
+            # 刷新失败时等待半个提前量再重试
+            self.failures += 1
+            entry.refresh_at = datetime.utcnow() + self.lead / 2
+
+    async def _run(self) -> None:
+        """后台循环"""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("提前刷新调度失败")
+
+    def start(self) -> None:
+        """启动后台刷新循环"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        """停止后台刷新循环"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, int]:
+        """返回调度统计信息"""
+        return {
+            "tracked": len(self._entries),
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "skipped_over_budget": self.skipped_over_budget,
+        }
@@ -0,0 +1,258 @@
+import asyncio
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional, TypeVar
+
+import httpx
+
+from app.utils.config import settings
+from app.utils.metrics import UPSTREAM_CIRCUIT_STATE, UPSTREAM_RESILIENCE_EVENTS
+from app.utils.upstream_quota import UpstreamQuota, current_priority, openweathermap_quota
+
+T = TypeVar("T")
+
+# 当前请求的截止时间（time.monotonic()），None表示没有截止时间
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("request_deadline", default=None)
+
+# 熔断器状态及其在指标中的取值
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class UpstreamError(Exception):
+    """上游调用未执行或未在期限内完成"""
+
+
+class DeadlineExceeded(UpstreamError):
+    """请求的时间预算已用完"""
+
+
+class CircuitOpenError(UpstreamError):
+    """熔断器打开，调用被直接拒绝"""
+
+
+class QuotaExceeded(UpstreamError):
+    """上游配额不足，调用被放弃"""
+
+
+@contextmanager
+def request_deadline(budget: Optional[float]) -> Iterator[None]:
+    """在该范围内设置请求的时间预算（秒），None表示不限制
+
+    后台刷新等不属于某个请求的任务会继承创建它的请求的上下文，应以None清除截止时间。
+    """
+    token = _deadline.set(None if budget is None else time.monotonic() + budget)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_budget() -> Optional[float]:
+    """当前请求剩余的时间预算（秒），没有截止时间时返回None"""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def is_upstream_failure(exc: BaseException) -> bool:
+    """判断异常是否说明上游不健康：超时、连接错误、5xx和429计入，其余4xx（如城市不存在）不计入"""
+    if isinstance(exc, httpx.HTTPStatusError):
+        status = exc.response.status_code
+        return status >= 500 or status == 429
+    return isinstance(exc, (httpx.HTTPError, asyncio.TimeoutError))
+
+
+class CircuitBreaker:
+    """熔断器
+
+    连续失败达到failure_threshold次后打开，打开期间的调用直接失败；
+    经过recovery_timeout秒后进入半开状态，只放行一个试探调用，成功则关闭，失败则重新打开。
+    """
+
+    def __init__(self, failure_threshold: int, recovery_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    def current_state(self) -> str:
+        """当前状态，打开时间超过recovery_timeout后视为半开"""
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.recovery_timeout:
+            return HALF_OPEN
+        return self.state
+
+    def allow(self) -> bool:
+        """判断是否放行一次调用，半开状态下同一时刻只放行一个试探调用"""
+        state = self.current_state()
+        if state == CLOSED:
+            return True
+        if state == HALF_OPEN and not self._probing:
+            self.state = HALF_OPEN
+            self._probing = True
+            return True
+        return False
+
+    def reset(self) -> None:
+        """恢复为关闭状态"""
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_success(self) -> None:
+        self.reset()
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        self._probing = False
+        if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+    def release(self) -> None:
+        """放行的调用既未成功也未失败（如被取消）时归还试探名额"""
+        self._probing = False
+
+
+class ResilientUpstream:
+    """上游调用的保护层：截止时间、熔断、配额和对冲请求
+
+    每次调用的超时取UPSTREAM_TIMEOUT_SECONDS与当前请求剩余预算中较小的一个，预算已用完时不再发起调用；
+    熔断器打开时直接失败，由服务层退回使用数据库中的旧数据；
+    配置了quota时，按当前上下文的优先级（upstream_priority）等待配额，等待时间计入请求的时间预算；
+    配置了hedge_after时，调用超过该时长仍未返回就再发起一次相同的调用（有空余配额时），取先完成的结果。
+    失败时抛出原始异常或UpstreamError。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: Optional[int] = None,
+        recovery_timeout: Optional[float] = None,
+        hedge_after: Optional[float] = None,
+        quota: Optional[UpstreamQuota] = None
+    ):
+        self.name = name
+        self.quota = quota
+        self.breaker = CircuitBreaker(
+            settings.CIRCUIT_BREAKER_FAILURE_THRESHOLD if failure_threshold is None else failure_threshold,
+            settings.CIRCUIT_BREAKER_RECOVERY_SECONDS if recovery_timeout is None else recovery_timeout
+        )
+        self.hedge_after = settings.UPSTREAM_HEDGE_AFTER_SECONDS if hedge_after is None else hedge_after
+        self._events = {
+            event: UPSTREAM_RESILIENCE_EVENTS.labels(name, event)
+            for event in ("rejected", "deadline_exceeded", "shed", "timeout", "hedged", "hedge_won")
+        }
+        UPSTREAM_CIRCUIT_STATE.labels(name).set_function(
+            lambda: _STATE_VALUES[self.breaker.current_state()]
+        )
+
+    def _timeout(self) -> float:
+        """本次调用的超时时间"""
+        timeout = settings.UPSTREAM_TIMEOUT_SECONDS
+        remaining = remaining_budget()
+        if remaining is not None:
+            if remaining <= 0:
+                self._events["deadline_exceeded"].inc()
+                raise DeadlineExceeded(f"{self.name}: 请求的时间预算已用完")
+            timeout = min(timeout, remaining)
+        return timeout
+
+    async def call(self, fn: Callable[[], Awaitable[T]]) -> T:
+        """在保护下执行一次上游调用，fn每次被调用都应发起一个新的请求"""
+        timeout = self._timeout()
+        if not self.breaker.allow():
+            self._events["rejected"].inc()
+            raise CircuitOpenError(f"{self.name}: 上游熔断中")
+        try:
+            if self.quota is not None:
+                if not await self.quota.acquire(current_priority(), remaining_budget()):
+                    self._events["shed"].inc()
+                    raise QuotaExceeded(f"{self.name}: 上游配额不足")
+                timeout = self._timeout()
+            result = await asyncio.wait_for(self._hedged(fn), timeout)
+        except (asyncio.CancelledError, UpstreamError):
+            self.breaker.release()
+            raise
+        except Exception as e:
+            if isinstance(e, asyncio.TimeoutError):
+                self._events["timeout"].inc()
+            if is_upstream_failure(e):
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            raise
+        self.breaker.record_success()
+        return result
+
+    async def _hedged(self, fn: Callable[[], Awaitable[T]]) -> T:
+        """第一次调用超过hedge_after仍未完成时发起第二次调用，返回先成功的结果"""
+        if self.hedge_after <= 0:
+            return await fn()
+        tasks = [asyncio.ensure_future(fn())]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_after)
+            if not done and (self.quota is None or self.quota.try_acquire(current_priority())):
+                self._events["hedged"].inc()
+                tasks.append(asyncio.ensure_future(fn()))
+            pending = set(tasks)
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not tasks[0]:
+                            self._events["hedge_won"].inc()
+                        return task.result()
+                if not pending:
+                    # 所有调用都失败，抛出最后一个异常
+                    return done.pop().result()
+        finally:
+            # 返回、失败或被取消（超时）时取消仍在进行的调用
+            for task in tasks:
+                task.cancel()
+
+    def status(self) -> Dict[str, Any]:
+        """熔断器状态，用于健康检查"""
+        state = self.breaker.current_state()
+        status: Dict[str, Any] = {
+            "state": state,
+            "consecutive_failures": self.breaker.consecutive_failures,
+        }
+        if state != CLOSED and self.breaker.opened_at is not None:
+            status["open_for_seconds"] = round(time.monotonic() - self.breaker.opened_at, 1)
+        if self.quota is not None and self.quota.enabled:
+            status["quota"] = self.quota.status()
+        return status
+
+
+class DeadlineMiddleware:
+    """为每个HTTP请求设置REQUEST_BUDGET_SECONDS的时间预算，上游调用的超时不会超过剩余预算"""
+
+    def __init__(self, app: Any):
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        budget = settings.REQUEST_BUDGET_SECONDS
+        if scope["type"] != "http" or budget <= 0:
+            await self.app(scope, receive, send)
+            return
+        with request_deadline(budget):
+            await self.app(scope, receive, send)
+
+
+# 各上游服务的保护层，与upstream_request使用相同的服务名
+weather_upstream = ResilientUpstream("weather", quota=openweathermap_quota)
+forecast_upstream = ResilientUpstream("forecast", quota=openweathermap_quota)
+horoscope_upstream = ResilientUpstream("horoscope")
+
+UPSTREAMS = {upstream.name: upstream for upstream in (weather_upstream, forecast_upstream, horoscope_upstream)}
+
+
+def upstream_status() -> Dict[str, Dict[str, Any]]:
+    """所有上游的熔断器状态"""
+    return {name: upstream.status() for name, upstream in UPSTREAMS.items()}
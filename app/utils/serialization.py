@@ -0,0 +1,125 @@
+import types
+import typing
+from datetime import datetime
+from json.encoder import encode_basestring
+from typing import Any, Callable, Dict, Iterable, List, Type
+
+from fastapi import Response
+from pydantic import BaseModel
+
+# 单个字段值 -> JSON文本
+ValueEncoder = Callable[[Any], str]
+
+_NON_FINITE = frozenset(("nan", "inf", "-inf"))
+
+
+def _encode_float(value: Any) -> str:
+    """与json.dumps相同的浮点数格式，非有限值同样报错"""
+    text = float.__repr__(float(value))
+    if text in _NON_FINITE:
+        raise ValueError("Out of range float values are not JSON compliant")
+    return text
+
+
+def _encode_int(value: Any) -> str:
+    return int.__repr__(int(value))
+
+
+def _encode_bool(value: Any) -> str:
+    return "true" if value else "false"
+
+
+def _encode_datetime(value: datetime) -> str:
+    """与Pydantic的JSON模式相同的时间格式：UTC时区写作Z"""
+    text = value.isoformat()
+    if text.endswith("+00:00"):
+        text = text[:-6] + "Z"
+    return '"' + text + '"'
+
+
+class SchemaEncoder:
+    """按响应模式预先编译的JSON编码器
+
+    编译时为模式生成一个编码函数：每个字段的键前缀是常量，值按字段类型选用固定的编码函数，
+    编码时直接读取对象属性拼接JSON文本，跳过逐请求的模型校验、字典转换和jsonable_encoder。
+    输出与FastAPI默认的response_model + JSONResponse逐字节一致：紧凑分隔符、
+    不转义非ASCII字符、字段按模式定义的顺序输出、exclude的字段不输出。
+    """
+
+    def __init__(self, model: Type[BaseModel]):
+        self.model = model
+        namespace: Dict[str, Any] = {}
+        terms = []
+        for index, (name, field) in enumerate(model.model_fields.items()):
+            if field.exclude:
+                continue
+            key = field.serialization_alias or field.alias or name
+            namespace[f"k{index}"] = ("," if terms else "{") + encode_basestring(key) + ":"
+            namespace[f"v{index}"] = _compile(field.annotation)
+            terms.append(f"k{index} + v{index}(obj.{name})")
+        body = " + ".join(terms) + ' + "}"' if terms else '"{}"'
+        exec(f"def encode(obj):\n    return {body}\n", namespace)
+        self._encode: Callable[[Any], str] = namespace["encode"]
+
+    def encode(self, obj: Any) -> str:
+        """将对象编码为JSON文本，对象可以是ORM实例或任意带有同名属性的模型"""
+        return self._encode(obj)
+
+    def encode_list(self, objs: Iterable[Any]) -> str:
+        """将多个对象编码为JSON数组"""
+        return "[" + ",".join(map(self._encode, objs)) + "]"
+
+
+_encoders: Dict[Type[BaseModel], SchemaEncoder] = {}
+
+
+def encoder_for(model: Type[BaseModel]) -> SchemaEncoder:
+    """获取模式对应的编码器，每个模式只编译一次"""
+    encoder = _encoders.get(model)
+    if encoder is None:
+        encoder = _encoders[model] = SchemaEncoder(model)
+    return encoder
+
+
+def _compile(annotation: Any) -> ValueEncoder:
+    """根据字段类型生成值编码函数"""
+    origin = typing.get_origin(annotation)
+    args = typing.get_args(annotation)
+    if origin in (typing.Union, types.UnionType) and type(None) in args:
+        inner = [arg for arg in args if arg is not type(None)]
+        if len(inner) != 1:
+            raise TypeError(f"不支持的字段类型: {annotation}")
+        encode_inner = _compile(inner[0])
+        return lambda value: "null" if value is None else encode_inner(value)
+    if origin in (list, List):
+        encode_item = _compile(args[0])
+        return lambda value: "[" + ",".join(map(encode_item, value)) + "]"
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return encoder_for(annotation).encode
+    if annotation is str:
+        return encode_basestring
+    if annotation is bool:
+        return _encode_bool
+    if annotation is int:
+        return _encode_int
+    if annotation is float:
+        return _encode_float
+    if annotation is datetime:
+        return _encode_datetime
+    raise TypeError(f"不支持的字段类型: {annotation}")
+
+
+def fast_json_response(model: Type[BaseModel], content: Any, response: Response) -> Response:
+    """使用预编译的编码器生成JSON响应
+
+    content为单个对象或对象列表；response为路由注入的Response，其中已设置的响应头（如ETag）
+    会被带到新的响应中。
+    """
+    encoder = encoder_for(model)
+    if isinstance(content, (list, tuple)):
+        body = encoder.encode_list(content)
+    else:
+        body = encoder.encode(content)
+    fast_response = Response(content=body.encode("utf-8"), media_type="application/json")
+    fast_response.headers.raw.extend(response.headers.raw)
+    return fast_response
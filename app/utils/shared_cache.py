@@ -0,0 +1,380 @@
+import asyncio
+import logging
+import os
+import struct
+import time
+import types
+import typing
+import zlib
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from typing import (
+    Any, AsyncIterator, Callable, Dict, Generic, List, Optional, Sequence, Tuple, Type, TypeVar
+)
+
+from pydantic import BaseModel
+
+from app.utils.cache_backend import CacheBackendError, get_cache_backend
+from app.utils.config import settings
+from app.utils.metrics import SHARED_CACHE_FETCH_LOCKS, SHARED_CACHE_REQUESTS
+from app.utils.resilience import remaining_budget
+
+logger = logging.getLogger(__name__)
+
+M = TypeVar("M", bound=BaseModel)
+
+# 单个字段值写入缓冲区 / 从缓冲区的某个位置读出（值，下一个位置）
+FieldEncoder = Callable[[bytearray, Any], None]
+FieldDecoder = Callable[[bytes, int], Tuple[Any, int]]
+
+# 编码格式的版本，格式变化时修改
+CODEC_VERSION = 1
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+_FLOAT = struct.Struct("<d")
+_HEADER = struct.Struct("<BI")
+
+# 共享缓存后端不可用时抛出的异常，均按未命中处理
+BACKEND_ERRORS = (CacheBackendError, OSError, asyncio.TimeoutError)
+
+
+def _write_varint(out: bytearray, value: int) -> None:
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(buf: bytes, pos: int) -> Tuple[int, int]:
+    result = shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _write_int(out: bytearray, value: int) -> None:
+    # zigzag编码，绝对值小的负数也只占一个字节
+    _write_varint(out, value * 2 if value >= 0 else -value * 2 - 1)
+
+
+def _read_int(buf: bytes, pos: int) -> Tuple[int, int]:
+    value, pos = _read_varint(buf, pos)
+    return (value >> 1) ^ -(value & 1), pos
+
+
+def _write_str(out: bytearray, value: str) -> None:
+    data = value.encode("utf-8")
+    _write_varint(out, len(data))
+    out += data
+
+
+def _read_str(buf: bytes, pos: int) -> Tuple[str, int]:
+    length, pos = _read_varint(buf, pos)
+    end = pos + length
+    if end > len(buf):
+        raise ValueError("数据不完整")
+    return buf[pos:end].decode("utf-8"), end
+
+
+def _write_float(out: bytearray, value: float) -> None:
+    out += _FLOAT.pack(value)
+
+
+def _read_float(buf: bytes, pos: int) -> Tuple[float, int]:
+    return _FLOAT.unpack_from(buf, pos)[0], pos + _FLOAT.size
+
+
+def _write_bool(out: bytearray, value: bool) -> None:
+    out.append(1 if value else 0)
+
+
+def _read_bool(buf: bytes, pos: int) -> Tuple[bool, int]:
+    return bool(buf[pos]), pos + 1
+
+
+def _write_datetime(out: bytearray, value: datetime) -> None:
+    """按距1970年的微秒数保存；带时区的时间转换为UTC，读出时带UTC时区"""
+    if value.tzinfo is None:
+        out.append(0)
+    else:
+        out.append(1)
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    _write_int(out, (value - _EPOCH) // _MICROSECOND)
+
+
+def _read_datetime(buf: bytes, pos: int) -> Tuple[datetime, int]:
+    aware = buf[pos]
+    micros, pos = _read_int(buf, pos + 1)
+    value = _EPOCH + timedelta(microseconds=micros)
+    return (value.replace(tzinfo=timezone.utc) if aware else value), pos
+
+
+_SCALARS: Dict[Any, Tuple[FieldEncoder, FieldDecoder]] = {
+    str: (_write_str, _read_str),
+    int: (_write_int, _read_int),
+    float: (_write_float, _read_float),
+    bool: (_write_bool, _read_bool),
+    datetime: (_write_datetime, _read_datetime),
+}
+
+
+def _compile(annotation: Any) -> Tuple[FieldEncoder, FieldDecoder, str]:
+    """根据字段类型生成值的编码、解码函数以及类型描述（用于计算模式指纹）"""
+    origin = typing.get_origin(annotation)
+    args = typing.get_args(annotation)
+    if origin in (typing.Union, types.UnionType) and type(None) in args:
+        inner = [arg for arg in args if arg is not type(None)]
+        if len(inner) != 1:
+            raise TypeError(f"不支持的字段类型: {annotation}")
+        encode_inner, decode_inner, description = _compile(inner[0])
+
+        def encode_optional(out: bytearray, value: Any) -> None:
+            if value is None:
+                out.append(0)
+            else:
+                out.append(1)
+                encode_inner(out, value)
+
+        def decode_optional(buf: bytes, pos: int) -> Tuple[Any, int]:
+            if not buf[pos]:
+                return None, pos + 1
+            return decode_inner(buf, pos + 1)
+
+        return encode_optional, decode_optional, f"?{description}"
+    if origin in (list, List):
+        encode_item, decode_item, description = _compile(args[0])
+
+        def encode_list(out: bytearray, value: Any) -> None:
+            _write_varint(out, len(value))
+            for item in value:
+                encode_item(out, item)
+
+        def decode_list(buf: bytes, pos: int) -> Tuple[Any, int]:
+            length, pos = _read_varint(buf, pos)
+            items = []
+            for _ in range(length):
+                item, pos = decode_item(buf, pos)
+                items.append(item)
+            return items, pos
+
+        return encode_list, decode_list, f"[{description}]"
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        codec = codec_for(annotation)
+        return codec._encode_fields, codec._decode_fields, codec.description
+    if annotation in _SCALARS:
+        encode, decode = _SCALARS[annotation]
+        return encode, decode, annotation.__name__
+    raise TypeError(f"不支持的字段类型: {annotation}")
+
+
+class BinaryCodec(Generic[M]):
+    """按模式预先编译的紧凑二进制编码器，用于在共享缓存中保存模型实例
+
+    字段按模式定义的顺序依次写入，不保存字段名；整数使用变长编码，浮点数8字节，
+    字符串为长度加UTF-8字节，时间为微秒数。开头是格式版本和模式指纹，
+    模式变化（如滚动升级期间新旧版本同时运行）时旧数据解码为None，按未命中处理。
+    exclude的字段同样保存，解码时跳过校验直接构造模型。
+    """
+
+    def __init__(self, model: Type[M]):
+        self.model = model
+        self._fields: List[Tuple[str, FieldEncoder, FieldDecoder]] = []
+        descriptions = []
+        for name, field in model.model_fields.items():
+            encode, decode, description = _compile(field.annotation)
+            self._fields.append((name, encode, decode))
+            descriptions.append(f"{name}:{description}")
+        self.description = f"{model.__name__}({','.join(descriptions)})"
+        self.fingerprint = zlib.crc32(self.description.encode("utf-8"))
+        self._header = _HEADER.pack(CODEC_VERSION, self.fingerprint)
+
+    def _encode_fields(self, out: bytearray, obj: Any) -> None:
+        for name, encode, _ in self._fields:
+            encode(out, getattr(obj, name))
+
+    def _decode_fields(self, buf: bytes, pos: int) -> Tuple[M, int]:
+        values = {}
+        for name, _, decode in self._fields:
+            values[name], pos = decode(buf, pos)
+        return self.model.model_construct(**values), pos
+
+    def encode(self, obj: Any) -> bytes:
+        """将模型实例（或带有同名属性的对象）编码为字节串"""
+        out = bytearray(self._header)
+        self._encode_fields(out, obj)
+        return bytes(out)
+
+    def decode(self, data: bytes) -> Optional[M]:
+        """解码字节串，版本或模式指纹不符、数据损坏时返回None"""
+        if not data.startswith(self._header):
+            return None
+        try:
+            obj, pos = self._decode_fields(data, _HEADER.size)
+        except (IndexError, ValueError, struct.error):
+            return None
+        return obj if pos == len(data) else None
+
+
+_codecs: Dict[type, BinaryCodec] = {}
+
+
+def codec_for(model: Type[M]) -> BinaryCodec[M]:
+    """获取模式对应的编码器，每个模式只编译一次"""
+    codec = _codecs.get(model)
+    if codec is None:
+        codec = _codecs[model] = BinaryCodec(model)
+    return codec
+
+
+class SharedCache(Generic[M]):
+    """保存在共享缓存后端中的一类数据，供所有工作进程和节点共用
+
+    作为进程内缓存（L1）之后、数据库之前的第二级缓存：键为规范名称，值为二进制编码的模型实例，
+    TTL由调用方按数据剩余的有效时长给出。未配置CACHE_BACKEND_URL时所有操作都是空操作；
+    后端不可用或超时时记录日志并按未命中处理，不影响请求。
+    """
+
+    def __init__(self, name: str, model: Type[M]):
+        self.name = name
+        self.codec = codec_for(model)
+        self._hit = SHARED_CACHE_REQUESTS.labels(name, "hit")
+        self._miss = SHARED_CACHE_REQUESTS.labels(name, "miss")
+        self._error = SHARED_CACHE_REQUESTS.labels(name, "error")
+        self._lock_acquired = SHARED_CACHE_FETCH_LOCKS.labels(name, "acquired")
+        self._lock_waited = SHARED_CACHE_FETCH_LOCKS.labels(name, "waited")
+        self._lock_timeout = SHARED_CACHE_FETCH_LOCKS.labels(name, "timeout")
+
+    def _key(self, key: str) -> str:
+        return f"{settings.CACHE_KEY_PREFIX}{self.name}:{key}"
+
+    def _lock_key(self, key: str) -> str:
+        return f"{settings.CACHE_KEY_PREFIX}lock:{self.name}:{key}"
+
+    def _failed(self, action: str, error: BaseException) -> None:
+        self._error.inc()
+        logger.warning("共享缓存%s失败: %s: %r", action, self.name, error)
+
+    async def get(self, key: str) -> Optional[M]:
+        """获取一个键的值，不存在时返回None"""
+        return (await self.get_many([key])).get(key)
+
+    async def get_many(self, keys: Sequence[str]) -> Dict[str, M]:
+        """一次往返获取多个键，返回存在的键 -> 值"""
+        found = await self._read(keys)
+        if found is not None:
+            self._hit.inc(len(found))
+            self._miss.inc(len(keys) - len(found))
+        return found or {}
+
+    async def _read(self, keys: Sequence[str]) -> Optional[Dict[str, M]]:
+        """读取多个键，不记录命中指标；未配置后端或后端不可用时返回None"""
+        backend = get_cache_backend()
+        if backend is None or not keys:
+            return None
+        try:
+            values = await backend.get_many([self._key(key) for key in keys])
+        except BACKEND_ERRORS as e:
+            self._failed("读取", e)
+            return None
+        found: Dict[str, M] = {}
+        for key, value in zip(keys, values):
+            obj = None if value is None else self.codec.decode(value)
+            if obj is not None:
+                found[key] = obj
+        return found
+
+    async def set(self, key: str, value: M, ttl: float) -> None:
+        await self.set_many([(key, value, ttl)])
+
+    async def set_many(self, items: Sequence[Tuple[str, M, float]]) -> None:
+        """一次往返写入多个（键，值，TTL秒数），TTL不大于0的项不写入"""
+        backend = get_cache_backend()
+        if backend is None:
+            return
+        entries = [(self._key(key), self.codec.encode(value), ttl) for key, value, ttl in items if ttl > 0]
+        if not entries:
+            return
+        try:
+            await backend.set_many(entries)
+        except BACKEND_ERRORS as e:
+            self._failed("写入", e)
+
+    async def delete(self, *keys: str) -> None:
+        """删除键，如数据被修改或删除后"""
+        backend = get_cache_backend()
+        if backend is None or not keys:
+            return
+        try:
+            await backend.delete(*(self._key(key) for key in keys))
+        except BACKEND_ERRORS as e:
+            self._failed("删除", e)
+
+    @asynccontextmanager
+    async def fetch_lock(self, key: str, ttl: Optional[float] = None) -> AsyncIterator[bool]:
+        """请求外部API前在所有进程间去重
+
+        得到True时由本进程请求并写回共享缓存，退出时释放；得到False时其他进程正在请求同一个键，
+        调用方应先用wait_for等待它的结果。锁在ttl秒（默认UPSTREAM_TIMEOUT_SECONDS）后自动过期，
+        持有锁的进程异常退出也不会一直阻塞其他进程；未配置后端或后端不可用时总是得到True。
+        """
+        backend = get_cache_backend()
+        if backend is None:
+            yield True
+            return
+        lock_key = self._lock_key(key)
+        ttl = settings.UPSTREAM_TIMEOUT_SECONDS if ttl is None else ttl
+        # 每次加锁使用随机的值，释放时据此确认锁仍属于本次请求
+        token = os.urandom(16)
+        try:
+            acquired = await backend.add(lock_key, token, ttl)
+        except BACKEND_ERRORS as e:
+            self._failed("加锁", e)
+            acquired = None
+        if not acquired:
+            # 后端不可用时不去重，由本进程请求
+            yield acquired is None
+            return
+        self._lock_acquired.inc()
+        try:
+            yield True
+        finally:
+            # 只删除自己的锁：请求超过ttl时锁已过期，可能已被其他进程获取
+            try:
+                if not await backend.delete_if_equals(lock_key, token):
+                    logger.warning("共享缓存的锁在释放前已过期: %s: %s", self.name, key)
+            except BACKEND_ERRORS as e:
+                self._failed("释放锁", e)
+
+    async def wait_for(
+        self, keys: Sequence[str], ready: Callable[[M], bool], timeout: Optional[float] = None
+    ) -> Dict[str, M]:
+        """等待其他进程把满足ready的值写入共享缓存
+
+        最多等待timeout秒，默认为UPSTREAM_TIMEOUT_SECONDS（即锁的有效期）与当前请求剩余时间预算中较小的一个。
+        返回等到的键 -> 值；超时时返回已满足的部分，调用方自行请求其余的键。
+        """
+        if timeout is None:
+            budget = remaining_budget()
+            timeout = settings.UPSTREAM_TIMEOUT_SECONDS if budget is None else min(
+                settings.UPSTREAM_TIMEOUT_SECONDS, budget
+            )
+        deadline = time.monotonic() + max(timeout, 0.0)
+        found: Dict[str, M] = {}
+        while True:
+            pending = [key for key in keys if key not in found]
+            for key, value in (await self._read(pending) or {}).items():
+                if ready(value):
+                    found[key] = value
+            if len(found) == len(keys):
+                self._lock_waited.inc()
+                return found
+            delay = min(settings.CACHE_FETCH_LOCK_POLL_SECONDS, deadline - time.monotonic())
+            if delay <= 0:
+                self._lock_timeout.inc()
+                return found
+            await asyncio.sleep(delay)
@@ -0,0 +1,58 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """按键合并并发调用
+
+    同一个键同一时刻只执行一次调用，其余并发调用者等待并共享同一个结果（或异常）。
+    调用在独立的任务中执行，单个调用者被取消不会中断其他调用者正在等待的结果。
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, "asyncio.Task[Any]"] = {}
+        self.executions = 0
+        self.shared = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """执行fn，如果同一个键已有进行中的调用则直接等待其结果"""
+        return await asyncio.shield(self.spawn(key, fn))
+
+    def spawn(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> "asyncio.Task[T]":
+        """在后台启动fn而不等待结果，如果同一个键已有进行中的调用则直接复用"""
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            self.executions += 1
+            task.add_done_callback(lambda t: self._forget(key, t))
+        else:
+            self.shared += 1
+        return task
+
+    def _forget(self, key: Hashable, task: "asyncio.Task[Any]") -> None:
+        """调用结束后移除键，并标记异常已被读取以避免告警"""
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()
+
+    def in_flight(self, key: Hashable) -> bool:
+        """判断某个键是否有进行中的调用"""
+        return key in self._calls
+
+    def stats(self) -> Dict[str, int]:
+        """返回合并统计信息"""
+        return {
+            "in_flight": len(self._calls),
+            "executions": self.executions,
+            "shared": self.shared,
+        }
+
+
+# 天气、天气预报与星象数据的刷新合并器
+weather_flight = SingleFlight()
+forecast_flight = SingleFlight()
+horoscope_flight = SingleFlight()
@@ -0,0 +1,181 @@
+import asyncio
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from app.utils.metrics import (
+    SUBSCRIPTION_COALESCED, SUBSCRIPTION_CONNECTIONS, SUBSCRIPTION_REJECTED, SUBSCRIPTION_TOPICS
+)
+
+# 订阅的主题：（类型，规范名称），如("weather", "Beijing")
+Topic = Tuple[str, str]
+
+
+class Subscription:
+    """一个连接的订阅
+
+    每个主题只保留一份尚未发送的变化：客户端接收较慢时，新的变化合并到待发送的变化中
+    （后到的字段覆盖先到的），因此每个连接占用的内存只与订阅的主题数有关，与更新次数无关。
+    """
+
+    def __init__(self):
+        self.topics: Set[Topic] = set()
+        self.closed = False
+        self._pending: Dict[Topic, Dict[str, Any]] = {}
+        self._ready = asyncio.Event()
+
+    def push(self, topic: Topic, changes: Dict[str, Any]) -> None:
+        """加入待发送的变化"""
+        pending = self._pending.get(topic)
+        if pending is None:
+            self._pending[topic] = dict(changes)
+        else:
+            pending.update(changes)
+            SUBSCRIPTION_COALESCED.inc()
+        self._ready.set()
+
+    async def next(self, timeout: float) -> Optional[List[Tuple[Topic, Dict[str, Any]]]]:
+        """等待并取出所有待发送的变化
+
+        timeout秒内没有变化时返回空列表（调用方可以发送心跳），连接关闭后返回None。
+        """
+        if not self._pending and not self.closed:
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        if self.closed:
+            return None
+        self._ready.clear()
+        pending, self._pending = self._pending, {}
+        return list(pending.items())
+
+    def close(self) -> None:
+        """关闭订阅，等待中的next立即返回None"""
+        self.closed = True
+        self._pending.clear()
+        self._ready.set()
+
+
+class SubscriptionHub:
+    """订阅中心，记录每个主题的订阅者和最近一次发布的完整数据
+
+    发布时与上一次的数据逐字段比较，只向订阅者推送变化的字段；新订阅者先收到一次完整数据。
+    没有订阅者的主题不保存数据。所有方法都在事件循环中同步执行，不需要加锁。
+    """
+
+    def __init__(self, max_connections: int):
+        self.max_connections = max_connections
+        self._connections: Set[Subscription] = set()
+        self._subscribers: Dict[Topic, Set[Subscription]] = {}
+        self._state: Dict[Topic, Dict[str, Any]] = {}
+
+    def __len__(self) -> int:
+        return len(self._connections)
+
+    def connect(self) -> Optional[Subscription]:
+        """创建一个连接的订阅，连接数已满时返回None"""
+        if len(self._connections) >= self.max_connections:
+            SUBSCRIPTION_REJECTED.labels("limit").inc()
+            return None
+        subscription = Subscription()
+        self._connections.add(subscription)
+        return subscription
+
+    def disconnect(self, subscription: Subscription) -> None:
+        """连接断开时取消所有订阅，可以重复调用"""
+        self.unsubscribe(subscription, list(subscription.topics))
+        self._connections.discard(subscription)
+        subscription.close()
+
+    def subscribe(self, subscription: Subscription, topics: Iterable[Topic]) -> None:
+        """订阅主题，已有数据的主题立即推送一次完整数据"""
+        for topic in topics:
+            if topic in subscription.topics:
+                continue
+            subscription.topics.add(topic)
+            self._subscribers.setdefault(topic, set()).add(subscription)
+            state = self._state.get(topic)
+            if state is not None:
+                subscription.push(topic, state)
+
+    def unsubscribe(self, subscription: Subscription, topics: Iterable[Topic]) -> None:
+        """取消订阅，没有订阅者的主题同时删除保存的数据"""
+        for topic in topics:
+            subscription.topics.discard(topic)
+            subscribers = self._subscribers.get(topic)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[topic]
+                    self._state.pop(topic, None)
+
+    def topics(self, kind: str) -> List[str]:
+        """某一类型中至少有一个订阅者的主题名称"""
+        return [name for topic_kind, name in self._subscribers if topic_kind == kind]
+
+    def has_state(self, topic: Topic) -> bool:
+        """主题是否已经发布过数据"""
+        return topic in self._state
+
+    def publish(self, topic: Topic, state: Dict[str, Any]) -> Dict[str, Any]:
+        """发布主题的最新完整数据，返回与上一次相比变化的字段，并推送给所有订阅者"""
+        subscribers = self._subscribers.get(topic)
+        if not subscribers:
+            return {}
+        previous = self._state.get(topic)
+        if previous is None:
+            changes = state
+        else:
+            changes = {field: value for field, value in state.items() if previous.get(field) != value}
+        self._state[topic] = state
+        if changes:
+            for subscription in subscribers:
+                subscription.push(topic, changes)
+        return changes
+
+    def export_metrics(self, kinds: Iterable[str]) -> None:
+        """导出连接数和各类型被订阅的主题数"""
+        SUBSCRIPTION_CONNECTIONS.labels().set_function(self.__len__)
+        for kind in kinds:
+            SUBSCRIPTION_TOPICS.labels(kind).set_function(lambda kind=kind: len(self.topics(kind)))
+
+
+class EventStreamResponse(StreamingResponse):
+    """Server-Sent Events响应
+
+    与StreamingResponse相同，但每次发送最多等待send_timeout秒：客户端长时间不接收数据
+    （连接的发送缓冲区已满）时放弃该连接，而不是让待发送的数据无限堆积。
+    连接结束（正常结束、客户端断开或发送超时）时调用on_close。
+    """
+
+    def __init__(self, content: AsyncIterator[bytes], send_timeout: float, on_close: Callable[[], None]):
+        super().__init__(
+            content,
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+        self.send_timeout = send_timeout
+        self.on_close = on_close
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        async def watch_disconnect() -> None:
+            while (await receive())["type"] != "http.disconnect":
+                pass
+            self.on_close()
+
+        watcher = asyncio.ensure_future(watch_disconnect())
+        try:
+            await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+            async for chunk in self.body_iterator:
+                await asyncio.wait_for(
+                    send({"type": "http.response.body", "body": chunk, "more_body": True}), self.send_timeout
+                )
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        except asyncio.TimeoutError:
+            SUBSCRIPTION_REJECTED.labels("slow").inc()
+        finally:
+            watcher.cancel()
+            self.on_close()
+            await self.body_iterator.aclose()
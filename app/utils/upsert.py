@@ -0,0 +1,163 @@
+import sqlite3
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Type, TypeVar
+
+from sqlalchemy import and_, case, insert, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Dialect
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+
+M = TypeVar("M")
+
+# 单条语句最多写入的行数，避免超出数据库的参数个数限制
+UPSERT_CHUNK_SIZE = 500
+
+
+def supports_upsert_returning(dialect: Dialect) -> bool:
+    """数据库是否支持INSERT ... ON CONFLICT DO UPDATE ... RETURNING
+
+    PostgreSQL均支持；SQLite从3.35开始支持RETURNING。
+    """
+    if dialect.name == "postgresql":
+        return True
+    return dialect.name == "sqlite" and sqlite3.sqlite_version_info >= (3, 35)
+
+
+def supports_upsert(dialect: Dialect) -> bool:
+    """数据库是否支持INSERT ... ON CONFLICT DO UPDATE
+
+    PostgreSQL均支持；SQLite从3.24开始支持。
+    """
+    if dialect.name == "postgresql":
+        return True
+    return dialect.name == "sqlite" and sqlite3.sqlite_version_info >= (3, 24)
+
+
+def upsert(
+    db: Session,
+    model: Type[M],
+    rows: Sequence[Dict[str, Any]],
+    key: str,
+    touch: Optional[str] = "updated_at"
+) -> Dict[Any, M]:
+    """按唯一列key批量插入或更新记录，返回key的值 -> 写入后的记录
+
+    支持的数据库上每UPSERT_CHUNK_SIZE行只执行一条INSERT ... ON CONFLICT DO UPDATE ... RETURNING，
+    不需要先查询已有记录、也不需要提交后重新加载；其他数据库退回到查询后逐条更新。
+    已存在的记录更新rows中给出的列，touch列（如updated_at）设为当前时间。
+    在调用方的事务中执行，不单独提交；返回的记录已从会话中移除，提交后读取属性不会再查询数据库。
+    """
+    # 同一条语句中不能两次更新同一行，同一个键以最后一行为准
+    by_key = {row[key]: row for row in rows}
+    if not by_key:
+        return {}
+    if supports_upsert_returning(db.get_bind().dialect):
+        saved = _upsert_returning(db, model, list(by_key.values()), key, touch)
+    else:
+        saved = _upsert_fallback(db, model, by_key, key, touch)
+    for record in saved.values():
+        db.expunge(record)
+    return saved
+
+
+def _upsert_returning(
+    db: Session, model: Type[M], rows: List[Dict[str, Any]], key: str, touch: Optional[str]
+) -> Dict[Any, M]:
+    insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+    columns = {column for row in rows for column in row if column != key}
+    saved: Dict[Any, M] = {}
+    for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+        stmt = insert(model).values(rows[start:start + UPSERT_CHUNK_SIZE])
+        updates = {column: stmt.excluded[column] for column in columns}
+        if touch is not None:
+            updates[touch] = func.now()
+        stmt = stmt.on_conflict_do_update(index_elements=[key], set_=updates).returning(model)
+        # populate_existing让会话中已有的同一条记录也使用RETURNING返回的值
+        for record in db.scalars(stmt, execution_options={"populate_existing": True}):
+            saved[getattr(record, key)] = record
+    return saved
+
+
+def _upsert_fallback(
+    db: Session, model: Type[M], by_key: Dict[Any, Dict[str, Any]], key: str, touch: Optional[str]
+) -> Dict[Any, M]:
+    column = getattr(model, key)
+    keys = list(by_key)
+    existing = {getattr(record, key): record for record in db.query(model).filter(column.in_(keys))}
+    for value, row in by_key.items():
+        record = existing.get(value)
+        if record is None:
+            db.add(model(**row))
+            continue
+        for field, field_value in row.items():
+            setattr(record, field, field_value)
+        if touch is not None:
+            # 内容没有变化时也要更新时间
+            setattr(record, touch, func.now())
+    db.flush()
+    return {
+        getattr(record, key): record
+        for record in db.query(model).filter(column.in_(keys)).populate_existing()
+    }
+
+
+def accumulate(
+    db: Session,
+    model: Type[M],
+    rows: Sequence[Dict[str, Any]],
+    keys: Sequence[str],
+    sums: Sequence[str] = (),
+    minimums: Sequence[str] = (),
+    maximums: Sequence[str] = ()
+) -> None:
+    """按唯一列组合keys批量累加记录：sums中的列相加，minimums/maximums中的列取较小/较大值
+
+    支持的数据库上每UPSERT_CHUNK_SIZE行只执行一条INSERT ... ON CONFLICT DO UPDATE，
+    累加在数据库中完成，多个进程同时写入同一条记录时不会因唯一约束冲突而失败，也不会丢失累加的值；
+    其他数据库退回到逐条UPDATE（同样在数据库中累加），没有更新到记录时再INSERT。
+    rows中同一组键的多行先合并为一行。在调用方的事务中执行，不单独提交。
+    """
+    merged: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
+    for row in rows:
+        row_key = tuple(row[key] for key in keys)
+        current = merged.get(row_key)
+        if current is None:
+            merged[row_key] = dict(row)
+            continue
+        for column in sums:
+            current[column] += row[column]
+        for column in minimums:
+            current[column] = min(current[column], row[column])
+        for column in maximums:
+            current[column] = max(current[column], row[column])
+    if not merged:
+        return
+
+    def merge(values: Any) -> Dict[str, Any]:
+        """已有记录与values合并后的各列"""
+        updates: Dict[str, Any] = {}
+        for column in sums:
+            updates[column] = getattr(model, column) + values[column]
+        for column in minimums:
+            existing = getattr(model, column)
+            updates[column] = case((values[column] < existing, values[column]), else_=existing)
+        for column in maximums:
+            existing = getattr(model, column)
+            updates[column] = case((values[column] > existing, values[column]), else_=existing)
+        return updates
+
+    dialect = db.get_bind().dialect
+    items = list(merged.values())
+    if supports_upsert(dialect):
+        dialect_insert = postgresql.insert if dialect.name == "postgresql" else sqlite.insert
+        for start in range(0, len(items), UPSERT_CHUNK_SIZE):
+            stmt = dialect_insert(model).values(items[start:start + UPSERT_CHUNK_SIZE])
+            stmt = stmt.on_conflict_do_update(index_elements=list(keys), set_=merge(stmt.excluded))
+            db.execute(stmt)
+        return
+
+    for row in items:
+        condition = and_(*(getattr(model, key) == row[key] for key in keys))
+        result = db.execute(update(model).where(condition).values(merge(row)))
+        if result.rowcount == 0:
+            db.execute(insert(model).values(row))
@@ -0,0 +1,198 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import time
+from contextlib import contextmanager
+from enum import IntEnum
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app.utils.config import settings
+from app.utils.metrics import UPSTREAM_QUOTA_QUEUED, UPSTREAM_QUOTA_SHED, UPSTREAM_QUOTA_TOKENS, UPSTREAM_QUOTA_WAIT
+
+
+class Priority(IntEnum):
+    """上游调用的优先级，数值越小越优先"""
+
+    INTERACTIVE = 0  # 用户请求的缓存未命中
+    REFRESH = 1      # 旧数据的后台刷新
+    BULK = 2         # 提前刷新、批量查询等
+
+
+# 当前上下文中上游调用的优先级，默认视为用户请求
+_priority: contextvars.ContextVar[Priority] = contextvars.ContextVar(
+    "upstream_priority", default=Priority.INTERACTIVE
+)
+
+
+@contextmanager
+def upstream_priority(priority: Priority) -> Iterator[None]:
+    """在该范围内以priority发起上游调用"""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> Priority:
+    return _priority.get()
+
+
+class UpstreamQuota:
+    """按上游配额分配调用次数的调度器
+
+    令牌桶每分钟补充calls_per_minute个令牌，最多积累burst个；令牌不足时调用按优先级排队，
+    同一优先级先到先得。低优先级的调用只在令牌数高于为更高优先级保留的数量（reserve，占burst的比例）时才能取得令牌，
+    批量任务持续运行时用户请求仍有可用的配额。
+    每个优先级最多排队max_queue个调用，超出或等待超过max_wait秒的调用被放弃（由调用方退回使用旧数据）。
+    calls_per_minute为0时不限制。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        calls_per_minute: int,
+        burst: int,
+        reserve: Dict[Priority, float],
+        max_wait: Dict[Priority, float],
+        max_queue: int
+    ):
+        self.name = name
+        self.rate = calls_per_minute / 60
+        self.capacity = float(max(burst, 1))
+        self.reserve = {priority: reserve.get(priority, 0.0) * self.capacity for priority in Priority}
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._queued = {priority: 0 for priority in Priority}
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._wait = {priority: UPSTREAM_QUOTA_WAIT.labels(name, priority.name.lower()) for priority in Priority}
+        self._shed = {priority: UPSTREAM_QUOTA_SHED.labels(name, priority.name.lower()) for priority in Priority}
+        for priority in Priority:
+            UPSTREAM_QUOTA_QUEUED.labels(name, priority.name.lower()).set_function(
+                lambda priority=priority: self._queued[priority]
+            )
+        UPSTREAM_QUOTA_TOKENS.labels(name).set_function(self.available)
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def available(self) -> float:
+        """当前可用的令牌数"""
+        self._refill()
+        return self.tokens
+
+    def reset(self) -> None:
+        """放弃所有排队的调用并装满令牌桶"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        for _, _, future in self._waiters:
+            future.cancel()
+        self._waiters.clear()
+        self._queued = {priority: 0 for priority in Priority}
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, priority: Priority) -> bool:
+        """不等待地取一个令牌，有同级或更高优先级的调用在排队时不取"""
+        if not self.enabled:
+            return True
+        self._refill()
+        if self._has_waiters_before(priority) or self.tokens < 1 + self.reserve[priority]:
+            return False
+        self.tokens -= 1
+        return True
+
+    def _has_waiters_before(self, priority: Priority) -> bool:
+        while self._waiters and self._waiters[0][2].done():
+            heapq.heappop(self._waiters)
+        return bool(self._waiters) and self._waiters[0][0] <= priority
+
+    async def acquire(self, priority: Priority, timeout: Optional[float] = None) -> bool:
+        """等待一个令牌，最多等待该优先级的max_wait与timeout中较短的时间，放弃时返回False"""
+        if self.try_acquire(priority):
+            self._wait[priority].observe(0.0)
+            return True
+        wait = self.max_wait.get(priority, 0.0)
+        if timeout is not None:
+            wait = min(wait, timeout)
+        if wait <= 0 or self._queued[priority] >= self.max_queue:
+            self._shed[priority].inc()
+            return False
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        self._queued[priority] += 1
+        started = time.monotonic()
+        self._dispatch()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), wait)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            if not future.done():
+                # 超时或调用方被取消，留在堆中的记录在轮到它时被跳过
+                future.cancel()
+                self._queued[priority] -= 1
+        if future.cancelled():
+            self._shed[priority].inc()
+            return False
+        self._wait[priority].observe(time.monotonic() - started)
+        return True
+
+    def _dispatch(self) -> None:
+        """按优先级把令牌分给排队的调用，令牌不足时在下一个令牌可用时再分配"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._refill()
+        while self._waiters:
+            priority, _, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            needed = 1 + self.reserve[priority]
+            if self.tokens < needed:
+                delay = (needed - self.tokens) / self.rate
+                self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+                return
+            heapq.heappop(self._waiters)
+            self.tokens -= 1
+            self._queued[priority] -= 1
+            future.set_result(None)
+
+    def status(self) -> Dict[str, Any]:
+        """令牌和排队情况，用于健康检查"""
+        return {
+            "tokens": round(self.available(), 1) if self.enabled else None,
+            "queued": {priority.name.lower(): count for priority, count in self._queued.items() if count},
+        }
+
+
+# OpenWeatherMap的天气和预报接口共用一个账号的配额
+openweathermap_quota = UpstreamQuota(
+    "openweathermap",
+    calls_per_minute=settings.UPSTREAM_CALLS_PER_MINUTE,
+    burst=settings.UPSTREAM_QUOTA_BURST,
+    reserve={
+        Priority.REFRESH: settings.UPSTREAM_QUOTA_REFRESH_RESERVE,
+        Priority.BULK: settings.UPSTREAM_QUOTA_BULK_RESERVE,
+    },
+    max_wait={
+        Priority.INTERACTIVE: settings.UPSTREAM_QUOTA_INTERACTIVE_MAX_WAIT_SECONDS,
+        Priority.REFRESH: settings.UPSTREAM_QUOTA_REFRESH_MAX_WAIT_SECONDS,
+        Priority.BULK: settings.UPSTREAM_QUOTA_BULK_MAX_WAIT_SECONDS,
+    },
+    max_queue=settings.UPSTREAM_QUOTA_MAX_QUEUE
+)
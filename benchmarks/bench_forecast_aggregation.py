@@ -0,0 +1,114 @@
+"""天气预报聚合基准测试
+
+生成大规模的合成预报数据，比较按列归约的实现与改写前逐条目追加到每日分组的实现（baseline），
+以及逐城市聚合与一次聚合多个城市的耗时：
+
+    python -m benchmarks.bench_forecast_aggregation --cities 2000 --days 5
+"""
+import argparse
+import random
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, List, Sequence, Tuple
+
+from app.schemas.weather import ForecastDay, WeatherForecast
+from app.services.forecast_aggregation import aggregate_forecasts
+
+DESCRIPTIONS = [("晴", "01d"), ("多云", "02d"), ("阴", "04d"), ("小雨", "10d"), ("雪", "13d")]
+
+
+def make_payload(city: str, days: int, rng: random.Random) -> dict:
+    """生成一个城市的合成3小时预报响应"""
+    start = datetime(2023, 12, 4)
+    items = []
+    for slot in range(days * 8):
+        temp = rng.uniform(-10, 35)
+        description, icon = rng.choice(DESCRIPTIONS)
+        items.append({
+            "dt_txt": (start + timedelta(hours=3 * slot)).strftime("%Y-%m-%d %H:%M:%S"),
+            "main": {
+                "temp": temp,
+                "temp_min": temp - rng.uniform(0, 2),
+                "temp_max": temp + rng.uniform(0, 2),
+                "humidity": rng.randint(10, 100)
+            },
+            "wind": {"speed": rng.uniform(0, 15)},
+            "weather": [{"description": description, "icon": icon}]
+        })
+    return {"city": {"name": city, "country": "CN"}, "list": items}
+
+
+def baseline_aggregate_forecasts(api_responses: Sequence[dict]) -> List[WeatherForecast]:
+    """改写前的实现：逐条目追加到按（城市，日期）分组的列表，再逐组归约，用于对比"""
+    groups: Dict[Tuple[int, str], Dict[str, list]] = {}
+    for index, api_response in enumerate(api_responses):
+        for item in api_response["list"]:
+            date = item["dt_txt"][:10]
+            columns = groups.get((index, date))
+            if columns is None:
+                columns = groups[(index, date)] = {
+                    "temp": [], "temp_min": [], "temp_max": [], "humidity": [], "wind": [], "weather": []
+                }
+            main = item["main"]
+            temp_min = main["temp_min"]
+            temp_max = main["temp_max"]
+            columns["temp"].append(main.get("temp", (temp_min + temp_max) / 2))
+            columns["temp_min"].append(temp_min)
+            columns["temp_max"].append(temp_max)
+            columns["humidity"].append(main["humidity"])
+            columns["wind"].append(item["wind"]["speed"])
+            weather = item["weather"][0]
+            columns["weather"].append((weather["description"], weather["icon"]))
+
+    daily: List[List[ForecastDay]] = [[] for _ in api_responses]
+    for (index, date), columns in sorted(groups.items()):
+        description, icon = Counter(columns["weather"]).most_common(1)[0][0]
+        daily[index].append(ForecastDay(
+            date=date,
+            temperature_min=min(columns["temp_min"]),
+            temperature_max=max(columns["temp_max"]),
+            temperature_avg=round(sum(columns["temp"]) / len(columns["temp"]), 2),
+            humidity=round(sum(columns["humidity"]) / len(columns["humidity"])),
+            wind_speed=max(columns["wind"]),
+            description=description,
+            icon=icon
+        ))
+    return [
+        WeatherForecast(city=api_response["city"]["name"], country=api_response["city"]["country"], forecast=days)
+        for api_response, days in zip(api_responses, daily)
+    ]
+
+
+def run(cities: int, days: int, repeat: int) -> None:
+    rng = random.Random(42)
+    payloads = [make_payload(f"城市{index}", days, rng) for index in range(cities)]
+    slots = cities * days * 8
+
+    assert aggregate_forecasts(payloads) == baseline_aggregate_forecasts(payloads)
+
+    timings = {}
+    for name, fn in [
+        ("baseline 逐城市聚合", lambda: [baseline_aggregate_forecasts([payload]) for payload in payloads]),
+        ("baseline 批量聚合", lambda: baseline_aggregate_forecasts(payloads)),
+        ("按列归约 逐城市聚合", lambda: [aggregate_forecasts([payload]) for payload in payloads]),
+        ("按列归约 批量聚合", lambda: aggregate_forecasts(payloads)),
+    ]:
+        best = float("inf")
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - started)
+        timings[name] = best
+
+    for name, seconds in timings.items():
+        print(f"{name}: {seconds * 1000:.1f} ms, {slots / seconds:,.0f} 条/秒")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="天气预报聚合基准测试")
+    parser.add_argument("--cities", type=int, default=1000, help="城市数量")
+    parser.add_argument("--days", type=int, default=5, help="每个城市的预报天数")
+    parser.add_argument("--repeat", type=int, default=5, help="重复次数，取最快一次")
+    args = parser.parse_args()
+    run(args.cities, args.days, args.repeat)
@@ -0,0 +1,88 @@
+"""响应序列化基准测试
+
+比较FastAPI默认的response_model序列化（模型校验 + jsonable_encoder + json.dumps）
+与预编译编码器生成同样响应体的吞吐量：
+
+    python -m benchmarks.bench_serialization --count 20000
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from app.schemas.horoscope import HoroscopeInDB, HoroscopeResponse, TodayHoroscope
+from app.schemas.weather import ForecastDay, WeatherForecast, WeatherInDB, WeatherResponse
+from app.utils.serialization import encoder_for
+
+
+def make_samples():
+    """生成各响应模式的示例数据（与服务层返回的快照类型相同）"""
+    weather = WeatherInDB(
+        id=1, city="北京", country="CN", temperature=25.5, humidity=60, wind_speed=3.5,
+        description="晴", icon="01d", created_at=datetime(2024, 1, 1, 8, 0, 0)
+    )
+    forecast = WeatherForecast(city="北京", country="CN", forecast=[
+        ForecastDay(date=f"2024-01-0{day}", temperature_min=-3.5, temperature_max=4.0, temperature_avg=0.25,
+                    humidity=40, wind_speed=5.5, description="晴", icon="01d")
+        for day in range(1, 8)
+    ])
+    horoscope = HoroscopeInDB(
+        id=1, sign="白羊座", date_range="3月21日-4月19日",
+        today="白羊座今日运势：整体运势良好，工作顺利，感情稳定。",
+        tomorrow="白羊座明日运势：运势一般，需要注意人际关系。",
+        week="白羊座本周运势：本周整体运势上升，适合开展新项目。",
+        month="白羊座本月运势：本月运势平稳，财运不错。",
+        year="白羊座本年运势：本年运势起伏较大，需要注意健康。",
+        created_at=datetime(2024, 1, 1, 8, 0, 0)
+    )
+    return [
+        ("WeatherResponse", WeatherResponse, weather),
+        ("WeatherForecast(7天)", WeatherForecast, forecast),
+        ("HoroscopeResponse", HoroscopeResponse, horoscope),
+        ("TodayHoroscope", TodayHoroscope, horoscope),
+    ]
+
+
+def measure(fn, count: int, repeat: int) -> float:
+    """返回最快一次的每秒次数"""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(count):
+            fn()
+        best = min(best, time.perf_counter() - started)
+    return count / best
+
+
+def run(count: int, repeat: int) -> None:
+    loop = asyncio.new_event_loop()
+    for name, model, content in make_samples():
+        field = create_response_field(name="response", type_=model)
+        encoder = encoder_for(model)
+
+        def default():
+            serialized = loop.run_until_complete(
+                serialize_response(field=field, response_content=content, is_coroutine=True)
+            )
+            return JSONResponse(serialized).body
+
+        def fast():
+            return encoder.encode(content).encode("utf-8")
+
+        assert default() == fast(), name
+        before = measure(default, count, repeat)
+        after = measure(fast, count, repeat)
+        print(f"{name}: 默认 {before:,.0f} 次/秒，预编译 {after:,.0f} 次/秒，提升 {after / before:.1f} 倍")
+    loop.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="响应序列化基准测试")
+    parser.add_argument("--count", type=int, default=20000, help="每轮序列化次数")
+    parser.add_argument("--repeat", type=int, default=3, help="重复次数，取最快一次")
+    args = parser.parse_args()
+    run(args.count, args.repeat)
@@ -0,0 +1,157 @@
+"""模拟的Redis共享缓存
+
+用asyncio实现的最小RESP服务端，支持共享缓存后端用到的PING、AUTH、SELECT、GET、MGET、
+SET（EX/PX/NX）、DEL，以及执行释放锁脚本的EVAL（不执行任意Lua脚本），数据只保存在内存中。
+用于测试RespCacheBackend，以及在没有Redis的环境中对多个工作进程做负载测试：
+
+    python -m benchmarks.fake_redis --port 6380
+
+被测应用配置 CACHE_BACKEND_URL=redis://127.0.0.1:6380/0 即可。
+"""
+import argparse
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from app.utils.cache_backend import COMPARE_AND_DELETE_SCRIPT
+
+
+class FakeRedis:
+    """模拟的Redis服务端，记录收到的命令（commands），delay为每条命令回复前的延迟"""
+
+    def __init__(self, password: Optional[str] = None):
+        self.password = password
+        self.data: Dict[bytes, Tuple[Optional[float], bytes]] = {}
+        self.commands: List[List[bytes]] = []
+        self.delay = 0.0
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections: Set["asyncio.Task[None]"] = set()
+        self.port = 0
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> "FakeRedis":
+        self._server = await asyncio.start_server(self._handle, host, port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self) -> None:
+        """停止监听并断开所有客户端连接"""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        for task in self._connections:
+            task.cancel()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+
+    @property
+    def url(self) -> str:
+        auth = f":{self.password}@" if self.password else ""
+        return f"redis://{auth}127.0.0.1:{self.port}/0"
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        authenticated = self.password is None
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while True:
+                command = await self._read_command(reader)
+                if command is None:
+                    return
+                reply = self._execute(command, authenticated)
+                if command[0].upper() == b"AUTH" and reply == b"+OK\r\n":
+                    authenticated = True
+                if self.delay:
+                    await asyncio.sleep(self.delay)
+                writer.write(reply)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    @staticmethod
+    async def _read_command(reader: asyncio.StreamReader) -> Optional[List[bytes]]:
+        line = await reader.readline()
+        if not line:
+            return None
+        count = int(line[1:-2])
+        args = []
+        for _ in range(count):
+            length = int((await reader.readline())[1:-2])
+            args.append((await reader.readexactly(length + 2))[:-2])
+        return args
+
+    def _get(self, key: bytes) -> Optional[bytes]:
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self.data[key]
+            return None
+        return value
+
+    def _execute(self, command: List[bytes], authenticated: bool) -> bytes:
+        self.commands.append(command)
+        name, args = command[0].upper(), command[1:]
+        if name == b"AUTH":
+            return b"+OK\r\n" if args[-1].decode() == self.password else b"-WRONGPASS invalid password\r\n"
+        if not authenticated:
+            return b"-NOAUTH Authentication required.\r\n"
+        if name == b"PING":
+            return b"+PONG\r\n"
+        if name == b"SELECT":
+            return b"+OK\r\n"
+        if name == b"GET":
+            return _bulk(self._get(args[0]))
+        if name == b"MGET":
+            return b"*%d\r\n" % len(args) + b"".join(_bulk(self._get(key)) for key in args)
+        if name == b"SET":
+            return self._set(args)
+        if name == b"DEL":
+            deleted = sum(self.data.pop(key, None) is not None for key in args)
+            return b":%d\r\n" % deleted
+        if name == b"EVAL":
+            return self._eval(args)
+        return b"-ERR unknown command '%s'\r\n" % name
+
+    def _eval(self, args: List[bytes]) -> bytes:
+        script, key, value = args[0].decode(), args[2], args[3]
+        if script != COMPARE_AND_DELETE_SCRIPT:
+            return b"-ERR unsupported script\r\n"
+        if self._get(key) != value:
+            return b":0\r\n"
+        del self.data[key]
+        return b":1\r\n"
+
+    def _set(self, args: List[bytes]) -> bytes:
+        key, value, options = args[0], args[1], [arg.upper() for arg in args[2:]]
+        expires_at = None
+        for unit, scale in ((b"EX", 1.0), (b"PX", 0.001)):
+            if unit in options:
+                expires_at = time.monotonic() + int(options[options.index(unit) + 1]) * scale
+        if b"NX" in options and self._get(key) is not None:
+            return b"$-1\r\n"
+        self.data[key] = (expires_at, value)
+        return b"+OK\r\n"
+
+
+def _bulk(value: Any) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+async def _serve(host: str, port: int, password: Optional[str]) -> None:
+    server = await FakeRedis(password).start(host, port)
+    print(f"模拟的Redis已启动: redis://{host}:{server.port}/0")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="模拟的Redis共享缓存")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6380)
+    parser.add_argument("--password", default=None)
+    args = parser.parse_args()
+    asyncio.run(_serve(args.host, args.port, args.password))
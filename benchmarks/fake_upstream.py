@@ -0,0 +1,208 @@
+"""模拟的OpenWeatherMap上游
+
+提供与OpenWeatherMap相同路径和响应结构的/data/2.5/weather和/data/2.5/forecast接口，
+可以配置响应延迟的分布、错误率和限流，用于在不访问真实API的情况下对整个应用做负载测试。
+既可以在负载测试进程内通过httpx.ASGITransport直接调用，也可以单独启动：
+
+    python -m benchmarks.fake_upstream --port 9000 --latency-ms 80 --error-rate 0.01 --rate-limit 50
+
+单独启动时，被测应用配置 WEATHER_API_BASE_URL=http://127.0.0.1:9000/data/2.5 即可。
+"""
+import argparse
+import asyncio
+import math
+import random
+import time
+import zlib
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from fastapi import FastAPI, Query
+from fastapi.responses import JSONResponse
+
+# 城市名以该前缀开头时返回404，模拟不存在的城市
+UNKNOWN_CITY_PREFIX = "unknown"
+
+DESCRIPTIONS = [("晴", "01d"), ("多云", "02d"), ("阴", "04d"), ("小雨", "10d"), ("雪", "13d")]
+
+
+@dataclass
+class UpstreamProfile:
+    """模拟上游的行为配置
+
+    延迟服从对数正态分布：latency_ms为中位数，latency_sigma越大长尾越重，0表示固定延迟。
+    rate_limit为每秒允许的请求数（令牌桶，容量为rate_burst），超出时返回429，0表示不限流。
+    """
+    latency_ms: float = 50.0
+    latency_sigma: float = 0.5
+    error_rate: float = 0.0
+    rate_limit: float = 0.0
+    rate_burst: int = 10
+    forecast_days: int = 5
+    seed: Optional[int] = None
+
+
+class _TokenBucket:
+    """按固定速率补充令牌的令牌桶"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+
+    def try_acquire(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+def _city_rng(city: str) -> random.Random:
+    """同一城市每次生成相同的数据"""
+    return random.Random(zlib.crc32(city.encode("utf-8")))
+
+
+def _city_weather(city: str) -> dict:
+    """生成某个城市的当前天气响应"""
+    rng = _city_rng(city)
+    description, icon = rng.choice(DESCRIPTIONS)
+    temperature = round(rng.uniform(-10, 35), 2)
+    return {
+        "coord": {"lon": round(rng.uniform(-180, 180), 4), "lat": round(rng.uniform(-90, 90), 4)},
+        "weather": [{"id": 800, "main": "Clear", "description": description, "icon": icon}],
+        "base": "stations",
+        "main": {
+            "temp": temperature, "feels_like": temperature, "temp_min": temperature - 1,
+            "temp_max": temperature + 1, "pressure": 1012, "humidity": rng.randint(10, 100)
+        },
+        "visibility": 10000,
+        "wind": {"speed": round(rng.uniform(0, 15), 2), "deg": rng.randint(0, 359)},
+        "clouds": {"all": rng.randint(0, 100)},
+        "dt": int(time.time()),
+        "sys": {"country": "CN"},
+        "timezone": 28800,
+        "id": zlib.crc32(city.encode("utf-8")),
+        "name": city,
+        "cod": 200
+    }
+
+
+def _city_forecast(city: str, days: int) -> dict:
+    """生成某个城市从今天开始days天、每3小时一条的天气预报响应"""
+    rng = _city_rng(city)
+    start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    items = []
+    for slot in range(days * 8):
+        temp = rng.uniform(-10, 35)
+        description, icon = rng.choice(DESCRIPTIONS)
+        items.append({
+            "dt": int((start + timedelta(hours=3 * slot)).timestamp()),
+            "dt_txt": (start + timedelta(hours=3 * slot)).strftime("%Y-%m-%d %H:%M:%S"),
+            "main": {
+                "temp": temp,
+                "temp_min": temp - rng.uniform(0, 2),
+                "temp_max": temp + rng.uniform(0, 2),
+                "humidity": rng.randint(10, 100)
+            },
+            "wind": {"speed": rng.uniform(0, 15)},
+            "weather": [{"description": description, "icon": icon}]
+        })
+    return {"cod": "200", "cnt": len(items), "list": items, "city": {"name": city, "country": "CN"}}
+
+
+class FakeUpstream:
+    """模拟上游的状态：延迟与错误的随机数、限流令牌桶以及按（接口，状态码）统计的请求数"""
+
+    def __init__(self, profile: UpstreamProfile):
+        self.profile = profile
+        self.rng = random.Random(profile.seed)
+        self.bucket = _TokenBucket(profile.rate_limit, profile.rate_burst) if profile.rate_limit > 0 else None
+        self.calls: Counter = Counter()
+
+    def latency(self) -> float:
+        """抽取一次响应延迟（秒）"""
+        median = self.profile.latency_ms / 1000
+        if self.profile.latency_sigma <= 0:
+            return median
+        return median * math.exp(self.rng.gauss(0, self.profile.latency_sigma))
+
+    async def respond(self, endpoint: str, city: str) -> JSONResponse:
+        """按配置的限流、延迟和错误率生成一次响应"""
+        if self.bucket is not None and not self.bucket.try_acquire():
+            return self._reply(endpoint, 429, {"cod": 429, "message": "rate limit exceeded"}, {"Retry-After": "1"})
+        await asyncio.sleep(self.latency())
+        if self.rng.random() < self.profile.error_rate:
+            return self._reply(endpoint, 500, {"cod": 500, "message": "internal error"})
+        if city.casefold().startswith(UNKNOWN_CITY_PREFIX):
+            return self._reply(endpoint, 404, {"cod": "404", "message": "city not found"})
+        if endpoint == "weather":
+            return self._reply(endpoint, 200, _city_weather(city))
+        return self._reply(endpoint, 200, _city_forecast(city, self.profile.forecast_days))
+
+    def _reply(self, endpoint: str, status: int, content: dict, headers: Optional[Dict[str, str]] = None) -> JSONResponse:
+        self.calls[(endpoint, status)] += 1
+        return JSONResponse(content, status_code=status, headers=headers)
+
+    def stats(self) -> Dict[str, int]:
+        """按“接口 状态码”汇总的请求数"""
+        return {f"{endpoint} {status}": count for (endpoint, status), count in sorted(self.calls.items())}
+
+
+def create_fake_upstream(profile: Optional[UpstreamProfile] = None) -> Tuple[FastAPI, FakeUpstream]:
+    """创建模拟上游应用，返回（ASGI应用，状态对象）"""
+    upstream = FakeUpstream(profile or UpstreamProfile())
+    app = FastAPI(title="Fake OpenWeatherMap", docs_url=None, redoc_url=None)
+
+    @app.get("/data/2.5/weather")
+    async def weather(q: str = Query(...)):
+        return await upstream.respond("weather", q)
+
+    @app.get("/data/2.5/forecast")
+    async def forecast(q: str = Query(...)):
+        return await upstream.respond("forecast", q)
+
+    @app.get("/stats")
+    async def stats():
+        return upstream.stats()
+
+    return app, upstream
+
+
+def add_profile_arguments(parser: argparse.ArgumentParser) -> None:
+    """添加模拟上游行为的命令行参数，负载测试脚本共用"""
+    defaults = UpstreamProfile()
+    parser.add_argument("--latency-ms", type=float, default=defaults.latency_ms, help="响应延迟的中位数（毫秒）")
+    parser.add_argument("--latency-sigma", type=float, default=defaults.latency_sigma, help="对数正态延迟的sigma，0为固定延迟")
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate, help="返回500的比例")
+    parser.add_argument("--rate-limit", type=float, default=defaults.rate_limit, help="每秒允许的请求数，超出返回429，0为不限流")
+    parser.add_argument("--rate-burst", type=int, default=defaults.rate_burst, help="限流令牌桶的容量")
+    parser.add_argument("--seed", type=int, default=None, help="随机数种子")
+
+
+def profile_from_args(args: argparse.Namespace) -> UpstreamProfile:
+    return UpstreamProfile(
+        latency_ms=args.latency_ms,
+        latency_sigma=args.latency_sigma,
+        error_rate=args.error_rate,
+        rate_limit=args.rate_limit,
+        rate_burst=args.rate_burst,
+        seed=args.seed
+    )
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="模拟的OpenWeatherMap上游")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    fake_app, _ = create_fake_upstream(profile_from_args(args))
+    uvicorn.run(fake_app, host=args.host, port=args.port, log_level="warning")
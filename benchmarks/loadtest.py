@@ -0,0 +1,275 @@
+"""端到端负载测试
+
+按配置的比例混合发送天气、天气预报、趣味分析和星座运势请求，城市的热度服从Zipf分布，
+统计吞吐量、各类请求的p50/p95/p99延迟、状态码以及应用调用上游的次数。
+
+默认在同一进程内运行应用（app.main:app）和模拟上游，不需要网络，也不需要启动服务：
+
+    python -m benchmarks.loadtest --duration 30 --concurrency 16 --cities 500 --latency-ms 80
+
+也可以压测已部署的应用，此时应用应配置 WEATHER_API_BASE_URL 指向单独启动的模拟上游
+（python -m benchmarks.fake_upstream），以免消耗真实API的配额：
+
+    python -m benchmarks.loadtest --target http://127.0.0.1:8000 --upstream http://127.0.0.1:9000
+
+进程内模式下应用、模拟上游和压测客户端共用一个事件循环，结果适合比较不同版本或配置；
+用于容量规划时应使用--target压测按生产方式部署的应用。
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from itertools import accumulate
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+
+# 进程内模式默认使用临时的SQLite数据库，应用配置中的必填项给出默认值
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.gettempdir()}/stellar_weather_loadtest.db")
+os.environ.setdefault("SECRET_KEY", "loadtest")
+# 上游出错时的日志会淹没结果输出
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+# 模拟上游没有配额，需要观察配额调度时可显式设置UPSTREAM_CALLS_PER_MINUTE
+os.environ.setdefault("UPSTREAM_CALLS_PER_MINUTE", "0")
+
+from benchmarks.fake_upstream import add_profile_arguments, create_fake_upstream, profile_from_args  # noqa: E402
+
+# 各类请求的默认占比
+DEFAULT_MIX = {"weather": 0.55, "forecast": 0.15, "analysis": 0.2, "horoscope": 0.08, "horoscope_all": 0.02}
+
+ZODIAC_SIGNS = [
+    "白羊座", "金牛座", "双子座", "巨蟹座", "狮子座", "处女座",
+    "天秤座", "天蝎座", "射手座", "摩羯座", "水瓶座", "双鱼座"
+]
+
+# /metrics中上游调用次数的行，如 upstream_requests_total{service="weather",outcome="success"} 12
+_UPSTREAM_METRIC = re.compile(r'^upstream_requests_total\{service="([^"]*)",outcome="([^"]*)"\} (\S+)$', re.M)
+
+
+class ZipfSampler:
+    """按Zipf分布抽取排名：排名为k的概率与1/k^s成正比，少数热门城市占大部分请求"""
+
+    def __init__(self, n: int, s: float, rng: random.Random):
+        self.rng = rng
+        self._cumulative = list(accumulate(1 / rank ** s for rank in range(1, n + 1)))
+
+    def sample(self) -> int:
+        """返回0起始的排名"""
+        return bisect_left(self._cumulative, self.rng.random() * self._cumulative[-1])
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    """解析形如weather=0.6,analysis=0.4的请求占比"""
+    mix = {}
+    for item in text.split(","):
+        kind, _, weight = item.partition("=")
+        kind = kind.strip()
+        if kind not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"未知的请求类型: {kind}，可选: {', '.join(DEFAULT_MIX)}")
+        mix[kind] = float(weight)
+    return mix
+
+
+class TrafficGenerator:
+    """生成混合请求的路径"""
+
+    def __init__(self, mix: Dict[str, float], cities: int, zipf_s: float, seed: Optional[int] = None):
+        self.rng = random.Random(seed)
+        self.kinds = list(mix)
+        self._cumulative = list(accumulate(mix[kind] for kind in self.kinds))
+        self.cities = [f"City{rank:05d}" for rank in range(cities)]
+        self.zipf = ZipfSampler(cities, zipf_s, self.rng)
+
+    def next_request(self) -> Tuple[str, str]:
+        """返回（请求类型，路径）"""
+        kind = self.kinds[bisect_left(self._cumulative, self.rng.random() * self._cumulative[-1])]
+        city = self.cities[self.zipf.sample()]
+        sign = self.rng.choice(ZODIAC_SIGNS)
+        if kind == "weather":
+            return kind, f"/api/weather/{city}"
+        if kind == "forecast":
+            return kind, f"/api/weather/forecast/{city}"
+        if kind == "analysis":
+            return kind, f"/api/analysis/{city}/{sign}"
+        if kind == "horoscope":
+            return kind, f"/api/horoscope/{sign}/today"
+        return kind, "/api/horoscope/all/today"
+
+
+def percentile(sorted_values: Sequence[float], p: float) -> float:
+    """最近秩法计算百分位数，sorted_values需已排序"""
+    if not sorted_values:
+        return 0.0
+    rank = math.ceil(p / 100 * len(sorted_values))
+    return sorted_values[min(max(rank, 1), len(sorted_values)) - 1]
+
+
+def upstream_calls(metrics_text: str) -> Counter:
+    """从Prometheus文本中读取按（服务，结果）统计的上游调用次数"""
+    return Counter({
+        f"{service} {outcome}": float(value)
+        for service, outcome, value in _UPSTREAM_METRIC.findall(metrics_text)
+    })
+
+
+async def drive(
+    client: httpx.AsyncClient,
+    traffic: TrafficGenerator,
+    concurrency: int,
+    duration: float,
+    max_requests: Optional[int] = None
+) -> Dict[str, Any]:
+    """以concurrency个并发连接持续发送请求，直到达到duration秒或max_requests个请求"""
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    statuses: Counter = Counter()
+    sent = 0
+    deadline = time.perf_counter() + duration
+
+    async def worker() -> None:
+        nonlocal sent
+        while time.perf_counter() < deadline and (max_requests is None or sent < max_requests):
+            sent += 1
+            kind, path = traffic.next_request()
+            started = time.perf_counter()
+            try:
+                response = await client.get(path)
+                status = str(response.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies[kind].append(time.perf_counter() - started)
+            statuses[f"{kind} {status}"] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return summarize(latencies, statuses, elapsed)
+
+
+def summarize(latencies: Dict[str, List[float]], statuses: Counter, elapsed: float) -> Dict[str, Any]:
+    """汇总吞吐量和各类请求的延迟分布（毫秒）"""
+    def distribution(values: List[float]) -> Dict[str, float]:
+        values = sorted(values)
+        return {
+            "count": len(values),
+            "p50_ms": percentile(values, 50) * 1000,
+            "p95_ms": percentile(values, 95) * 1000,
+            "p99_ms": percentile(values, 99) * 1000,
+            "max_ms": (values[-1] if values else 0.0) * 1000,
+        }
+
+    total = sum(len(values) for values in latencies.values())
+    return {
+        "requests": total,
+        "duration_s": elapsed,
+        "throughput_rps": total / elapsed if elapsed > 0 else 0.0,
+        "latency": {
+            "all": distribution([value for values in latencies.values() for value in values]),
+            **{kind: distribution(values) for kind, values in sorted(latencies.items())},
+        },
+        "status": dict(sorted(statuses.items())),
+    }
+
+
+async def run_in_process(args: argparse.Namespace, traffic: TrafficGenerator) -> Dict[str, Any]:
+    """在同一进程内运行应用和模拟上游"""
+    from app.main import app
+    from app.utils.config import settings
+    from app.utils.database import AsyncSessionLocal, Base, engine
+    from app.utils.http_client import set_http_client
+
+    capacity = settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW
+    if AsyncSessionLocal is None and args.concurrency > capacity:
+        # 同步会话在等待上游时仍占用连接，连接池耗尽后取连接会阻塞整个事件循环
+        print(
+            f"警告: 并发数{args.concurrency}超过同步数据库连接池容量{capacity}"
+            "（DB_POOL_SIZE + DB_MAX_OVERFLOW），缓存未命中较多时请求会在取连接时阻塞",
+            file=sys.stderr
+        )
+    Base.metadata.create_all(bind=engine)
+    fake_app, upstream = create_fake_upstream(profile_from_args(args))
+    # 应用的共享上游客户端直接调用模拟上游，生命周期结束时由应用关闭
+    set_http_client(httpx.AsyncClient(transport=httpx.ASGITransport(app=fake_app)))
+
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://app", timeout=None
+        ) as client:
+            before = upstream_calls((await client.get("/metrics")).text)
+            report = await drive(client, traffic, args.concurrency, args.duration, args.requests)
+            after = upstream_calls((await client.get("/metrics")).text)
+    report["upstream_calls"] = dict(sorted((after - before).items()))
+    report["fake_upstream"] = upstream.stats()
+    return report
+
+
+async def run_against_target(args: argparse.Namespace, traffic: TrafficGenerator) -> Dict[str, Any]:
+    """压测已部署的应用"""
+    async with httpx.AsyncClient(
+        base_url=args.target,
+        timeout=httpx.Timeout(args.timeout),
+        limits=httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    ) as client:
+        before = upstream_calls((await client.get("/metrics")).text)
+        report = await drive(client, traffic, args.concurrency, args.duration, args.requests)
+        after = upstream_calls((await client.get("/metrics")).text)
+        report["upstream_calls"] = dict(sorted((after - before).items()))
+        if args.upstream:
+            report["fake_upstream"] = (await client.get(f"{args.upstream.rstrip('/')}/stats")).json()
+    return report
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"请求数: {report['requests']}，耗时: {report['duration_s']:.1f} s，吞吐量: {report['throughput_rps']:.1f} 次/秒")
+    print()
+    print(f"{'类型':<16}{'次数':>8}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'max(ms)':>10}")
+    for kind, item in report["latency"].items():
+        print(
+            f"{kind:<16}{item['count']:>8}{item['p50_ms']:>10.1f}{item['p95_ms']:>10.1f}"
+            f"{item['p99_ms']:>10.1f}{item['max_ms']:>10.1f}"
+        )
+    for title, key in [("状态码", "status"), ("应用调用上游", "upstream_calls"), ("模拟上游收到", "fake_upstream")]:
+        if report.get(key):
+            print()
+            print(f"{title}:")
+            for name, count in report[key].items():
+                print(f"  {name:<28}{count:>8.0f}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="端到端负载测试")
+    parser.add_argument("--target", help="被测应用的地址，不指定时在进程内运行app.main:app")
+    parser.add_argument("--upstream", help="--target模式下单独启动的模拟上游地址，用于读取其统计")
+    parser.add_argument("--duration", type=float, default=30.0, help="持续时间（秒）")
+    parser.add_argument("--requests", type=int, default=None, help="最多发送的请求数")
+    parser.add_argument("--concurrency", type=int, default=16, help="并发请求数")
+    parser.add_argument("--cities", type=int, default=500, help="城市数量")
+    parser.add_argument("--zipf-s", type=float, default=1.1, help="城市热度Zipf分布的参数s，越大越集中")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX, help="各类请求的占比，如weather=0.6,analysis=0.4")
+    parser.add_argument("--timeout", type=float, default=30.0, help="--target模式下单个请求的超时（秒）")
+    parser.add_argument("--output", help="将结果写入该JSON文件")
+    add_profile_arguments(parser)
+    args = parser.parse_args(argv)
+
+    traffic = TrafficGenerator(args.mix, args.cities, args.zipf_s, seed=args.seed)
+    if args.target:
+        report = asyncio.run(run_against_target(args, traffic))
+    else:
+        report = asyncio.run(run_in_process(args, traffic))
+
+    print_report(report)
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
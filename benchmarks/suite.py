@@ -0,0 +1,504 @@
+"""性能基准测试套件
+
+覆盖请求路径上的热点：外部API响应解析、趣味分析生成、各响应模式的序列化，
+以及基于SQLite的get_or_fetch_*（进程内缓存命中与未命中两种情况）。
+所有用例都不访问网络，外部API由固定的示例数据代替。
+
+    python -m benchmarks.suite                        # 运行全部用例并与基准比较
+    python -m benchmarks.suite --filter parse         # 只运行名称包含parse的用例
+    python -m benchmarks.suite --output results.json  # 另存本次结果
+    python -m benchmarks.suite --save-baseline        # 用本次结果更新基准文件
+
+每个用例先确定单轮的执行次数（单轮耗时不少于--min-time），再重复--repeat轮，
+取最快一轮的单次耗时。不同机器的速度不同，比较时先将各用例的耗时除以同一次运行中
+固定校准负载的耗时，再与基准中同样归一化的结果比较，超过--threshold即判定为性能退化，
+以非零状态码退出。
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+# 套件只使用自己创建的内存数据库，应用配置中的必填项给出默认值即可离线运行
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_response_field  # noqa: E402
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+from sqlalchemy.pool import StaticPool  # noqa: E402
+
+import app.models  # noqa: E402,F401  注册所有数据表
+from app.api.analysis import generate_stellar_weather_analysis  # noqa: E402
+from app.schemas.horoscope import HoroscopeInDB, HoroscopeResponse, TodayHoroscope  # noqa: E402
+from app.schemas.weather import (  # noqa: E402
+    ForecastDay, WeatherBatchResponse, WeatherForecast, WeatherInDB, WeatherObservationResponse,
+    WeatherResponse, WeatherRollupResponse
+)
+from app.services.horoscope_service import ZODIAC_SIGNS, HoroscopeService  # noqa: E402
+from app.services.weather_service import WeatherService  # noqa: E402
+from app.utils.cache import TTLCache  # noqa: E402
+from app.utils.database import Base  # noqa: E402
+from app.utils.serialization import encoder_for  # noqa: E402
+from app.utils.singleflight import SingleFlight  # noqa: E402
+from benchmarks.bench_forecast_aggregation import make_payload  # noqa: E402
+
+# 默认的基准文件
+DEFAULT_BASELINE = Path(__file__).with_name("baseline.json")
+
+# 结果文件的格式版本
+FORMAT_VERSION = 1
+
+# 单轮执行n次用例，返回值被忽略
+Runner = Callable[[int], Any]
+
+# 用例名称 -> 准备函数，准备函数完成数据准备并返回Runner
+CASES: Dict[str, Callable[[], Runner]] = {}
+
+
+def case(name: str) -> Callable[[Callable[[], Runner]], Callable[[], Runner]]:
+    """注册一个基准用例"""
+    def decorator(setup: Callable[[], Runner]) -> Callable[[], Runner]:
+        if name in CASES:
+            raise ValueError(f"用例{name}已注册")
+        CASES[name] = setup
+        return setup
+    return decorator
+
+
+def _async_runner(loop: asyncio.AbstractEventLoop, fn: Callable[[], Any]) -> Runner:
+    """在同一个事件循环中连续await n次fn()，避免把事件循环的启动开销计入每次调用"""
+    async def repeat(n: int) -> None:
+        for _ in range(n):
+            await fn()
+
+    return lambda n: loop.run_until_complete(repeat(n))
+
+
+# ---------------------------------------------------------------------------
+# 示例数据
+# ---------------------------------------------------------------------------
+
+def weather_payload(city: str = "Beijing") -> dict:
+    """与OpenWeatherMap当前天气接口相同结构的响应"""
+    return {
+        "coord": {"lon": 116.3972, "lat": 39.9075},
+        "weather": [{"id": 800, "main": "Clear", "description": "晴", "icon": "01d"}],
+        "base": "stations",
+        "main": {
+            "temp": 25.5, "feels_like": 25.1, "temp_min": 24.9, "temp_max": 26.2,
+            "pressure": 1012, "humidity": 60, "sea_level": 1012, "grnd_level": 1007
+        },
+        "visibility": 10000,
+        "wind": {"speed": 3.5, "deg": 180, "gust": 5.2},
+        "clouds": {"all": 0},
+        "dt": 1701666000,
+        "sys": {"type": 1, "id": 9609, "country": "CN", "sunrise": 1701644590, "sunset": 1701679455},
+        "timezone": 28800,
+        "id": 1816670,
+        "name": city,
+        "cod": 200
+    }
+
+
+def oversized_weather_payload() -> dict:
+    """带有大量解析时用不到的字段（如逐分钟降水、预警）的当前天气响应"""
+    payload = weather_payload()
+    payload["weather"] = payload["weather"] * 20
+    payload["minutely"] = [{"dt": 1701666000 + 60 * i, "precipitation": 0.0} for i in range(60)]
+    payload["alerts"] = [
+        {"sender_name": "气象台", "event": f"预警{i}", "description": "注意防范。" * 50, "tags": ["Wind"]}
+        for i in range(20)
+    ]
+    return payload
+
+
+def forecast_payload(days: int, seed: int = 42) -> dict:
+    """days天、每3小时一条的天气预报响应"""
+    return make_payload("Beijing", days, random.Random(seed))
+
+
+def weather_snapshot(temperature: float = 25.5, description: str = "晴") -> WeatherInDB:
+    return WeatherInDB(
+        id=1, city="北京", country="CN", temperature=temperature, humidity=60, wind_speed=3.5,
+        description=description, icon="01d", created_at=datetime(2024, 1, 1, 8, 0, 0)
+    )
+
+
+def horoscope_snapshot(sign: str = "白羊座") -> HoroscopeInDB:
+    return HoroscopeInDB(
+        id=1, sign=sign, date_range="3月21日-4月19日",
+        today=f"{sign}今日运势：整体运势良好，工作顺利，感情稳定。",
+        tomorrow=f"{sign}明日运势：运势一般，需要注意人际关系。",
+        week=f"{sign}本周运势：本周整体运势上升，适合开展新项目。",
+        month=f"{sign}本月运势：本月运势平稳，财运不错。",
+        year=f"{sign}本年运势：本年运势起伏较大，需要注意健康。",
+        created_at=datetime(2024, 1, 1, 8, 0, 0)
+    )
+
+
+# ---------------------------------------------------------------------------
+# 解析与分析
+# ---------------------------------------------------------------------------
+
+def _parse_case(parse: Callable[[WeatherService, dict], Any], payload: dict) -> Runner:
+    service = WeatherService(db=None)
+
+    def run(n: int) -> None:
+        for _ in range(n):
+            parse(service, payload)
+    return run
+
+
+@case("parse.weather.realistic")
+def _parse_weather_realistic() -> Runner:
+    return _parse_case(WeatherService.parse_weather_api_response, weather_payload())
+
+
+@case("parse.weather.oversized")
+def _parse_weather_oversized() -> Runner:
+    return _parse_case(WeatherService.parse_weather_api_response, oversized_weather_payload())
+
+
+@case("parse.forecast.realistic")
+def _parse_forecast_realistic() -> Runner:
+    # 免费接口返回5天共40条
+    return _parse_case(WeatherService.parse_forecast_api_response, forecast_payload(days=5))
+
+
+@case("parse.forecast.oversized")
+def _parse_forecast_oversized() -> Runner:
+    # 30天共240条
+    return _parse_case(WeatherService.parse_forecast_api_response, forecast_payload(days=30))
+
+
+@case("analysis.generate")
+def _analysis_generate() -> Runner:
+    # 不同温度区间、天气描述和星座的组合，轮流生成
+    pairs = [
+        (weather_snapshot(temperature, description), horoscope_snapshot(sign))
+        for temperature, description in [(-5.0, "小雪"), (18.0, "多云"), (35.5, "晴"), (22.0, "小雨")]
+        for sign in ZODIAC_SIGNS
+    ]
+
+    def run(n: int) -> None:
+        count = len(pairs)
+        for i in range(n):
+            weather, horoscope = pairs[i % count]
+            generate_stellar_weather_analysis(weather, horoscope)
+    return run
+
+
+# ---------------------------------------------------------------------------
+# 响应序列化
+# ---------------------------------------------------------------------------
+
+def serialization_samples() -> Dict[str, Any]:
+    """app/schemas中每个响应模式的示例：名称 -> (响应模型, 内容)"""
+    weather = weather_snapshot()
+    horoscope = horoscope_snapshot()
+    now = datetime(2024, 1, 1, 8, 0, 0)
+    observations = [
+        WeatherObservationResponse(
+            city="北京", country="CN", temperature=20.0 + i / 10, humidity=50, wind_speed=2.5,
+            description="多云", icon="02d", observed_at=now + timedelta(hours=i)
+        )
+        for i in range(24)
+    ]
+    rollups = [
+        WeatherRollupResponse(
+            city="北京", bucket_start=now + timedelta(hours=i), sample_count=12,
+            temperature_avg=20.5, temperature_min=18.0, temperature_max=23.5,
+            humidity_avg=55.5, humidity_min=40, humidity_max=70,
+            wind_speed_avg=2.25, wind_speed_max=6.0
+        )
+        for i in range(24)
+    ]
+    forecast = WeatherForecast(city="北京", country="CN", forecast=[
+        ForecastDay(date=f"2024-01-0{day}", temperature_min=-3.5, temperature_max=4.0, temperature_avg=0.25,
+                    humidity=40, wind_speed=5.5, description="晴", icon="01d")
+        for day in range(1, 6)
+    ])
+    batch = WeatherBatchResponse(
+        results={f"城市{i}": WeatherResponse.model_validate(weather, from_attributes=True) for i in range(10)},
+        errors={"未知城市": "未找到该城市的天气数据"}
+    )
+    return {
+        "WeatherResponse": (WeatherResponse, weather),
+        "WeatherObservationResponse[24]": (List[WeatherObservationResponse], observations),
+        "WeatherRollupResponse[24]": (List[WeatherRollupResponse], rollups),
+        "WeatherForecast": (WeatherForecast, forecast),
+        "WeatherBatchResponse": (WeatherBatchResponse, batch),
+        "HoroscopeResponse": (HoroscopeResponse, horoscope),
+        "TodayHoroscope": (TodayHoroscope, horoscope),
+        "TodayHoroscope[12]": (List[TodayHoroscope], [horoscope_snapshot(sign) for sign in ZODIAC_SIGNS]),
+    }
+
+
+def _default_serialization_case(name: str) -> Callable[[], Runner]:
+    def setup() -> Runner:
+        """FastAPI默认的response_model序列化：模型校验 + jsonable_encoder + json.dumps"""
+        model, content = serialization_samples()[name]
+        field = create_response_field(name="response", type_=model)
+
+        async def serialize() -> bytes:
+            serialized = await serialize_response(field=field, response_content=content, is_coroutine=True)
+            return JSONResponse(serialized).body
+
+        return _async_runner(asyncio.new_event_loop(), serialize)
+    return setup
+
+
+def _fast_serialization_case(name: str) -> Callable[[], Runner]:
+    def setup() -> Runner:
+        """FAST_SERIALIZATION开启时的预编译编码器"""
+        model, content = serialization_samples()[name]
+        encoder = encoder_for(model)
+
+        def run(n: int) -> None:
+            for _ in range(n):
+                encoder.encode(content).encode("utf-8")
+        return run
+    return setup
+
+
+# 接口中开启了快速序列化的响应模式
+FAST_SERIALIZATION_SCHEMAS = ("WeatherResponse", "WeatherForecast", "HoroscopeResponse", "TodayHoroscope")
+
+for _name in serialization_samples():
+    case(f"serialize.{_name}")(_default_serialization_case(_name))
+for _name in FAST_SERIALIZATION_SCHEMAS:
+    case(f"serialize.{_name}.fast")(_fast_serialization_case(_name))
+
+
+# ---------------------------------------------------------------------------
+# get_or_fetch_*：SQLite + 进程内缓存
+# ---------------------------------------------------------------------------
+
+class OfflineWeatherService(WeatherService):
+    """外部API返回固定示例数据的天气服务"""
+
+    async def fetch_weather_from_api(self, city: str) -> Optional[dict]:
+        return weather_payload(city)
+
+    async def fetch_forecast_from_api(self, city: str) -> Optional[dict]:
+        return forecast_payload(days=5)
+
+
+def _session():
+    """创建一个新的内存SQLite数据库并返回其会话"""
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+
+
+def _weather_service() -> OfflineWeatherService:
+    service = OfflineWeatherService(
+        _session(), cache=TTLCache(maxsize=1000, ttl=3600), flight=SingleFlight()
+    )
+    service.forecast_cache = TTLCache(maxsize=1000, ttl=3600)
+    service.forecast_flight = SingleFlight()
+    return service
+
+
+def _fetch_case(make_service: Callable[[], Any], fetch: Callable[[Any], Any], cold: bool) -> Runner:
+    """warm为进程内缓存命中；cold为每次先清空进程内缓存，数据从数据库读取"""
+    loop = asyncio.new_event_loop()
+    service = make_service()
+    # 第一次调用从（离线的）外部API获取并写入数据库
+    loop.run_until_complete(fetch(service))
+    caches = [service.cache, getattr(service, "forecast_cache", service.cache)]
+
+    async def call() -> Any:
+        if cold:
+            for cache in caches:
+                cache.clear()
+        return await fetch(service)
+
+    return _async_runner(loop, call)
+
+
+for _cold in (False, True):
+    _suffix = "cold" if _cold else "warm"
+    case(f"fetch.weather.{_suffix}")(
+        lambda cold=_cold: _fetch_case(_weather_service, lambda s: s.get_or_fetch_weather("Beijing"), cold)
+    )
+    case(f"fetch.forecast.{_suffix}")(
+        lambda cold=_cold: _fetch_case(_weather_service, lambda s: s.get_or_fetch_forecast("Beijing"), cold)
+    )
+    case(f"fetch.horoscope.{_suffix}")(
+        lambda cold=_cold: _fetch_case(
+            lambda: HoroscopeService(_session(), cache=TTLCache(maxsize=100, ttl=3600), flight=SingleFlight()),
+            lambda s: s.get_or_fetch_horoscope("白羊座"),
+            cold
+        )
+    )
+
+
+# ---------------------------------------------------------------------------
+# 计时与比较
+# ---------------------------------------------------------------------------
+
+def _calibration(n: int) -> None:
+    """固定的纯Python负载：字典、字符串格式化和排序，用于抵消机器之间的速度差异"""
+    for _ in range(n):
+        data = {f"k{j}": j * 1.5 for j in range(20)}
+        sorted(data.items(), key=lambda item: -item[1])
+        ",".join(f"{key}={value}" for key, value in data.items())
+
+
+def measure(run: Runner, repeat: int, min_time: float) -> Dict[str, Any]:
+    """确定单轮执行次数后重复repeat轮，返回最快一轮和中位数的单次耗时（纳秒）"""
+    iterations = 1
+    while True:
+        started = time.perf_counter()
+        run(iterations)
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time:
+            break
+        # 按已测得的耗时估算所需次数，至少翻倍
+        iterations = max(iterations * 2, int(iterations * min_time / max(elapsed, 1e-9) * 1.1))
+
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run(iterations)
+        timings.append((time.perf_counter() - started) / iterations * 1e9)
+    return {
+        "ns_per_op": min(timings),
+        "median_ns": statistics.median(timings),
+        "iterations": iterations,
+        "repeat": repeat,
+    }
+
+
+def run_suite(
+    names: Optional[List[str]] = None,
+    repeat: int = 5,
+    min_time: float = 0.1,
+    progress: Optional[Callable[[str, Dict[str, Any]], None]] = None
+) -> Dict[str, Any]:
+    """运行指定的用例（默认全部），返回可写入JSON的结果"""
+    results = {}
+    for name in names if names is not None else list(CASES):
+        results[name] = measure(CASES[name](), repeat, min_time)
+        if progress is not None:
+            progress(name, results[name])
+    return {
+        "version": FORMAT_VERSION,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "calibration_ns": measure(_calibration, repeat, min_time)["ns_per_op"],
+        "results": results,
+    }
+
+
+def compare(
+    current: Dict[str, Any], baseline: Dict[str, Any], threshold: float, normalize: bool = True
+) -> List[Dict[str, Any]]:
+    """比较本次结果与基准，返回每个共同用例的比值（>1表示变慢）及是否超过阈值
+
+    normalize为True时先除以各自的校准耗时，消除机器整体快慢的影响。
+    """
+    scale = 1.0
+    if normalize:
+        scale = baseline["calibration_ns"] / current["calibration_ns"]
+    rows = []
+    for name, result in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        ratio = result["ns_per_op"] * scale / base["ns_per_op"]
+        rows.append({
+            "name": name,
+            "baseline_ns": base["ns_per_op"],
+            "current_ns": result["ns_per_op"],
+            "ratio": ratio,
+            "regressed": ratio > 1 + threshold,
+        })
+    return rows
+
+
+def _format_ns(ns: float) -> str:
+    if ns >= 1e6:
+        return f"{ns / 1e6:.2f} ms"
+    if ns >= 1e3:
+        return f"{ns / 1e3:.2f} µs"
+    return f"{ns:.0f} ns"
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="性能基准测试套件")
+    parser.add_argument("--filter", action="append", default=[], help="只运行名称包含该字符串的用例，可重复")
+    parser.add_argument("--list", action="store_true", help="列出所有用例后退出")
+    parser.add_argument("--repeat", type=int, default=5, help="每个用例的重复轮数，取最快一轮")
+    parser.add_argument("--min-time", type=float, default=0.1, help="单轮最短耗时（秒）")
+    parser.add_argument("--output", help="将本次结果写入该JSON文件")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE), help="基准结果文件")
+    parser.add_argument("--threshold", type=float, default=0.25, help="允许的变慢比例，默认0.25即25%%")
+    parser.add_argument("--no-normalize", action="store_true", help="比较时不按校准负载归一化（同一台机器上比较时使用）")
+    parser.add_argument("--save-baseline", action="store_true", help="用本次结果更新基准文件，不做比较")
+    args = parser.parse_args(argv)
+
+    names = [name for name in CASES if not args.filter or any(f in name for f in args.filter)]
+    if args.list:
+        print("\n".join(names))
+        return 0
+    if not names:
+        print("没有匹配的用例", file=sys.stderr)
+        return 2
+
+    current = run_suite(
+        names, args.repeat, args.min_time,
+        progress=lambda name, result: print(f"{name:<45} {_format_ns(result['ns_per_op']):>12}")
+    )
+    if args.output:
+        Path(args.output).write_text(json.dumps(current, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+
+    baseline_path = Path(args.baseline)
+    if args.save_baseline:
+        # 只运行部分用例时保留基准中其余用例的结果
+        if baseline_path.exists() and args.filter:
+            saved = json.loads(baseline_path.read_text(encoding="utf-8"))
+            scale = saved["calibration_ns"] / current["calibration_ns"]
+            for result in current["results"].values():
+                result["ns_per_op"] *= scale
+                result["median_ns"] *= scale
+            saved["results"].update(current["results"])
+            current = saved
+        baseline_path.write_text(json.dumps(current, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+        print(f"已写入基准: {baseline_path}")
+        return 0
+
+    if not baseline_path.exists():
+        print(f"基准文件不存在: {baseline_path}，可用--save-baseline生成", file=sys.stderr)
+        return 2
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+    rows = compare(current, baseline, args.threshold, normalize=not args.no_normalize)
+
+    print()
+    print(f"与基准比较（阈值 +{args.threshold:.0%}，{'已' if not args.no_normalize else '未'}按校准负载归一化）:")
+    for row in rows:
+        mark = "退化" if row["regressed"] else ""
+        print(f"{row['name']:<45} {row['ratio']:>7.2f}x  {mark}")
+    regressions = [row["name"] for row in rows if row["regressed"]]
+    if regressions:
+        print(f"\n{len(regressions)}个用例超过阈值: {', '.join(regressions)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,7 +4,11 @@ from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
 from app.main import app
+from app.utils.cache import city_alias_cache, weather_cache, forecast_cache, horoscope_cache
+from app.utils.cache_backend import set_cache_backend
 from app.utils.database import Base, get_db
+from app.utils.resilience import UPSTREAMS
+from app.utils.upstream_quota import openweathermap_quota
 
 # 使用内存数据库进行测试
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
@@ -17,6 +21,28 @@ engine = create_engine(
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
+@pytest.fixture(autouse=True)
+def clear_caches():
+    """每个测试前后清空进程内缓存、重置熔断器和上游配额并关闭共享缓存，避免测试之间互相影响"""
+    weather_cache.clear()
+    forecast_cache.clear()
+    horoscope_cache.clear()
+    city_alias_cache.clear()
+    for upstream in UPSTREAMS.values():
+        upstream.breaker.reset()
+    openweathermap_quota.reset()
+    set_cache_backend(None)
+    yield
+    weather_cache.clear()
+    forecast_cache.clear()
+    horoscope_cache.clear()
+    city_alias_cache.clear()
+    for upstream in UPSTREAMS.values():
+        upstream.breaker.reset()
+    openweathermap_quota.reset()
+    set_cache_backend(None)
+
+
 @pytest.fixture(scope="function")
 def db_session():
     """创建一个新的数据库会话用于测试"""
@@ -8,7 +8,7 @@ class TestAnalysisAPI:
     def test_get_stellar_analysis_success(self, client: TestClient, monkeypatch):
         """测试成功获取天气和星象分析"""
         # 模拟天气服务返回
-        def mock_weather_get_or_fetch_weather(self, city):
+        async def mock_weather_get_or_fetch_weather(self, city):
             from app.models.weather import Weather
             from app.schemas.weather import WeatherCreate
             
@@ -26,7 +26,7 @@ class TestAnalysisAPI:
             return db_weather
         
         # 模拟星象服务返回
-        def mock_horoscope_get_or_fetch_horoscope(self, sign):
+        async def mock_horoscope_get_or_fetch_horoscope(self, sign):
             from app.models.horoscope import Horoscope
             from app.schemas.horoscope import HoroscopeCreate
             
@@ -76,7 +76,7 @@ class TestAnalysisAPI:
     def test_get_stellar_analysis_invalid_city(self, client: TestClient, monkeypatch):
         """测试无效城市的情况"""
         # 模拟天气服务返回None（城市不存在）
-        def mock_weather_get_or_fetch_weather(self, city):
+        async def mock_weather_get_or_fetch_weather(self, city):
             return None
         
         # 使用monkeypatch替换真实方法
@@ -93,7 +93,7 @@ class TestAnalysisAPI:
     def test_get_stellar_analysis_invalid_sign(self, client: TestClient, monkeypatch):
         """测试无效星座的情况"""
         # 模拟天气服务正常返回
-        def mock_weather_get_or_fetch_weather(self, city):
+        async def mock_weather_get_or_fetch_weather(self, city):
             from app.models.weather import Weather
             from app.schemas.weather import WeatherCreate
             
@@ -111,7 +111,7 @@ class TestAnalysisAPI:
             return db_weather
         
         # 模拟星象服务返回None（星座不存在）
-        def mock_horoscope_get_or_fetch_horoscope(self, sign):
+        async def mock_horoscope_get_or_fetch_horoscope(self, sign):
             return None
         
         # 使用monkeypatch替换真实方法
@@ -0,0 +1,102 @@
+import pytest
+
+from app.schemas.horoscope import HoroscopeCreate
+from app.schemas.weather import WeatherCreate
+from app.services.analysis_engine import AnalysisRuleEngine, analysis_engine
+from app.services.horoscope_service import ZODIAC_SIGNS
+
+
+def legacy_analysis(weather, horoscope) -> str:
+    """规则引擎之前的实现，用于验证输出完全一致"""
+    base_analysis = f"{weather.city}今日天气{weather.description}，气温{weather.temperature}℃。"
+    base_analysis += f"{horoscope.sign}今日{horoscope.today.split('：')[1]}。"
+    if weather.temperature > 30:
+        if horoscope.sign in ["白羊座", "狮子座", "射手座"]:
+            base_analysis += "火热的天气正符合火象星座的热情性格，今天适合户外活动！"
+        else:
+            base_analysis += "天气炎热，注意防暑降温，保持心情愉悦。"
+    elif weather.temperature < 10:
+        if horoscope.sign in ["摩羯座", "金牛座", "处女座"]:
+            base_analysis += "寒冷的天气让土象星座更加沉稳，今天适合室内工作学习。"
+        else:
+            base_analysis += "天气寒冷，注意保暖，多喝热水。"
+    else:
+        if horoscope.sign in ["双子座", "天秤座", "水瓶座"]:
+            base_analysis += "宜人的天气最适合风象星座的社交活动，今天不妨约上朋友聚会！"
+        elif horoscope.sign in ["巨蟹座", "天蝎座", "双鱼座"]:
+            base_analysis += "舒适的天气让水象星座更有创造力，今天适合艺术创作或冥想。"
+        else:
+            base_analysis += "天气宜人，是个适合做任何事情的好日子！"
+    if "雨" in weather.description:
+        base_analysis += "雨天适合静心思考，整理思绪，规划未来。"
+    elif "晴" in weather.description:
+        base_analysis += "晴天心情也会变好，不妨趁机完成一些一直拖延的任务。"
+    elif "云" in weather.description:
+        base_analysis += "多云的天气适合低调行事，默默积累能量。"
+    return base_analysis
+
+
+def make_weather(temperature: float, description: str) -> WeatherCreate:
+    return WeatherCreate(
+        city="北京", country="CN", temperature=temperature, humidity=60,
+        wind_speed=3.5, description=description, icon="01d"
+    )
+
+
+def make_horoscope(sign: str) -> HoroscopeCreate:
+    return HoroscopeCreate(
+        sign=sign, date_range="", today=f"{sign}今日运势：整体运势良好，工作顺利。",
+        tomorrow="", week="", month="", year=""
+    )
+
+
+class TestAnalysisRuleEngine:
+    """趣味分析规则引擎测试类"""
+    
+    def test_matches_legacy_output(self):
+        """测试内置规则与原先手写分支的输出完全一致，包括区间边界"""
+        temperatures = [-5, 9.99, 10, 10.0, 25.5, 30, 30.0, 30.01, 38]
+        descriptions = ["小雨", "晴", "多云", "雷阵雨转晴", "雾", ""]
+        pairs = [
+            (make_weather(t, d), make_horoscope(sign))
+            for t in temperatures for d in descriptions for sign in ZODIAC_SIGNS + ["未知座"]
+        ]
+        assert analysis_engine.analyze_many(pairs) == [legacy_analysis(w, h) for w, h in pairs]
+    
+    def test_compiled_lookups(self):
+        """测试星座元素和温度区间的查找"""
+        assert analysis_engine.element("狮子座") == "fire"
+        assert analysis_engine.element("未知座") is None
+        assert analysis_engine.temperature_band(9.9) == "cold"
+        assert analysis_engine.temperature_band(10) == "mild"
+        assert analysis_engine.temperature_band(30) == "mild"
+        assert analysis_engine.temperature_band(30.1) == "hot"
+    
+    def test_custom_rules(self):
+        """测试修改规则数据即可改变分析文本，无需修改代码"""
+        engine = AnalysisRuleEngine({
+            "summary": "{city}{temperature}度，{sign}{today}。",
+            "today_separator": "|",
+            "elements": {"fire": ["白羊座"]},
+            "temperature_bands": [
+                {"band": "cool", "below": 20},
+                {"band": "warm"}
+            ],
+            "band_fragments": {"warm": {"fire": "出门走走。", "*": "注意补水。"}},
+            "description_keywords": [{"keyword": "风", "fragment": "风大注意安全。"}]
+        })
+        horoscope = HoroscopeCreate(
+            sign="白羊座", date_range="", today="白羊座|好运", tomorrow="", week="", month="", year=""
+        )
+        assert engine.analyze(make_weather(25, "大风"), horoscope) == "北京25.0度，白羊座好运。出门走走。风大注意安全。"
+        assert engine.analyze(make_weather(5, "晴"), horoscope) == "北京5.0度，白羊座好运。"
+    
+    def test_invalid_bands(self):
+        """测试温度区间缺少分界或顺序错误时报错"""
+        base = {"summary": "", "today_separator": "：", "elements": {}}
+        with pytest.raises(ValueError):
+            AnalysisRuleEngine({**base, "temperature_bands": [{"band": "a"}, {"band": "b"}]})
+        with pytest.raises(ValueError):
+            AnalysisRuleEngine({**base, "temperature_bands": [
+                {"band": "a", "below": 30}, {"band": "b", "below": 10}, {"band": "c"}
+            ]})
@@ -0,0 +1,51 @@
+import json
+
+from benchmarks import suite
+
+
+def _result(calibration_ns, **timings):
+    return {
+        "calibration_ns": calibration_ns,
+        "results": {name: {"ns_per_op": ns} for name, ns in timings.items()},
+    }
+
+
+class TestBenchmarkSuite:
+    """性能基准测试套件测试类"""
+
+    def test_compare_flags_regression_over_threshold(self):
+        """测试超过阈值的用例被判定为退化"""
+        baseline = _result(100.0, fast=1000.0, slow=1000.0)
+        current = _result(100.0, fast=1100.0, slow=1500.0)
+
+        rows = {row["name"]: row for row in suite.compare(current, baseline, threshold=0.25)}
+        assert rows["fast"]["regressed"] is False
+        assert rows["slow"]["regressed"] is True
+        assert rows["slow"]["ratio"] == 1.5
+
+    def test_compare_normalizes_by_calibration(self):
+        """测试整体变慢的机器上按校准负载归一化后不误报"""
+        baseline = _result(100.0, parse=1000.0)
+        current = _result(200.0, parse=2000.0)
+
+        assert suite.compare(current, baseline, threshold=0.25)[0]["regressed"] is False
+        assert suite.compare(current, baseline, threshold=0.25, normalize=False)[0]["regressed"] is True
+
+    def test_compare_skips_cases_missing_from_baseline(self):
+        """测试基准中没有的新用例不参与比较"""
+        rows = suite.compare(_result(100.0, new=1.0), _result(100.0), threshold=0.25)
+        assert rows == []
+
+    def test_baseline_covers_all_cases(self):
+        """测试基准文件包含所有已注册的用例"""
+        baseline = json.loads(suite.DEFAULT_BASELINE.read_text(encoding="utf-8"))
+        assert set(suite.CASES) <= set(baseline["results"])
+
+    def test_run_suite_offline(self):
+        """测试不访问网络即可运行解析、序列化和数据库用例"""
+        names = ["parse.weather.realistic", "serialize.WeatherForecast.fast", "fetch.weather.cold"]
+        result = suite.run_suite(names, repeat=1, min_time=0.001)
+
+        assert set(result["results"]) == set(names)
+        assert all(item["ns_per_op"] > 0 for item in result["results"].values())
+        assert result["calibration_ns"] > 0
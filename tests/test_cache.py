@@ -0,0 +1,191 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy.orm import Session
+
+from app.models.weather import Weather
+from app.services.weather_service import WeatherService
+from app.services.horoscope_service import HoroscopeService
+from app.utils.cache import TTLCache
+from app.utils.config import settings
+from app.utils.singleflight import SingleFlight
+from tests.conftest import TestingSessionLocal
+
+
+MOCK_WEATHER_API_RESPONSE = {
+    "name": "北京",
+    "sys": {"country": "CN"},
+    "main": {"temp": 25.5, "humidity": 60},
+    "wind": {"speed": 3.5},
+    "weather": [{"description": "晴", "icon": "01d"}]
+}
+
+
+class TestTTLCache:
+    """进程内缓存测试类"""
+    
+    def test_get_and_set(self):
+        """测试基本读写与命中统计"""
+        cache = TTLCache(maxsize=2, ttl=60)
+        assert cache.get("北京") is None
+        cache.set("北京", 1)
+        assert cache.get("北京") == 1
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+    
+    def test_lru_eviction(self):
+        """测试容量满时淘汰最久未使用的条目"""
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("北京", 1)
+        cache.set("上海", 2)
+        cache.get("北京")
+        cache.set("广州", 3)
+        assert "上海" not in cache
+        assert cache.get("北京") == 1
+        assert cache.get("广州") == 3
+        assert cache.stats()["evictions"] == 1
+    
+    def test_ttl_expiration(self):
+        """测试条目过期后失效"""
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("北京", 1, ttl=0.01)
+        time.sleep(0.02)
+        assert cache.get("北京") is None
+        assert cache.stats()["expirations"] == 1
+    
+    def test_invalid_maxsize(self):
+        """测试非法容量"""
+        with pytest.raises(ValueError):
+            TTLCache(maxsize=0, ttl=60)
+
+
+class TestServiceCache:
+    """服务层缓存测试类"""
+    
+    @pytest.mark.asyncio
+    async def test_weather_served_from_cache(self, db_session: Session, monkeypatch):
+        """测试缓存命中时不再访问数据库和外部API"""
+        calls = []
+        
+        async def mock_fetch_weather_from_api(self, city):
+            calls.append(city)
+            return MOCK_WEATHER_API_RESPONSE
+        
+        monkeypatch.setattr(WeatherService, "fetch_weather_from_api", mock_fetch_weather_from_api)
+        service = WeatherService(db_session, cache=TTLCache(maxsize=8, ttl=60))
+        
+        first = await service.get_or_fetch_weather("北京")
+        assert first.city == "北京"
+        assert calls == ["北京"]
+        
+        def fail_get_weather_by_city(self, city):
+            raise AssertionError("缓存命中时不应查询数据库")
+        
+        monkeypatch.setattr(WeatherService, "get_weather_by_city", fail_get_weather_by_city)
+        second = await service.get_or_fetch_weather("北京")
+        assert second == first
+        assert calls == ["北京"]
+        assert service.cache.stats()["hits"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_horoscope_served_from_cache(self, db_session: Session):
+        """测试星象数据缓存命中"""
+        service = HoroscopeService(db_session, cache=TTLCache(maxsize=8, ttl=60))
+        first = await service.get_or_fetch_horoscope("白羊座")
+        second = await service.get_or_fetch_horoscope("白羊座")
+        assert first.sign == "白羊座"
+        assert second == first
+        assert service.cache.stats()["hits"] == 1
+
+    
+    @pytest.mark.asyncio
+    async def test_forecast_served_from_cache(self, db_session: Session, monkeypatch):
+        """测试天气预报缓存命中时不再请求外部API，天数通过切片返回"""
+        calls = []
+        
+        async def mock_fetch_forecast_from_api(self, city):
+            calls.append(city)
+            return {
+                "city": {"name": "北京", "country": "CN"},
+                "list": [
+                    {
+                        "dt_txt": f"2023-12-0{day} 12:00:00",
+                        "main": {"temp_min": 20.0, "temp_max": 25.0, "humidity": 60},
+                        "wind": {"speed": 3.5},
+                        "weather": [{"description": "晴", "icon": "01d"}]
+                    }
+                    for day in range(1, 6)
+                ]
+            }
+        
+        monkeypatch.setattr(WeatherService, "fetch_forecast_from_api", mock_fetch_forecast_from_api)
+        service = WeatherService(db_session)
+        
+        full = await service.get_or_fetch_forecast("北京")
+        assert len(full.forecast) == 5
+        
+        sliced = await service.get_or_fetch_forecast(" 北京 ", days=2)
+        assert [day.date for day in sliced.forecast] == ["2023-12-01", "2023-12-02"]
+        assert calls == ["北京"]
+        
+        # 进程内缓存清空后从数据库读取，仍然不请求外部API
+        service.forecast_cache.clear()
+        from_db = await service.get_or_fetch_forecast("北京", days=3)
+        assert len(from_db.forecast) == 3
+        assert calls == ["北京"]
+
+class TestStaleWhileRevalidate:
+    """过期数据先返回、后台刷新的测试类"""
+    
+    def _add_weather(self, db_session: Session, age: timedelta) -> None:
+        """写入一条指定时长之前更新的天气数据"""
+        db_session.add(Weather(
+            city="北京", country="CN", temperature=10.0, humidity=50,
+            wind_speed=1.0, description="多云", icon="02d",
+            created_at=datetime.utcnow() - age, updated_at=datetime.utcnow() - age
+        ))
+        db_session.commit()
+    
+    @pytest.mark.asyncio
+    async def test_stale_data_returned_and_refreshed_in_background(self, db_session: Session, monkeypatch):
+        """测试旧数据窗口内立即返回旧数据，并在后台刷新"""
+        calls = []
+        
+        async def mock_fetch_weather_from_api(self, city):
+            calls.append(city)
+            return MOCK_WEATHER_API_RESPONSE
+        
+        monkeypatch.setattr(WeatherService, "fetch_weather_from_api", mock_fetch_weather_from_api)
+        self._add_weather(db_session, timedelta(minutes=settings.WEATHER_CACHE_TTL_MINUTES + 1))
+        flight = SingleFlight()
+        service = WeatherService(
+            db_session, cache=TTLCache(maxsize=8, ttl=3600), flight=flight,
+            session_factory=TestingSessionLocal
+        )
+        
+        weather = await service.get_or_fetch_weather("北京")
+        assert weather.temperature == 10.0
+        assert flight.in_flight("北京")
+        
+        while flight.in_flight("北京"):
+            await asyncio.sleep(0.01)
+        assert calls == ["北京"]
+        refreshed = await service.get_or_fetch_weather("北京")
+        assert refreshed.temperature == 25.5
+    
+    @pytest.mark.asyncio
+    async def test_expired_data_blocks_on_refresh(self, db_session: Session, monkeypatch):
+        """测试超出旧数据窗口时等待刷新完成"""
+        async def mock_fetch_weather_from_api(self, city):
+            return MOCK_WEATHER_API_RESPONSE
+        
+        monkeypatch.setattr(WeatherService, "fetch_weather_from_api", mock_fetch_weather_from_api)
+        self._add_weather(db_session, timedelta(
+            minutes=settings.WEATHER_CACHE_TTL_MINUTES + settings.WEATHER_STALE_WINDOW_MINUTES + 1
+        ))
+        service = WeatherService(db_session, cache=TTLCache(maxsize=8, ttl=3600), flight=SingleFlight())
+        
+        weather = await service.get_or_fetch_weather("北京")
+        assert weather.temperature == 25.5
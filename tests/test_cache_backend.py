@@ -0,0 +1,254 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+import pytest_asyncio
+from sqlalchemy.orm import Session
+
+from app.schemas.weather import ForecastDay, WeatherForecast, WeatherInDB
+from app.services.horoscope_service import HoroscopeService, ZODIAC_SIGNS
+from app.services.weather_service import WeatherService
+from app.utils.cache import TTLCache
+from app.utils.cache_backend import (
+    CacheBackend, CacheBackendError, MemoryCacheBackend, RespCacheBackend, create_cache_backend, set_cache_backend
+)
+from app.utils.shared_cache import SharedCache, codec_for
+from app.utils.singleflight import SingleFlight
+from benchmarks.fake_redis import FakeRedis
+
+
+BEIJING_API_RESPONSE = {
+    "name": "Beijing",
+    "sys": {"country": "CN"},
+    "main": {"temp": 25.5, "humidity": 60},
+    "wind": {"speed": 3.5},
+    "weather": [{"description": "晴", "icon": "01d"}]
+}
+
+
+def _weather() -> WeatherInDB:
+    return WeatherInDB(
+        id=1, city="Beijing", country="CN", temperature=-2.5, humidity=60, wind_speed=3.5,
+        description="晴", icon="01d", created_at=datetime(2023, 12, 1, 8, 0),
+        updated_at=datetime(2023, 12, 1, 9, 30, 15, 123456, tzinfo=timezone.utc)
+    )
+
+
+@pytest_asyncio.fixture
+async def fake_redis():
+    """本地启动的模拟Redis"""
+    server = await FakeRedis().start()
+    yield server
+    await server.stop()
+
+
+@pytest_asyncio.fixture(params=["memory", "resp"])
+async def backend(request, fake_redis):
+    """分别测试进程内后端和连接模拟Redis的RESP后端"""
+    if request.param == "memory":
+        yield MemoryCacheBackend()
+    else:
+        backend = RespCacheBackend(fake_redis.url, pool_size=2, timeout=1.0)
+        yield backend
+        await backend.close()
+
+
+@pytest.fixture
+def shared_backend(backend):
+    """服务使用的共享缓存后端"""
+    set_cache_backend(backend)
+    return backend
+
+
+def _worker(db) -> WeatherService:
+    """模拟另一个工作进程：独立的进程内缓存和合并器，共用数据库和共享缓存"""
+    return WeatherService(db, cache=TTLCache(maxsize=16, ttl=3600), flight=SingleFlight())
+
+
+class TestCacheBackend:
+    """共享缓存后端测试类"""
+
+    @pytest.mark.asyncio
+    async def test_get_set_delete(self, backend):
+        """测试读写、批量读取按键的顺序返回、删除和过期"""
+        await backend.set_many([("a", b"1", 60), ("b", b"\x00\r\n2", 60), ("c", b"3", 0.01)])
+        await asyncio.sleep(0.02)
+
+        assert await backend.get_many(["b", "missing", "a", "c"]) == [b"\x00\r\n2", None, b"1", None]
+        await backend.delete("a", "missing")
+        assert await backend.get("a") is None
+        assert await backend.get_many([]) == []
+
+    @pytest.mark.asyncio
+    async def test_add_only_when_missing(self, backend):
+        """测试add只在键不存在时写入"""
+        assert await backend.add("lock", b"x", 60)
+        assert not await backend.add("lock", b"y", 60)
+        assert await backend.get("lock") == b"x"
+
+    @pytest.mark.asyncio
+    async def test_delete_if_equals(self, backend):
+        """测试只在值相等时删除"""
+        await backend.set("lock", b"mine", 60)
+        assert not await backend.delete_if_equals("lock", b"other")
+        assert await backend.get("lock") == b"mine"
+        assert await backend.delete_if_equals("lock", b"mine")
+        assert await backend.get("lock") is None
+        assert not await backend.delete_if_equals("lock", b"mine")
+
+    @pytest.mark.asyncio
+    async def test_resp_pipelines_batches(self, fake_redis):
+        """测试批量读取只发送一条MGET，批量写入在一个连接上以流水线发送，密码错误时报错"""
+        backend = RespCacheBackend(fake_redis.url, pool_size=1, timeout=1.0)
+        await backend.set_many([(f"k{i}", b"v", 60) for i in range(3)])
+        await backend.get_many(["k0", "k1", "k2"])
+        await backend.close()
+
+        assert [command[0] for command in fake_redis.commands] == [b"SET", b"SET", b"SET", b"MGET"]
+        assert fake_redis.commands[-1] == [b"MGET", b"k0", b"k1", b"k2"]
+
+        fake_redis.password = "secret"
+        backend = RespCacheBackend(fake_redis.url.replace("redis://", "redis://:wrong@"), timeout=1.0)
+        with pytest.raises(CacheBackendError):
+            await backend.get("k0")
+
+    @pytest.mark.asyncio
+    async def test_resp_timeout_discards_connection(self, fake_redis):
+        """测试超时的连接被关闭而不是放回连接池，之后的请求使用新连接"""
+        backend = RespCacheBackend(fake_redis.url, pool_size=1, timeout=0.05)
+        fake_redis.delay = 0.2
+        with pytest.raises(asyncio.TimeoutError):
+            await backend.get("k")
+        fake_redis.delay = 0
+        await backend.set("k", b"v", 60)
+        assert await backend.get("k") == b"v"
+        await backend.close()
+
+    def test_incomplete_backend_cannot_be_created(self):
+        """测试未实现全部抽象方法的后端在创建时就报错"""
+        class IncompleteBackend(CacheBackend):
+            async def get_many(self, keys):
+                return [None] * len(keys)
+
+        with pytest.raises(TypeError):
+            IncompleteBackend()
+
+    def test_create_from_url(self):
+        """测试按地址创建后端"""
+        assert create_cache_backend("") is None
+        assert isinstance(create_cache_backend("memory://"), MemoryCacheBackend)
+        backend = create_cache_backend("redis://:p%40ss@cache:6390/2")
+        assert (backend.host, backend.port, backend.password, backend.db) == ("cache", 6390, "p@ss", 2)
+        with pytest.raises(ValueError):
+            create_cache_backend("memcached://cache")
+
+
+class TestBinaryCodec:
+    """共享缓存二进制编码测试类"""
+
+    def test_round_trip(self):
+        """测试编码后解码得到相同的数据，且比JSON更紧凑"""
+        weather = _weather()
+        codec = codec_for(WeatherInDB)
+        data = codec.encode(weather)
+        assert codec.decode(data) == weather
+        assert len(data) < len(weather.model_dump_json()) / 2
+
+        forecast = WeatherForecast(city="Beijing", country="CN", forecast=[ForecastDay(
+            date="2023-12-01", temperature_min=-1.0, temperature_max=5.0, humidity=40,
+            wind_speed=2.0, description="多云", icon="02d"
+        )], updated_at=datetime(2023, 12, 1, 9, 0))
+        decoded = codec_for(WeatherForecast).decode(codec_for(WeatherForecast).encode(forecast))
+        assert decoded == forecast
+        assert decoded.updated_at == forecast.updated_at
+
+    def test_mismatch_is_miss(self):
+        """测试其他模式、旧版本或损坏的数据解码为None"""
+        data = codec_for(WeatherInDB).encode(_weather())
+        assert codec_for(WeatherForecast).decode(data) is None
+        assert codec_for(WeatherInDB).decode(data[:-3]) is None
+        assert codec_for(WeatherInDB).decode(b"\x00" + data[1:]) is None
+
+
+class TestSharedCache:
+    """服务使用共享缓存测试类"""
+
+    @pytest.mark.asyncio
+    async def test_other_worker_reads_shared_cache(self, db_session: Session, shared_backend, monkeypatch):
+        """测试一个进程加载的天气数据写入共享缓存，另一个进程不访问数据库和外部API"""
+        calls = []
+
+        async def mock_fetch_weather_from_api(self, city):
+            calls.append(city)
+            return BEIJING_API_RESPONSE
+
+        monkeypatch.setattr(WeatherService, "fetch_weather_from_api", mock_fetch_weather_from_api)
+        first = await _worker(db_session).get_or_fetch_weather("Beijing")
+
+        second = await _worker(None).get_or_fetch_weather("Beijing")
+        assert second == first
+        assert calls == ["Beijing"]
+
+    @pytest.mark.asyncio
+    async def test_one_upstream_call_across_workers(self, db_session: Session, shared_backend, monkeypatch):
+        """测试多个进程同时请求同一城市时只有一个请求外部API，其余等待共享缓存中的结果"""
+        calls = []
+
+        async def mock_fetch_weather_from_api(self, city):
+            calls.append(city)
+            await asyncio.sleep(0.1)
+            return BEIJING_API_RESPONSE
+
+        monkeypatch.setattr(WeatherService, "fetch_weather_from_api", mock_fetch_weather_from_api)
+        results = await asyncio.gather(*(_worker(db_session).get_or_fetch_weather("Beijing") for _ in range(3)))
+
+        assert calls == ["Beijing"]
+        assert {weather.temperature for weather in results} == {25.5}
+
+    @pytest.mark.asyncio
+    async def test_all_horoscopes_from_one_multi_get(self, db_session: Session, fake_redis):
+        """测试所有星座用一条MGET从共享缓存读取，不访问数据库"""
+        set_cache_backend(RespCacheBackend(fake_redis.url, timeout=1.0))
+        await HoroscopeService(db_session).get_all_today_horoscopes()
+        fake_redis.commands.clear()
+
+        service = HoroscopeService(None, cache=TTLCache(maxsize=16, ttl=3600), flight=SingleFlight())
+        horoscopes = await service.get_all_today_horoscopes()
+
+        assert [horoscope.sign for horoscope in horoscopes] == ZODIAC_SIGNS
+        assert [command[0] for command in fake_redis.commands] == [b"MGET"]
+        assert len(fake_redis.commands[0]) == len(ZODIAC_SIGNS) + 1
+
+    @pytest.mark.asyncio
+    async def test_expired_lock_is_not_released_by_previous_holder(self, shared_backend):
+        """测试持有者超过有效期后锁被其他进程获取，原持有者退出时不会删除新持有者的锁"""
+        shared = SharedCache("test", WeatherInDB)
+        first = shared.fetch_lock("Beijing", ttl=0.05)
+        assert await first.__aenter__()
+        await asyncio.sleep(0.1)
+
+        second = shared.fetch_lock("Beijing", ttl=60)
+        assert await second.__aenter__()
+        await first.__aexit__(None, None, None)
+        async with shared.fetch_lock("Beijing") as third:
+            assert not third
+
+        await second.__aexit__(None, None, None)
+        async with shared.fetch_lock("Beijing") as fourth:
+            assert fourth
+
+    @pytest.mark.asyncio
+    async def test_backend_down_is_miss(self, db_session: Session, fake_redis):
+        """测试共享缓存不可用时按未命中处理，请求照常从数据库和外部API获取"""
+        backend = RespCacheBackend(fake_redis.url, timeout=0.5)
+        await fake_redis.stop()
+        set_cache_backend(backend)
+        shared = SharedCache("test", WeatherInDB)
+
+        await shared.set("Beijing", _weather(), 60)
+        assert await shared.get_many(["Beijing"]) == {}
+        async with shared.fetch_lock("Beijing") as owner:
+            assert owner
+
+        horoscope = await HoroscopeService(db_session).get_or_fetch_horoscope("白羊座")
+        assert horoscope.sign == "白羊座"
@@ -0,0 +1,121 @@
+import pytest
+from sqlalchemy.orm import Session
+
+from app.models.weather import CityAlias, Weather, WeatherForecastCache
+from app.services.weather_service import WeatherService
+from app.utils.cache import city_alias_cache
+
+
+BEIJING_API_RESPONSE = {
+    "name": "Beijing",
+    "sys": {"country": "CN"},
+    "main": {"temp": 25.5, "humidity": 60},
+    "wind": {"speed": 3.5},
+    "weather": [{"description": "晴", "icon": "01d"}]
+}
+
+BEIJING_FORECAST_API_RESPONSE = {
+    "city": {"name": "Beijing", "country": "CN"},
+    "list": [
+        {
+            "dt_txt": "2023-12-01 12:00:00",
+            "main": {"temp_min": 20.0, "temp_max": 25.0, "humidity": 60},
+            "wind": {"speed": 3.5},
+            "weather": [{"description": "晴", "icon": "01d"}]
+        }
+    ]
+}
+
+
+@pytest.fixture
+def upstream_calls(monkeypatch):
+    """模拟外部API，任何城市都返回Beijing，记录请求使用的城市名称"""
+    calls = []
+
+    async def mock_fetch_weather_from_api(self, city):
+        calls.append(("weather", city))
+        return BEIJING_API_RESPONSE
+
+    async def mock_fetch_forecast_from_api(self, city):
+        calls.append(("forecast", city))
+        return BEIJING_FORECAST_API_RESPONSE
+
+    monkeypatch.setattr(WeatherService, "fetch_weather_from_api", mock_fetch_weather_from_api)
+    monkeypatch.setattr(WeatherService, "fetch_forecast_from_api", mock_fetch_forecast_from_api)
+    return calls
+
+
+class TestCityAlias:
+    """城市别名测试类"""
+
+    @pytest.mark.asyncio
+    async def test_spellings_share_one_row(self, db_session: Session, upstream_calls):
+        """测试同一城市的不同写法解析为外部API返回的规范城市名称，只请求一次外部API"""
+        service = WeatherService(db_session)
+
+        for city in ["北京", " 北京 ", "Beijing", "beijing", "BEIJING  "]:
+            weather = await service.get_or_fetch_weather(city)
+            assert weather.city == "Beijing"
+
+        assert upstream_calls == [("weather", "北京")]
+        assert db_session.query(Weather).count() == 1
+        aliases = dict(db_session.query(CityAlias.alias, CityAlias.city).all())
+        assert aliases == {"北京": "Beijing", "beijing": "Beijing"}
+
+    @pytest.mark.asyncio
+    async def test_aliases_loaded_from_database(self, db_session: Session, upstream_calls):
+        """测试其他进程学到的别名从别名表读取，不再请求外部API"""
+        service = WeatherService(db_session)
+        await service.get_or_fetch_weather("北京")
+        city_alias_cache.clear()
+        service.cache.clear()
+
+        weather = await service.get_or_fetch_weather("北京")
+        assert weather.city == "Beijing"
+        assert upstream_calls == [("weather", "北京")]
+
+    @pytest.mark.asyncio
+    async def test_unknown_alias_updates_existing_row(self, db_session: Session, upstream_calls):
+        """测试尚未学到的别名请求外部API后更新规范城市名称下的已有记录，不插入重复数据"""
+        db_session.add(Weather(
+            city="Beijing", country="CN", temperature=1.0, humidity=10,
+            wind_speed=1.0, description="阴", icon="04d"
+        ))
+        db_session.commit()
+        service = WeatherService(db_session)
+
+        weather = await service.get_or_fetch_weather("北京")
+        assert weather.temperature == 25.5
+        assert db_session.query(Weather).count() == 1
+
+    @pytest.mark.asyncio
+    async def test_history_and_forecast_use_canonical_name(self, db_session: Session, upstream_calls):
+        """测试历史数据和天气预报使用同一个规范城市名称"""
+        service = WeatherService(db_session)
+        await service.get_or_fetch_weather("北京")
+
+        history = await service.get_weather_history("北京")
+        assert [item.city for item in history] == ["Beijing"]
+
+        forecast = await service.get_or_fetch_forecast("北京")
+        assert forecast.city == "Beijing"
+        assert upstream_calls == [("weather", "北京"), ("forecast", "Beijing")]
+        assert [row.city_key for row in db_session.query(WeatherForecastCache)] == ["Beijing"]
+
+        await service.get_or_fetch_forecast("beijing")
+        assert len(upstream_calls) == 2
+
+    @pytest.mark.asyncio
+    async def test_batch_merges_spellings(self, db_session: Session, upstream_calls):
+        """测试批量查询中解析为同一城市的多个写法只写入一条记录，结果按请求的名称返回"""
+        service = WeatherService(db_session)
+
+        results, errors = await service.get_or_fetch_weather_batch(["北京", "beijing", "Beijing "])
+        assert errors == {}
+        assert list(results) == ["北京", "beijing", "Beijing "]
+        assert {weather.city for weather in results.values()} == {"Beijing"}
+        assert db_session.query(Weather).count() == 1
+
+        results, _ = await service.get_or_fetch_weather_batch(["BEIJING", "北京"])
+        assert len(upstream_calls) == 2
+        assert results["BEIJING"] == results["北京"]
@@ -0,0 +1,137 @@
+from datetime import datetime
+
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+from starlette.requests import Request
+
+from app.models.weather import Weather
+from app.schemas.weather import WeatherCreate
+from app.utils.conditional import Validators
+
+
+def make_request(headers: dict) -> Request:
+    """构造只带请求头的请求对象"""
+    return Request({
+        "type": "http",
+        "headers": [(k.lower().encode(), v.encode()) for k, v in headers.items()]
+    })
+
+
+class TestValidators:
+    """条件请求校验信息测试类"""
+    
+    def test_etag_depends_on_variant_and_version(self):
+        """测试ETag随表示方式和数据版本变化"""
+        row = Weather(id=1, created_at=datetime(2024, 1, 1, 8, 0, 0))
+        etag = Validators.for_rows(("weather",), [row]).etag
+        assert etag.startswith('"') and etag.endswith('"')
+        assert Validators.for_rows(("weather",), [row]).etag == etag
+        assert Validators.for_rows(("forecast",), [row]).etag != etag
+        row.updated_at = datetime(2024, 1, 1, 9, 0, 0)
+        assert Validators.for_rows(("weather",), [row]).etag != etag
+    
+    def test_is_not_modified(self):
+        """测试If-None-Match与If-Modified-Since的判断"""
+        row = Weather(id=1, created_at=datetime(2024, 1, 1, 8, 0, 0, 500000))
+        validators = Validators.for_rows(("weather",), [row])
+        assert validators.headers()["Last-Modified"] == "Mon, 01 Jan 2024 08:00:00 GMT"
+        
+        assert validators.is_not_modified(make_request({"If-None-Match": validators.etag}))
+        assert validators.is_not_modified(make_request({"If-None-Match": f'"x", W/{validators.etag}'}))
+        assert validators.is_not_modified(make_request({"If-None-Match": "*"}))
+        assert not validators.is_not_modified(make_request({"If-None-Match": '"x"'}))
+        # 带有If-None-Match时忽略If-Modified-Since
+        assert not validators.is_not_modified(make_request({
+            "If-None-Match": '"x"', "If-Modified-Since": "Mon, 01 Jan 2024 09:00:00 GMT"
+        }))
+        
+        assert validators.is_not_modified(make_request({"If-Modified-Since": "Mon, 01 Jan 2024 08:00:00 GMT"}))
+        assert not validators.is_not_modified(make_request({"If-Modified-Since": "Mon, 01 Jan 2024 07:59:59 GMT"}))
+        assert not validators.is_not_modified(make_request({"If-Modified-Since": "not a date"}))
+        assert not validators.is_not_modified(make_request({}))
+
+
+class TestConditionalGet:
+    """条件GET接口测试类"""
+    
+    def test_weather_not_modified(self, client: TestClient, db_session: Session):
+        """测试天气接口返回ETag/Last-Modified并对条件请求返回304"""
+        db_session.add(Weather(**WeatherCreate(
+            city="上海", country="CN", temperature=18.0, humidity=70,
+            wind_speed=2.0, description="多云", icon="02d"
+        ).model_dump()))
+        db_session.commit()
+        
+        response = client.get("/api/weather/上海")
+        assert response.status_code == 200
+        etag = response.headers["etag"]
+        last_modified = response.headers["last-modified"]
+        
+        response = client.get("/api/weather/上海", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["etag"] == etag
+        
+        response = client.get("/api/weather/上海", headers={"If-Modified-Since": last_modified})
+        assert response.status_code == 304
+        
+        response = client.get("/api/weather/上海", headers={"If-None-Match": '"stale"'})
+        assert response.status_code == 200
+        assert response.json()["city"] == "上海"
+    
+    def test_forecast_etag_per_days(self, client: TestClient, monkeypatch):
+        """测试天气预报的ETag区分预报天数，且更新时间不出现在响应体中"""
+        slot = {
+            "main": {"temp_min": 20.0, "temp_max": 25.0, "humidity": 60},
+            "wind": {"speed": 3.5},
+            "weather": [{"description": "晴", "icon": "01d"}]
+        }
+        
+        async def mock_fetch_forecast_from_api(self, city):
+            return {
+                "city": {"name": "北京", "country": "CN"},
+                "list": [
+                    {**slot, "dt_txt": "2023-12-04 12:00:00"},
+                    {**slot, "dt_txt": "2023-12-05 12:00:00"}
+                ]
+            }
+        
+        from app.services.weather_service import WeatherService
+        monkeypatch.setattr(WeatherService, "fetch_forecast_from_api", mock_fetch_forecast_from_api)
+        
+        one_day = client.get("/api/weather/forecast/北京?days=1")
+        two_days = client.get("/api/weather/forecast/北京?days=2")
+        assert one_day.status_code == two_days.status_code == 200
+        assert "updated_at" not in two_days.json()
+        assert one_day.headers["etag"] != two_days.headers["etag"]
+        
+        response = client.get(
+            "/api/weather/forecast/北京?days=2", headers={"If-None-Match": two_days.headers["etag"]}
+        )
+        assert response.status_code == 304
+    
+    def test_horoscope_and_analysis_not_modified(self, client: TestClient, db_session: Session):
+        """测试星座运势和趣味分析接口的条件请求"""
+        db_session.add(Weather(**WeatherCreate(
+            city="上海", country="CN", temperature=18.0, humidity=70,
+            wind_speed=2.0, description="多云", icon="02d"
+        ).model_dump()))
+        db_session.commit()
+        
+        for url in (
+            "/api/horoscope/all/today",
+            "/api/horoscope/白羊座",
+            "/api/horoscope/白羊座/today",
+            "/api/analysis/上海/白羊座",
+        ):
+            response = client.get(url)
+            assert response.status_code == 200, url
+            etag = response.headers["etag"]
+            response = client.get(url, headers={"If-None-Match": etag})
+            assert response.status_code == 304, url
+        
+        # 同一数据的不同表示方式使用不同的ETag
+        assert (
+            client.get("/api/horoscope/白羊座").headers["etag"]
+            != client.get("/api/horoscope/白羊座/today").headers["etag"]
+        )
@@ -0,0 +1,86 @@
+from datetime import datetime
+
+import pytest
+import pytest_asyncio
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.schemas.weather import WeatherCreate, WeatherInDB
+from app.services.weather_service import WeatherService
+from app.utils.cache import TTLCache
+from app.utils.database import Base, LazySession
+from app.utils.singleflight import SingleFlight
+
+
+MOCK_WEATHER_API_RESPONSE = {
+    "name": "北京",
+    "sys": {"country": "CN"},
+    "main": {"temp": 25.5, "humidity": 60},
+    "wind": {"speed": 3.5},
+    "weather": [{"description": "晴", "icon": "01d"}]
+}
+
+MOCK_WEATHER_DATA = WeatherCreate(
+    city="北京", country="CN", temperature=25.5, humidity=60,
+    wind_speed=3.5, description="晴", icon="01d"
+)
+
+
+@pytest_asyncio.fixture
+async def async_session_factory(tmp_path):
+    """创建基于aiosqlite的异步会话工厂"""
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'async.db'}")
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    await async_engine.dispose()
+
+
+class TestLazySession:
+    """惰性数据库会话测试类"""
+    
+    @pytest.mark.asyncio
+    async def test_session_not_created_until_used(self):
+        """测试未使用时不创建会话"""
+        created = []
+        
+        def factory():
+            created.append(1)
+            raise AssertionError("不应创建会话")
+        
+        db = LazySession(factory)
+        assert not db.is_active
+        await db.close()
+        assert created == []
+    
+    @pytest.mark.asyncio
+    async def test_cache_hit_does_not_touch_database(self):
+        """测试缓存命中的请求不创建数据库会话"""
+        cached = WeatherInDB(
+            id=1, created_at=datetime.utcnow(), **MOCK_WEATHER_DATA.model_dump()
+        )
+        cache = TTLCache(maxsize=8, ttl=60)
+        cache.set("北京", cached)
+        db = LazySession(lambda: pytest.fail("不应创建会话"))
+        
+        service = WeatherService(db, cache=cache)
+        assert await service.get_or_fetch_weather("北京") == cached
+        assert not db.is_active
+    
+    @pytest.mark.asyncio
+    async def test_async_session_path(self, async_session_factory, monkeypatch):
+        """测试通过异步会话获取并写入天气数据"""
+        async def mock_fetch_weather_from_api(self, city):
+            return MOCK_WEATHER_API_RESPONSE
+        
+        monkeypatch.setattr(WeatherService, "fetch_weather_from_api", mock_fetch_weather_from_api)
+        db = LazySession(async_session_factory)
+        service = WeatherService(db, cache=TTLCache(maxsize=8, ttl=60), flight=SingleFlight())
+        
+        weather = await service.get_or_fetch_weather("北京")
+        assert weather.city == "北京"
+        assert weather.id is not None
+        assert db.is_active
+        
+        history = await service.get_weather_history("北京")
+        assert [item.city for item in history] == ["北京"]
+        await db.close()
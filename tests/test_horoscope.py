@@ -1,9 +1,11 @@
 import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy import event
 from sqlalchemy.orm import Session
 
 from app.models.horoscope import Horoscope
 from app.schemas.horoscope import HoroscopeCreate
+from tests.conftest import engine
 
 
 class TestHoroscopeAPI:
@@ -18,7 +20,7 @@ class TestHoroscopeAPI:
     def test_get_horoscope_with_mock_data(self, client: TestClient, db_session: Session, monkeypatch):
         """使用模拟数据测试获取星座运势接口"""
         # 模拟HoroscopeService的get_or_fetch_horoscope方法
-        def mock_get_or_fetch_horoscope(self, sign):
+        async def mock_get_or_fetch_horoscope(self, sign):
             # 创建一个模拟的星象数据
             horoscope_data = HoroscopeCreate(
                 sign="白羊座",
@@ -49,7 +51,7 @@ class TestHoroscopeAPI:
     def test_get_today_horoscope(self, client: TestClient, monkeypatch):
         """测试获取今日星座运势接口"""
         # 模拟星象数据
-        def mock_get_or_fetch_horoscope(self, sign):
+        async def mock_get_or_fetch_horoscope(self, sign):
             horoscope_data = HoroscopeCreate(
                 sign="金牛座",
                 date_range="4月20日-5月20日",
@@ -76,9 +78,12 @@ class TestHoroscopeAPI:
         assert "财运不错" in response.json()["today"]
     
     def test_get_all_today_horoscopes(self, client: TestClient, monkeypatch):
-        """测试获取所有星座今日运势接口"""
+        """测试获取所有星座今日运势接口只调用一次批量获取，不逐个星座获取"""
+        calls = []
+        
         # 模拟所有星座数据
-        def mock_get_all_horoscopes(self):
+        async def mock_get_all_today_horoscopes(self):
+            calls.append(1)
             signs = ["白羊座", "金牛座", "双子座"]
             horoscopes = []
             
@@ -100,14 +105,105 @@ class TestHoroscopeAPI:
         
         # 使用monkeypatch替换真实方法
         from app.services.horoscope_service import HoroscopeService
-        monkeypatch.setattr(HoroscopeService, "get_all_horoscopes", mock_get_all_today_horoscopes)
+        monkeypatch.setattr(HoroscopeService, "get_all_today_horoscopes", mock_get_all_today_horoscopes)
+        
+        async def unexpected_get_or_fetch_horoscope(self, sign):
+            raise AssertionError(f"不应逐个获取星座 {sign}")
+        
+        monkeypatch.setattr(HoroscopeService, "get_or_fetch_horoscope", unexpected_get_or_fetch_horoscope)
         
         # 调用API
         response = client.get("/api/horoscope/all/today")
         
         # 验证结果
         assert response.status_code == 200
+        assert len(calls) == 1
         assert len(response.json()) == 3
         assert response.json()[0]["sign"] == "白羊座"
         assert response.json()[1]["sign"] == "金牛座"
         assert response.json()[2]["sign"] == "双子座"
+
+
+class TestHoroscopePrecompute:
+    """每日星象预计算测试类"""
+    
+    @pytest.mark.asyncio
+    async def test_precompute_writes_all_signs_in_one_commit(self, db_session: Session, monkeypatch):
+        """测试预计算在一次提交中写入全部十二星座，重复执行时更新而不是新增"""
+        from app.services.horoscope_service import HoroscopeService, ZODIAC_SIGNS
+        
+        commits = []
+        original_commit = db_session.commit
+        
+        def counting_commit():
+            commits.append(1)
+            original_commit()
+        
+        monkeypatch.setattr(db_session, "commit", counting_commit)
+        service = HoroscopeService(db_session)
+        
+        horoscopes = await service.precompute_daily_horoscopes()
+        assert [h.sign for h in horoscopes] == ZODIAC_SIGNS
+        assert len(commits) == 1
+        
+        await service.precompute_daily_horoscopes()
+        assert len(commits) == 2
+        assert db_session.query(Horoscope).count() == len(ZODIAC_SIGNS)
+        assert all(h.updated_at is not None for h in db_session.query(Horoscope))
+    
+    @pytest.mark.asyncio
+    async def test_all_today_loaded_with_one_query(self, db_session: Session):
+        """测试进程内缓存未命中时，所有星座用一条SELECT从数据库加载"""
+        from app.services.horoscope_service import HoroscopeService, ZODIAC_SIGNS
+        from app.utils.cache import horoscope_cache
+        
+        await HoroscopeService(db_session).precompute_daily_horoscopes()
+        horoscope_cache.clear()
+        
+        statements = []
+        
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        
+        event.listen(engine, "before_cursor_execute", record)
+        try:
+            horoscopes = await HoroscopeService(db_session).get_all_today_horoscopes()
+        finally:
+            event.remove(engine, "before_cursor_execute", record)
+        
+        assert [h.sign for h in horoscopes] == ZODIAC_SIGNS
+        selects = [statement for statement in statements if statement.lstrip().upper().startswith("SELECT")]
+        assert len(selects) == 1
+        assert "FROM horoscope" in selects[0]
+    
+    def test_all_today_served_from_precompute(self, client: TestClient, monkeypatch):
+        """测试/all/today不会被/{sign}/today匹配，冷启动时批量获取一次，之后直接使用缓存"""
+        from app.services.horoscope_service import HoroscopeService, ZODIAC_SIGNS
+        
+        calls = []
+        original_fetch = HoroscopeService.fetch_horoscope_from_api
+        
+        async def counting_fetch(self, sign):
+            calls.append(sign)
+            return await original_fetch(self, sign)
+        
+        monkeypatch.setattr(HoroscopeService, "fetch_horoscope_from_api", counting_fetch)
+        
+        response = client.get("/api/horoscope/all/today")
+        assert response.status_code == 200
+        assert [item["sign"] for item in response.json()] == ZODIAC_SIGNS
+        assert len(calls) == len(ZODIAC_SIGNS)
+        
+        response = client.get("/api/horoscope/all/today")
+        assert response.status_code == 200
+        assert len(response.json()) == len(ZODIAC_SIGNS)
+        assert len(calls) == len(ZODIAC_SIGNS)
+    
+    def test_seconds_until_hour(self):
+        """测试计算到下一个整点的秒数"""
+        from datetime import datetime
+        from app.utils.periodic import seconds_until_hour
+        
+        assert seconds_until_hour(0, now=datetime(2024, 1, 1, 23, 30)) == 30 * 60
+        assert seconds_until_hour(6, now=datetime(2024, 1, 1, 5, 0)) == 3600
+        assert seconds_until_hour(6, now=datetime(2024, 1, 1, 6, 0)) == 24 * 3600
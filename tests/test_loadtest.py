@@ -0,0 +1,101 @@
+import json
+import random
+from collections import Counter
+
+import httpx
+import pytest
+
+from benchmarks import loadtest
+from benchmarks.fake_upstream import UpstreamProfile, create_fake_upstream
+
+
+def _client(profile: UpstreamProfile) -> httpx.AsyncClient:
+    fake_app, _ = create_fake_upstream(profile)
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=fake_app), base_url="http://upstream")
+
+
+class TestFakeUpstream:
+    """模拟上游测试类"""
+
+    @pytest.mark.asyncio
+    async def test_weather_payload_is_parseable(self):
+        """测试模拟上游的天气和预报响应可以被服务解析"""
+        from app.services.weather_service import WeatherService
+
+        async with _client(UpstreamProfile(latency_ms=0)) as client:
+            weather = (await client.get("/data/2.5/weather", params={"q": "City00001"})).json()
+            forecast = (await client.get("/data/2.5/forecast", params={"q": "City00001"})).json()
+
+        service = WeatherService(db=None)
+        assert service.parse_weather_api_response(weather).city == "City00001"
+        assert len(service.parse_forecast_api_response(forecast).forecast) >= 5
+
+    @pytest.mark.asyncio
+    async def test_error_rate_and_unknown_city(self):
+        """测试按错误率返回500，不存在的城市返回404"""
+        async with _client(UpstreamProfile(latency_ms=0, error_rate=1.0)) as client:
+            assert (await client.get("/data/2.5/weather", params={"q": "北京"})).status_code == 500
+        async with _client(UpstreamProfile(latency_ms=0)) as client:
+            assert (await client.get("/data/2.5/weather", params={"q": "unknown-city"})).status_code == 404
+
+    @pytest.mark.asyncio
+    async def test_rate_limit(self):
+        """测试超出令牌桶容量的请求返回429"""
+        async with _client(UpstreamProfile(latency_ms=0, rate_limit=0.001, rate_burst=3)) as client:
+            statuses = [
+                (await client.get("/data/2.5/weather", params={"q": "北京"})).status_code
+                for _ in range(5)
+            ]
+            stats = (await client.get("/stats")).json()
+
+        assert statuses == [200, 200, 200, 429, 429]
+        assert stats == {"weather 200": 3, "weather 429": 2}
+
+
+class TestLoadTest:
+    """负载测试驱动测试类"""
+
+    def test_zipf_sampler_is_skewed(self):
+        """测试Zipf分布下排名靠前的城市被抽到的次数更多"""
+        sampler = loadtest.ZipfSampler(100, 1.1, random.Random(1))
+        counts = Counter(sampler.sample() for _ in range(10000))
+
+        assert counts[0] > counts[9] > counts[99]
+        assert set(counts) <= set(range(100))
+
+    def test_percentile(self):
+        """测试最近秩法百分位数"""
+        values = [float(i) for i in range(1, 101)]
+        assert loadtest.percentile(values, 50) == 50.0
+        assert loadtest.percentile(values, 99) == 99.0
+        assert loadtest.percentile([], 95) == 0.0
+
+    def test_parse_mix_rejects_unknown_kind(self):
+        """测试请求占比中的未知类型报错"""
+        assert loadtest.parse_mix("weather=0.7,analysis=0.3") == {"weather": 0.7, "analysis": 0.3}
+        with pytest.raises(Exception):
+            loadtest.parse_mix("unknown=1")
+
+    def test_upstream_calls_from_metrics(self):
+        """测试从Prometheus文本中读取上游调用次数"""
+        text = (
+            'upstream_requests_total{service="weather",outcome="success"} 12\n'
+            'upstream_requests_total{service="weather",outcome="error"} 3\n'
+            'cache_requests_total{cache="weather",result="hit"} 5\n'
+        )
+        assert loadtest.upstream_calls(text) == {"weather success": 12.0, "weather error": 3.0}
+
+    def test_in_process_run(self, tmp_path):
+        """测试进程内运行应用和模拟上游并输出报告"""
+        output = tmp_path / "report.json"
+        exit_code = loadtest.main([
+            "--requests", "40", "--duration", "10", "--concurrency", "4", "--cities", "20",
+            "--latency-ms", "1", "--seed", "1", "--output", str(output)
+        ])
+        report = json.loads(output.read_text(encoding="utf-8"))
+
+        assert exit_code == 0
+        assert report["requests"] == 40
+        assert report["latency"]["all"]["count"] == 40
+        assert sum(count for key, count in report["fake_upstream"].items() if key.startswith("weather")) >= 1
+        assert report["upstream_calls"]
@@ -0,0 +1,124 @@
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from app.models.weather import Weather
+from app.schemas.weather import WeatherCreate
+from app.services.weather_service import WeatherService
+from app.utils.metrics import Registry, _Metric, track_upstream, UPSTREAM_DURATION, UPSTREAM_REQUESTS
+from app.utils.resilience import weather_upstream
+
+
+class TestRegistry:
+    """指标注册表测试类"""
+    
+    def test_render_prometheus_text(self):
+        """测试计数器、仪表和直方图的文本格式"""
+        registry = Registry()
+        counter = registry.counter("demo_total", "计数", ("kind",))
+        gauge = registry.gauge("demo_size", "大小")
+        histogram = registry.histogram("demo_seconds", "耗时", ("route",), buckets=(0.1, 1.0))
+        
+        counter.labels('a"b').inc()
+        counter.labels('a"b').inc(2)
+        gauge.labels().set_function(lambda: 7)
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.labels("/x/{id}").observe(value)
+        
+        text = registry.render()
+        assert "# TYPE demo_total counter" in text
+        assert 'demo_total{kind="a\\"b"} 3' in text
+        assert "demo_size 7" in text
+        assert 'demo_seconds_bucket{route="/x/{id}",le="0.1"} 2' in text
+        assert 'demo_seconds_bucket{route="/x/{id}",le="1"} 3' in text
+        assert 'demo_seconds_bucket{route="/x/{id}",le="+Inf"} 4' in text
+        assert 'demo_seconds_count{route="/x/{id}"} 4' in text
+        assert 'demo_seconds_sum{route="/x/{id}"} 3.65' in text
+    
+    def test_label_count_checked(self):
+        """测试标签数量不匹配时报错，重复注册时报错"""
+        registry = Registry()
+        counter = registry.counter("demo_total", "计数", ("kind",))
+        with pytest.raises(ValueError):
+            counter.labels("a", "b")
+        with pytest.raises(ValueError):
+            registry.counter("demo_total", "计数")
+    
+    def test_incomplete_metric_cannot_be_created(self):
+        """测试未实现子指标和样本生成的指标类型在创建时就报错"""
+        class IncompleteMetric(_Metric):
+            kind = "untyped"
+        
+        with pytest.raises(TypeError):
+            IncompleteMetric("demo", "示例")
+    
+    @pytest.mark.asyncio
+    async def test_track_upstream(self):
+        """测试外部API请求按结果计数并记录耗时，抛出异常记为失败"""
+        success = UPSTREAM_REQUESTS.labels("test", "success")
+        error = UPSTREAM_REQUESTS.labels("test", "error")
+        duration = UPSTREAM_DURATION.labels("test")
+        before = (success.value, error.value, duration.count)
+        
+        @track_upstream("test")
+        async def fetch(result):
+            if result == "raise":
+                raise RuntimeError("boom")
+            return result
+        
+        assert await fetch({"ok": True}) == {"ok": True}
+        with pytest.raises(RuntimeError):
+            await fetch("raise")
+        assert (success.value - before[0], error.value - before[1], duration.count - before[2]) == (1, 1, 2)
+    
+    @pytest.mark.asyncio
+    async def test_circuit_rejection_is_not_an_upstream_request(self, db_session: Session):
+        """测试只记录实际发出的请求，熔断拒绝时没有请求发出，不计为失败也不记录耗时"""
+        error = UPSTREAM_REQUESTS.labels("weather", "error")
+        duration = UPSTREAM_DURATION.labels("weather")
+        before = (error.value, duration.count)
+        
+        def handler(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(503)
+        
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as http_client:
+            service = WeatherService(db_session, http_client=http_client)
+            assert await service.fetch_weather_from_api("北京") is None
+            assert (error.value - before[0], duration.count - before[1]) == (1, 1)
+            
+            for _ in range(weather_upstream.breaker.failure_threshold):
+                weather_upstream.breaker.record_failure()
+            assert await service.fetch_weather_from_api("北京") is None
+            assert await service.fetch_weather_from_api("北京") is None
+        
+        assert (error.value - before[0], duration.count - before[1]) == (1, 1)
+
+
+class TestMetricsEndpoint:
+    """指标接口测试类"""
+    
+    def test_metrics_endpoint(self, client: TestClient, db_session: Session):
+        """测试/metrics导出路由耗时、缓存命中和连接池指标"""
+        db_session.add(Weather(**WeatherCreate(
+            city="上海", country="CN", temperature=18.0, humidity=70,
+            wind_speed=2.0, description="多云", icon="02d"
+        ).model_dump()))
+        db_session.commit()
+        
+        client.get("/api/weather/上海")
+        client.get("/api/weather/上海")
+        
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        text = response.text
+        # 按路由模板而不是实际城市名分组
+        assert 'http_request_duration_seconds_count{method="GET",route="/api/weather/{city}",status="200"}' in text
+        assert "上海" not in text
+        assert 'cache_requests_total{cache="weather",result="hit"}' in text
+        assert 'cache_requests_total{cache="weather",result="miss"}' in text
+        assert 'cache_entries{cache="weather"}' in text
+        assert 'db_pool_checked_out{engine="sync"}' in text
+        assert 'db_pool_saturation{engine="sync"}' in text
+        assert "# TYPE db_pool_checkout_wait_seconds histogram" in text
@@ -0,0 +1,60 @@
+import pstats
+import tracemalloc
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.utils.config import settings
+
+
+@pytest.fixture
+def profile_dir(tmp_path, monkeypatch):
+    """将分析结果写入临时目录"""
+    monkeypatch.setattr(settings, "PROFILING_OUTPUT_DIR", str(tmp_path))
+    return tmp_path
+
+
+class TestProfiling:
+    """按需性能分析测试类"""
+    
+    def test_disabled_by_default(self, client: TestClient, profile_dir):
+        """测试未配置管理密钥和采样率时不分析，即使带有请求头"""
+        response = client.get("/health", headers={"X-Profile": "anything"})
+        assert response.status_code == 200
+        assert "x-profile-id" not in response.headers
+        assert list(profile_dir.iterdir()) == []
+    
+    def test_profile_with_admin_key(self, client: TestClient, profile_dir, monkeypatch):
+        """测试携带正确的管理密钥时写入pstats格式的分析结果"""
+        monkeypatch.setattr(settings, "PROFILING_ADMIN_KEY", "secret")
+        
+        response = client.get("/health", headers={"X-Profile": "wrong"})
+        assert "x-profile-id" not in response.headers
+        
+        response = client.get("/health", headers={"X-Profile": "secret"})
+        assert response.status_code == 200
+        profile_id = response.headers["x-profile-id"]
+        assert "_GET_health_" in profile_id
+        
+        stats = pstats.Stats(str(profile_dir / f"{profile_id}.prof"))
+        assert stats.total_calls > 0
+        assert not (profile_dir / f"{profile_id}.tracemalloc").exists()
+    
+    def test_profile_allocations(self, client: TestClient, profile_dir, monkeypatch):
+        """测试同时记录内存分配，快照可以被tracemalloc读取"""
+        monkeypatch.setattr(settings, "PROFILING_ADMIN_KEY", "secret")
+        
+        response = client.get("/health", headers={"X-Profile": "secret", "X-Profile-Allocations": "1"})
+        profile_id = response.headers["x-profile-id"]
+        
+        snapshot = tracemalloc.Snapshot.load(str(profile_dir / f"{profile_id}.tracemalloc"))
+        assert snapshot.traces is not None
+        assert not tracemalloc.is_tracing()
+    
+    def test_sampling(self, client: TestClient, profile_dir, monkeypatch):
+        """测试按采样率分析请求"""
+        monkeypatch.setattr(settings, "PROFILING_SAMPLE_RATE", 1.0)
+        
+        response = client.get("/health")
+        assert "x-profile-id" in response.headers
+        assert len(list(profile_dir.glob("*.prof"))) == 1
@@ -0,0 +1,97 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from app.utils.refresh_ahead import RefreshAheadScheduler
+
+
+def make_scheduler(refresh, **overrides) -> RefreshAheadScheduler:
+    """创建测试用的提前刷新调度器"""
+    options = dict(
+        refresh=refresh,
+        ttl=timedelta(minutes=60),
+        lead=timedelta(minutes=2),
+        jitter=timedelta(minutes=1),
+        interval=1,
+        concurrency=2,
+        calls_per_minute=10,
+        idle=timedelta(minutes=30),
+        max_tracked=100
+    )
+    options.update(overrides)
+    return RefreshAheadScheduler(**options)
+
+
+def snapshot(age: timedelta) -> SimpleNamespace:
+    """创建一个指定时长之前更新的数据"""
+    return SimpleNamespace(updated_at=datetime.utcnow() - age, created_at=None)
+
+
+class TestRefreshAheadScheduler:
+    """提前刷新调度器测试类"""
+    
+    @pytest.mark.asyncio
+    async def test_refreshes_keys_close_to_expiry(self):
+        """测试即将到期的热点数据会被刷新，新数据不会"""
+        refreshed = []
+        
+        async def refresh(key):
+            refreshed.append(key)
+            return snapshot(timedelta(0))
+        
+        scheduler = make_scheduler(refresh)
+        scheduler.record_access("北京", snapshot(timedelta(minutes=59)))
+        scheduler.record_access("上海", snapshot(timedelta(minutes=10)))
+        
+        assert await scheduler.run_once() == 1
+        assert refreshed == ["北京"]
+        # 刷新后按新的更新时间重新安排，不会立即再次刷新
+        assert await scheduler.run_once() == 0
+        assert scheduler.stats()["refreshes"] == 1
+    
+    def test_jitter_spreads_refresh_times(self):
+        """测试同一时间写入的数据刷新时间被打散在抖动范围内"""
+        scheduler = make_scheduler(None)
+        updated_at = datetime.utcnow()
+        refresh_times = {scheduler._refresh_at(updated_at) for _ in range(20)}
+        latest = updated_at + timedelta(minutes=58)
+        assert len(refresh_times) > 1
+        assert all(latest - timedelta(minutes=1) <= item <= latest for item in refresh_times)
+    
+    @pytest.mark.asyncio
+    async def test_budget_limits_refreshes(self):
+        """测试每分钟刷新次数不超过预算"""
+        async def refresh(key):
+            return snapshot(timedelta(0))
+        
+        scheduler = make_scheduler(refresh, calls_per_minute=2)
+        for city in ["北京", "上海", "广州"]:
+            scheduler.record_access(city, snapshot(timedelta(minutes=59)))
+        
+        assert await scheduler.run_once() == 2
+        assert await scheduler.run_once() == 0
+        assert scheduler.stats()["skipped_over_budget"] == 2
+    
+    @pytest.mark.asyncio
+    async def test_idle_keys_are_dropped(self):
+        """测试长时间未被读取的城市不再刷新"""
+        async def refresh(key):
+            raise AssertionError("不应刷新")
+        
+        scheduler = make_scheduler(refresh, idle=timedelta(0))
+        scheduler.record_access("北京", snapshot(timedelta(minutes=59)))
+        assert await scheduler.run_once() == 0
+        assert scheduler.stats()["tracked"] == 0
+    
+    @pytest.mark.asyncio
+    async def test_failed_refresh_is_retried_later(self):
+        """测试刷新失败后推迟重试"""
+        async def refresh(key):
+            return None
+        
+        scheduler = make_scheduler(refresh)
+        scheduler.record_access("北京", snapshot(timedelta(minutes=59)))
+        assert await scheduler.run_once() == 1
+        assert await scheduler.run_once() == 0
+        assert scheduler.stats()["failures"] == 1
@@ -0,0 +1,178 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from app.models.weather import WeatherForecastCache
+from app.schemas.weather import ForecastDay, WeatherForecast
+from app.services.weather_service import WeatherService
+from app.utils.resilience import (
+    CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, DeadlineExceeded, ResilientUpstream,
+    forecast_upstream, remaining_budget, request_deadline, weather_upstream
+)
+
+
+def _status_error(status: int) -> httpx.HTTPStatusError:
+    request = httpx.Request("GET", "https://upstream/weather")
+    return httpx.HTTPStatusError("error", request=request, response=httpx.Response(status, request=request))
+
+
+class TestCircuitBreaker:
+    """熔断器测试类"""
+
+    def test_opens_after_consecutive_failures(self):
+        """测试连续失败达到阈值后打开，成功会清零失败次数"""
+        breaker = CircuitBreaker(failure_threshold=3, recovery_timeout=60)
+        breaker.record_failure()
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        breaker.record_failure()
+        assert breaker.current_state() == CLOSED
+
+        breaker.record_failure()
+        assert breaker.current_state() == OPEN
+        assert breaker.allow() is False
+
+    def test_half_open_allows_single_probe(self):
+        """测试恢复时间后只放行一个试探调用，试探失败重新打开，成功则关闭"""
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0.01)
+        breaker.record_failure()
+        time.sleep(0.02)
+
+        assert breaker.current_state() == HALF_OPEN
+        assert breaker.allow() is True
+        assert breaker.allow() is False
+        breaker.record_failure()
+        assert breaker.current_state() == OPEN
+
+        time.sleep(0.02)
+        assert breaker.allow() is True
+        breaker.record_success()
+        assert breaker.current_state() == CLOSED
+
+
+class TestResilientUpstream:
+    """上游保护层测试类"""
+
+    @pytest.mark.asyncio
+    async def test_client_errors_do_not_open_circuit(self):
+        """测试404等客户端错误不计入熔断，5xx计入"""
+        upstream = ResilientUpstream("test", failure_threshold=2, recovery_timeout=60, hedge_after=0)
+
+        async def not_found():
+            raise _status_error(404)
+
+        async def unavailable():
+            raise _status_error(503)
+
+        for _ in range(3):
+            with pytest.raises(httpx.HTTPStatusError):
+                await upstream.call(not_found)
+        assert upstream.status()["state"] == CLOSED
+
+        for _ in range(2):
+            with pytest.raises(httpx.HTTPStatusError):
+                await upstream.call(unavailable)
+        assert upstream.status()["state"] == OPEN
+        with pytest.raises(CircuitOpenError):
+            await upstream.call(not_found)
+
+    @pytest.mark.asyncio
+    async def test_call_limited_by_request_budget(self):
+        """测试调用的超时不超过请求剩余的时间预算，预算用完后不再调用"""
+        upstream = ResilientUpstream("test", failure_threshold=5, recovery_timeout=60, hedge_after=0)
+        calls = []
+
+        async def hang():
+            calls.append(1)
+            await asyncio.sleep(10)
+
+        with request_deadline(0.05):
+            started = time.monotonic()
+            with pytest.raises(asyncio.TimeoutError):
+                await upstream.call(hang)
+            assert time.monotonic() - started < 1
+
+            with pytest.raises(DeadlineExceeded):
+                await upstream.call(hang)
+        assert len(calls) == 1
+        assert remaining_budget() is None
+
+    @pytest.mark.asyncio
+    async def test_hedged_request_returns_first_result(self):
+        """测试第一次调用过慢时发起对冲请求，返回先完成的结果并取消另一个"""
+        upstream = ResilientUpstream("test", failure_threshold=5, recovery_timeout=60, hedge_after=0.02)
+        attempts = []
+        cancelled = []
+
+        async def fetch():
+            attempt = len(attempts)
+            attempts.append(attempt)
+            try:
+                await asyncio.sleep(5 if attempt == 0 else 0.01)
+            except asyncio.CancelledError:
+                cancelled.append(attempt)
+                raise
+            return attempt
+
+        started = time.monotonic()
+        assert await upstream.call(fetch) == 1
+        assert time.monotonic() - started < 1
+        await asyncio.sleep(0)
+        assert cancelled == [0]
+
+
+class TestServiceFallback:
+    """上游不可用时服务层的降级测试类"""
+
+    @pytest.mark.asyncio
+    async def test_open_circuit_fails_fast_and_serves_stale_forecast(self, db_session: Session):
+        """测试熔断时不请求上游，直接返回数据库中的过期预报"""
+        forecast = WeatherForecast(city="北京", country="CN", forecast=[
+            ForecastDay(date="2023-12-04", temperature_min=1.0, temperature_max=5.0,
+                        humidity=40, wind_speed=2.0, description="晴", icon="01d")
+        ])
+        db_session.add(WeatherForecastCache(
+            city_key="北京", city="北京", country="CN", forecast=forecast.model_dump_json(),
+            created_at=datetime.utcnow() - timedelta(days=1)
+        ))
+        db_session.commit()
+
+        requests_seen = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            requests_seen.append(request)
+            return httpx.Response(503)
+
+        for _ in range(forecast_upstream.breaker.failure_threshold):
+            forecast_upstream.breaker.record_failure()
+
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as http_client:
+            service = WeatherService(db_session, http_client=http_client)
+            result = await service.get_or_fetch_forecast("北京")
+
+        assert requests_seen == []
+        assert result.forecast[0].date == "2023-12-04"
+        # 过期的预报不写入缓存，熔断恢复后能重新获取
+        assert service.forecast_cache.get("北京") is None
+
+    def test_health_reports_circuit_state(self, client: TestClient):
+        """测试健康检查返回熔断器状态，熔断时状态为degraded"""
+        response = client.get("/health")
+        assert response.json()["status"] == "healthy"
+        assert response.json()["upstreams"]["weather"]["state"] == CLOSED
+
+        for _ in range(weather_upstream.breaker.failure_threshold):
+            weather_upstream.breaker.record_failure()
+
+        body = client.get("/health").json()
+        assert body["status"] == "degraded"
+        assert body["upstreams"]["weather"]["state"] == OPEN
+
+        metrics = client.get("/metrics").text
+        assert 'upstream_circuit_state{service="weather"} 2' in metrics
@@ -0,0 +1,126 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.testclient import TestClient
+from fastapi.utils import create_response_field
+from sqlalchemy.orm import Session
+
+from app.models.weather import Weather
+from app.schemas.horoscope import HoroscopeInDB, HoroscopeResponse, TodayHoroscope
+from app.schemas.weather import ForecastDay, WeatherCreate, WeatherForecast, WeatherInDB, WeatherResponse
+from app.utils.serialization import encoder_for
+
+
+def default_body(model, content) -> bytes:
+    """FastAPI默认的response_model + JSONResponse生成的响应体"""
+    field = create_response_field(name="response", type_=model)
+    serialized = asyncio.run(
+        serialize_response(field=field, response_content=content, is_coroutine=True)
+    )
+    return JSONResponse(serialized).body
+
+
+def make_weather(**overrides) -> WeatherInDB:
+    data = dict(
+        id=1, city="北京", country="CN", temperature=25.5, humidity=60, wind_speed=3.5,
+        description="晴", icon="01d", created_at=datetime(2024, 1, 1, 8, 0, 0)
+    )
+    data.update(overrides)
+    return WeatherInDB(**data)
+
+
+def make_horoscope(**overrides) -> HoroscopeInDB:
+    data = dict(
+        id=1, sign="白羊座", date_range="3月21日-4月19日", today="白羊座今日运势：良好",
+        tomorrow="一般", week="上升", month="平稳", year="起伏",
+        created_at=datetime(2024, 1, 1, 8, 0, 0)
+    )
+    data.update(overrides)
+    return HoroscopeInDB(**data)
+
+
+class TestSchemaEncoder:
+    """预编译JSON编码器测试类"""
+    
+    @pytest.mark.parametrize("weather", [
+        make_weather(),
+        make_weather(temperature=-0.0, wind_speed=1e16, humidity=0),
+        make_weather(temperature=1e-05, wind_speed=123456.789),
+        make_weather(city='引号"反斜杠\\换行\n制表\t\x01', description="Ünïcödé 🌧️ "),
+        make_weather(created_at=datetime(2024, 1, 1, 8, 0, 0, 123456)),
+        make_weather(created_at=datetime(2024, 1, 1, 8, 0, 0, tzinfo=timezone.utc)),
+        make_weather(created_at=datetime(2024, 1, 1, 8, 0, 0, 5, tzinfo=timezone(timedelta(hours=8)))),
+    ])
+    def test_weather_identical(self, weather):
+        """测试天气响应与默认序列化逐字节一致"""
+        assert encoder_for(WeatherResponse).encode(weather).encode("utf-8") == default_body(WeatherResponse, weather)
+    
+    def test_weather_from_orm_object(self):
+        """测试直接编码ORM对象，整数气温同样输出为浮点数"""
+        weather = Weather(**WeatherCreate(
+            city="上海", country="CN", temperature=18, humidity=70, wind_speed=2, description="多云", icon="02d"
+        ).model_dump())
+        weather.temperature = 18
+        weather.id = 3
+        weather.created_at = datetime(2024, 1, 1)
+        body = encoder_for(WeatherResponse).encode(weather).encode("utf-8")
+        assert body == default_body(WeatherResponse, weather)
+        assert b'"temperature":18.0' in body
+    
+    def test_forecast_identical(self):
+        """测试天气预报（嵌套列表、可选字段、排除字段）与默认序列化逐字节一致"""
+        forecast = WeatherForecast(
+            city="北京", country="CN", updated_at=datetime(2024, 1, 1),
+            forecast=[
+                ForecastDay(date="2024-01-01", temperature_min=-3.5, temperature_max=4.0, temperature_avg=0.25,
+                            humidity=40, wind_speed=5.5, description="晴", icon="01d"),
+                ForecastDay(date="2024-01-02", temperature_min=-1.0, temperature_max=6.0,
+                            humidity=55, wind_speed=2.0, description="小雨", icon="10d"),
+            ]
+        )
+        body = encoder_for(WeatherForecast).encode(forecast).encode("utf-8")
+        assert body == default_body(WeatherForecast, forecast)
+        assert b"updated_at" not in body
+    
+    def test_horoscope_identical(self):
+        """测试星座运势、今日运势及列表与默认序列化逐字节一致"""
+        horoscopes = [make_horoscope(), make_horoscope(id=2, sign="金牛座", today="")]
+        assert encoder_for(HoroscopeResponse).encode(horoscopes[0]).encode("utf-8") == default_body(HoroscopeResponse, horoscopes[0])
+        assert encoder_for(TodayHoroscope).encode(horoscopes[1]).encode("utf-8") == default_body(TodayHoroscope, horoscopes[1])
+        assert encoder_for(TodayHoroscope).encode_list(horoscopes).encode("utf-8") == default_body(
+            list[TodayHoroscope], horoscopes
+        )
+    
+    def test_non_finite_float_rejected(self):
+        """测试与默认序列化一样拒绝NaN和无穷大"""
+        with pytest.raises(ValueError):
+            encoder_for(WeatherResponse).encode(make_weather(temperature=float("nan")))
+    
+    def test_api_responses_identical(self, client: TestClient, db_session: Session, monkeypatch):
+        """测试开启快速序列化后各接口的响应体和响应头不变"""
+        from app.utils.config import settings
+        db_session.add(Weather(**WeatherCreate(
+            city="上海", country="CN", temperature=18.0, humidity=70,
+            wind_speed=2.0, description="多云", icon="02d"
+        ).model_dump()))
+        db_session.commit()
+        
+        urls = [
+            "/api/weather/上海",
+            "/api/horoscope/all/today",
+            "/api/horoscope/白羊座",
+            "/api/horoscope/白羊座/today",
+        ]
+        monkeypatch.setattr(settings, "FAST_SERIALIZATION", False)
+        expected = [client.get(url) for url in urls]
+        monkeypatch.setattr(settings, "FAST_SERIALIZATION", True)
+        actual = [client.get(url) for url in urls]
+        
+        for url, before, after in zip(urls, expected, actual):
+            assert after.status_code == before.status_code == 200, url
+            assert after.content == before.content, url
+            for header in ("content-type", "content-length", "etag", "last-modified"):
+                assert after.headers[header] == before.headers[header], (url, header)
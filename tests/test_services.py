@@ -1,13 +1,18 @@
+import httpx
 import pytest
+import random
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
 
 from app.services.weather_service import WeatherService
 from app.services.horoscope_service import HoroscopeService
-from app.models.weather import Weather
+from app.services.forecast_aggregation import aggregate_forecasts
+from app.models.weather import Weather, WeatherObservation
 from app.models.horoscope import Horoscope
 from app.schemas.weather import WeatherCreate
 from app.schemas.horoscope import HoroscopeCreate
+from benchmarks.bench_forecast_aggregation import baseline_aggregate_forecasts, make_payload
+from tests.conftest import TestingSessionLocal
 
 
 class TestWeatherService:
@@ -63,6 +68,33 @@ class TestWeatherService:
         
         assert should_update is False
         
+    @pytest.mark.asyncio
+    async def test_create_weather(self, db_session: Session):
+        """测试创建天气数据后可以读回，同一城市再次创建时更新已有记录"""
+        service = WeatherService(db_session)
+        weather_data = WeatherCreate(
+            city="北京",
+            country="CN",
+            temperature=20.0,
+            humidity=50,
+            wind_speed=2.0,
+            description="多云",
+            icon="02d"
+        )
+        
+        created = await service.create_weather(weather_data)
+        assert created.id is not None
+        
+        stored = await service.get_weather_by_city("北京")
+        assert stored.id == created.id
+        assert stored.temperature == 20.0
+        assert stored.description == "多云"
+        
+        updated = await service.create_weather(weather_data.model_copy(update={"temperature": 22.0}))
+        assert updated.id == created.id
+        assert db_session.query(Weather).count() == 1
+        assert (await service.get_weather_by_city("北京")).temperature == 22.0
+        
     def test_weather_cache_ttl_custom(self):
         # 测试自定义天气缓存时长
         settings = Settings()
@@ -132,3 +164,159 @@ class TestHoroscopeService:
         
         assert should_update is False
 
+
+
+class TestUpstreamClient:
+    """上游HTTP客户端测试类"""
+    
+    @pytest.mark.asyncio
+    async def test_fetch_weather_uses_shared_client(self, db_session: Session):
+        """测试天气数据通过注入的异步客户端获取"""
+        requests_seen = []
+        
+        def handler(request: httpx.Request) -> httpx.Response:
+            requests_seen.append(request)
+            return httpx.Response(200, json={"name": "北京"})
+        
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as http_client:
+            service = WeatherService(db_session, http_client=http_client)
+            data = await service.fetch_weather_from_api("北京")
+        
+        assert data == {"name": "北京"}
+        assert requests_seen[0].url.path == "/data/2.5/weather"
+        assert requests_seen[0].url.params["q"] == "北京"
+    
+    @pytest.mark.asyncio
+    async def test_fetch_forecast_returns_none_on_error(self, db_session: Session):
+        """测试上游返回错误时返回None"""
+        def handler(request: httpx.Request) -> httpx.Response:
+            return httpx.Response(503)
+        
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as http_client:
+            service = WeatherService(db_session, http_client=http_client)
+            assert await service.fetch_forecast_from_api("北京") is None
+
+
+def make_forecast_item(dt_txt, temp, temp_min, temp_max, humidity, wind_speed, description):
+    """构造一个3小时预报条目"""
+    return {
+        "dt_txt": dt_txt,
+        "main": {"temp": temp, "temp_min": temp_min, "temp_max": temp_max, "humidity": humidity},
+        "wind": {"speed": wind_speed},
+        "weather": [{"description": description, "icon": "01d" if description == "晴" else "10d"}]
+    }
+
+
+class TestForecastAggregation:
+    """天气预报聚合测试类"""
+    
+    def test_daily_extremes_and_means(self):
+        """测试每日预报取所有时段的真实极值、均值和出现最多的天气"""
+        api_response = {
+            "city": {"name": "北京", "country": "CN"},
+            "list": [
+                make_forecast_item("2023-12-04 09:00:00", 18.0, 17.0, 19.0, 50, 2.0, "晴"),
+                make_forecast_item("2023-12-04 12:00:00", 24.0, 23.0, 26.0, 40, 5.5, "小雨"),
+                make_forecast_item("2023-12-04 15:00:00", 21.0, 20.0, 22.0, 60, 3.0, "晴"),
+                make_forecast_item("2023-12-05 00:00:00", 10.0, 9.0, 11.0, 80, 1.0, "小雨"),
+            ]
+        }
+        
+        forecast = aggregate_forecasts([api_response])[0]
+        first, second = forecast.forecast
+        
+        assert first.date == "2023-12-04"
+        assert first.temperature_min == 17.0
+        assert first.temperature_max == 26.0
+        assert first.temperature_avg == 21.0
+        assert first.humidity == 50
+        assert first.wind_speed == 5.5
+        assert first.description == "晴"
+        assert first.icon == "01d"
+        assert second.date == "2023-12-05"
+        assert second.description == "小雨"
+    
+    def test_multiple_cities_in_one_pass(self):
+        """测试一次聚合多个城市的预报"""
+        responses = [
+            {
+                "city": {"name": city, "country": "CN"},
+                "list": [make_forecast_item("2023-12-04 12:00:00", temp, temp, temp, 50, 1.0, "晴")]
+            }
+            for city, temp in [("北京", 10.0), ("上海", 20.0)]
+        ]
+        
+        forecasts = aggregate_forecasts(responses)
+        assert [forecast.city for forecast in forecasts] == ["北京", "上海"]
+        assert [forecast.forecast[0].temperature_avg for forecast in forecasts] == [10.0, 20.0]
+    
+    def test_matches_baseline(self):
+        """测试按列归约的结果与改写前逐条目分组的实现相同，包括未排序的条目、缺少temp的条目和空列表"""
+        rng = random.Random(7)
+        payloads = [make_payload(f"城市{index}", 5, rng) for index in range(20)]
+        rng.shuffle(payloads[0]["list"])
+        for item in payloads[1]["list"][::3]:
+            del item["main"]["temp"]
+        payloads.append({"city": {"name": "空", "country": "CN"}, "list": []})
+        
+        assert aggregate_forecasts(payloads) == baseline_aggregate_forecasts(payloads)
+
+
+class TestWeatherObservations:
+    """天气观测记录测试类"""
+    
+    def _add_observations(self, db_session: Session, days_ago):
+        """写入若干天前的观测记录"""
+        now = datetime.utcnow()
+        for days in days_ago:
+            db_session.add(WeatherObservation(
+                city="北京", country="CN", temperature=float(days), humidity=50,
+                wind_speed=1.0, description="晴", icon="01d",
+                observed_at=now - timedelta(days=days)
+            ))
+        db_session.commit()
+        return now
+    
+    @pytest.mark.asyncio
+    async def test_history_time_range(self, db_session: Session):
+        """测试按观测时间范围查询历史数据"""
+        now = self._add_observations(db_session, [1, 3, 5, 7])
+        service = WeatherService(db_session)
+        
+        history = await service.get_weather_history(
+            "北京", limit=10, start=now - timedelta(days=6), end=now - timedelta(days=2)
+        )
+        assert [item.temperature for item in history] == [3.0, 5.0]
+    
+    @pytest.mark.asyncio
+    async def test_prune_in_batches(self, db_session: Session):
+        """测试分批删除过期的观测记录"""
+        now = self._add_observations(db_session, [1, 30, 60, 90])
+        service = WeatherService(db_session)
+        
+        deleted = await service.prune_observations(now - timedelta(days=10), batch_size=2)
+        assert deleted == 3
+        remaining = await service.get_weather_history("北京", limit=10)
+        assert [item.temperature for item in remaining] == [1.0]
+    
+    @pytest.mark.asyncio
+    async def test_fetch_appends_observation(self, db_session: Session, monkeypatch):
+        """测试每次从外部API获取天气都会追加观测记录"""
+        async def mock_fetch_weather_from_api(self, city):
+            return {
+                "name": "北京",
+                "sys": {"country": "CN"},
+                "main": {"temp": 25.5, "humidity": 60},
+                "wind": {"speed": 3.5},
+                "weather": [{"description": "晴", "icon": "01d"}]
+            }
+        
+        monkeypatch.setattr(WeatherService, "fetch_weather_from_api", mock_fetch_weather_from_api)
+        service = WeatherService(db_session, session_factory=TestingSessionLocal)
+        
+        await service.get_or_fetch_weather("北京")
+        service.cache.clear()
+        await service.refresh_weather("北京")
+        
+        assert db_session.query(Weather).count() == 1
+        assert db_session.query(WeatherObservation).count() == 2
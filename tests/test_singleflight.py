@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+from sqlalchemy.orm import Session
+
+from app.services.weather_service import WeatherService
+from app.utils.cache import TTLCache
+from app.utils.singleflight import SingleFlight
+
+
+class TestSingleFlight:
+    """并发调用合并测试类"""
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_calls_share_result(self):
+        """测试同一个键的并发调用只执行一次"""
+        flight = SingleFlight()
+        calls = []
+        
+        async def load():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "北京"
+        
+        results = await asyncio.gather(*[flight.do("北京", load) for _ in range(10)])
+        assert results == ["北京"] * 10
+        assert len(calls) == 1
+        assert flight.stats() == {"in_flight": 0, "executions": 1, "shared": 9}
+    
+    @pytest.mark.asyncio
+    async def test_exception_is_shared(self):
+        """测试异常会传递给所有等待者，且之后可以重新执行"""
+        flight = SingleFlight()
+        
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("上游错误")
+        
+        results = await asyncio.gather(
+            flight.do("北京", fail), flight.do("北京", fail), return_exceptions=True
+        )
+        assert all(isinstance(result, RuntimeError) for result in results)
+        assert not flight.in_flight("北京")
+    
+    @pytest.mark.asyncio
+    async def test_weather_misses_coalesced(self, db_session: Session, monkeypatch):
+        """测试并发的缓存未命中只请求一次外部API"""
+        calls = []
+        
+        async def mock_fetch_weather_from_api(self, city):
+            calls.append(city)
+            return {
+                "name": "北京",
+                "sys": {"country": "CN"},
+                "main": {"temp": 25.5, "humidity": 60},
+                "wind": {"speed": 3.5},
+                "weather": [{"description": "晴", "icon": "01d"}]
+            }
+        
+        monkeypatch.setattr(WeatherService, "fetch_weather_from_api", mock_fetch_weather_from_api)
+        service = WeatherService(db_session, cache=TTLCache(maxsize=8, ttl=60), flight=SingleFlight())
+        
+        results = await asyncio.gather(*[service.get_or_fetch_weather("北京") for _ in range(5)])
+        assert calls == ["北京"]
+        assert all(result.city == "北京" for result in results)
@@ -0,0 +1,228 @@
+import asyncio
+import json
+from urllib.parse import quote
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
+
+from app.main import app
+from app.schemas.weather import WeatherUpdate
+from app.services.subscription_service import HOROSCOPE, WEATHER, SubscriptionService, update_hub
+from app.services.weather_service import WeatherService
+from app.utils.config import settings
+from app.utils.database import get_db
+from app.utils.subscriptions import SubscriptionHub
+
+
+BEIJING_API_RESPONSE = {
+    "name": "Beijing",
+    "sys": {"country": "CN"},
+    "main": {"temp": 25.5, "humidity": 60},
+    "wind": {"speed": 3.5},
+    "weather": [{"description": "晴", "icon": "01d"}]
+}
+
+
+@pytest.fixture
+def mock_weather_api(monkeypatch):
+    """模拟天气API：Beijing有数据，其他城市不存在"""
+    calls = []
+
+    async def mock_fetch_weather_from_api(self, city):
+        calls.append(city)
+        return BEIJING_API_RESPONSE if city.lower() == "beijing" else None
+
+    monkeypatch.setattr(WeatherService, "fetch_weather_from_api", mock_fetch_weather_from_api)
+    return calls
+
+
+@pytest.fixture
+def override_db(db_session: Session):
+    """直接调用应用时使用测试数据库会话"""
+    app.dependency_overrides[get_db] = lambda: db_session
+    yield db_session
+    app.dependency_overrides.clear()
+
+
+async def _call_stream(query: str, send, disconnected: asyncio.Event):
+    """直接以ASGI调用SSE接口，disconnected置位后模拟客户端断开"""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": "/api/subscriptions/stream", "raw_path": b"/api/subscriptions/stream",
+        "root_path": "", "query_string": quote(query, safe="=&").encode(), "headers": [(b"host", b"test")],
+        "client": ("test", 1), "server": ("test", 80),
+    }
+    requested = False
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    await asyncio.wait_for(app(scope, receive, send), 5)
+
+
+def _parse_events(body: bytes):
+    """解析SSE响应体中的事件，返回[(事件名称, 数据)]"""
+    events = []
+    for block in body.decode().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines() if not line.startswith(":"))
+        if lines:
+            events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+class TestSubscriptionHub:
+    """订阅中心测试类"""
+
+    @pytest.mark.asyncio
+    async def test_publish_only_changed_fields(self):
+        """测试新订阅者收到完整数据，之后只推送变化的字段，没有变化时不推送"""
+        hub = SubscriptionHub(max_connections=10)
+        first = hub.connect()
+        hub.subscribe(first, [(WEATHER, "Beijing")])
+
+        assert hub.publish((WEATHER, "Beijing"), {"city": "Beijing", "temperature": 20}) == {
+            "city": "Beijing", "temperature": 20
+        }
+        assert hub.publish((WEATHER, "Beijing"), {"city": "Beijing", "temperature": 21}) == {"temperature": 21}
+        assert hub.publish((WEATHER, "Beijing"), {"city": "Beijing", "temperature": 21}) == {}
+
+        second = hub.connect()
+        hub.subscribe(second, [(WEATHER, "Beijing")])
+        assert await first.next(0.1) == [((WEATHER, "Beijing"), {"city": "Beijing", "temperature": 21})]
+        assert await second.next(0.1) == [((WEATHER, "Beijing"), {"city": "Beijing", "temperature": 21})]
+        assert await first.next(0.01) == []
+
+    @pytest.mark.asyncio
+    async def test_slow_subscriber_memory_is_bounded(self):
+        """测试客户端未接收时同一主题的变化合并为一份，待发送数据不随更新次数增长"""
+        hub = SubscriptionHub(max_connections=10)
+        subscription = hub.connect()
+        hub.subscribe(subscription, [(WEATHER, "Beijing"), (HOROSCOPE, "白羊座")])
+        hub.publish((HOROSCOPE, "白羊座"), {"sign": "白羊座", "lucky_number": 1})
+        for temperature in range(1000):
+            hub.publish((WEATHER, "Beijing"), {"temperature": temperature, "humidity": temperature % 2})
+
+        assert dict(await subscription.next(0.1)) == {
+            (WEATHER, "Beijing"): {"temperature": 999, "humidity": 1},
+            (HOROSCOPE, "白羊座"): {"sign": "白羊座", "lucky_number": 1},
+        }
+
+    @pytest.mark.asyncio
+    async def test_connection_limit_and_disconnect(self):
+        """测试连接数上限，断开后释放连接并删除没有订阅者的主题数据"""
+        hub = SubscriptionHub(max_connections=1)
+        subscription = hub.connect()
+        assert hub.connect() is None
+
+        hub.subscribe(subscription, [(WEATHER, "Beijing")])
+        hub.publish((WEATHER, "Beijing"), {"temperature": 20})
+        hub.disconnect(subscription)
+
+        assert len(hub) == 0
+        assert hub.topics(WEATHER) == []
+        assert not hub.has_state((WEATHER, "Beijing"))
+        assert await subscription.next(1) is None
+        assert hub.connect() is not None
+
+
+class TestSubscriptionService:
+    """推送订阅服务测试类"""
+
+    @pytest.mark.asyncio
+    async def test_subscribe_and_refresh(self, db_session: Session, mock_weather_api):
+        """测试订阅时加载初始数据，刷新时只推送变化的字段，未找到的城市和未知星座返回错误"""
+        hub = SubscriptionHub(max_connections=10)
+        service = SubscriptionService(db_session, hub)
+        subscription = hub.connect()
+
+        result = await service.subscribe(subscription, ["Beijing", "beijing", "Atlantis"], ["白羊座", "蛇夫座"])
+        assert result["cities"] == {"Beijing": "Beijing", "beijing": "Beijing"}
+        assert result["signs"] == ["白羊座"]
+        assert set(result["errors"]) == {"Atlantis", "蛇夫座"}
+        assert subscription.topics == {(WEATHER, "Beijing"), (HOROSCOPE, "白羊座")}
+
+        initial = dict(await subscription.next(0.1))
+        assert initial[(WEATHER, "Beijing")]["temperature"] == 25.5
+        assert initial[(HOROSCOPE, "白羊座")]["sign"] == "白羊座"
+
+        assert await service.refresh() == 0
+        weather = await service.weather_service.get_weather_by_city("Beijing")
+        await service.weather_service.update_weather(weather.id, WeatherUpdate(temperature=30.0))
+        assert await service.refresh() == 1
+
+        changes = dict(await subscription.next(0.1))[(WEATHER, "Beijing")]
+        assert changes["temperature"] == 30.0
+        assert "city" not in changes and "humidity" not in changes
+        assert mock_weather_api == ["Beijing", "Atlantis"]
+
+
+class TestSubscriptionAPI:
+    """推送订阅接口测试类"""
+
+    @pytest.mark.asyncio
+    async def test_event_stream(self, override_db, mock_weather_api):
+        """测试SSE接口先发送订阅结果和完整数据，客户端断开后释放连接"""
+        disconnected = asyncio.Event()
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+            if len(messages) == 3:
+                disconnected.set()
+
+        await _call_stream("city=Beijing&sign=白羊座", send, disconnected)
+
+        assert messages[0]["status"] == 200
+        assert dict(messages[0]["headers"])[b"content-type"].startswith(b"text/event-stream")
+        events = _parse_events(b"".join(message.get("body", b"") for message in messages[1:]))
+        assert events[0] == ("subscribed", {"cities": {"Beijing": "Beijing"}, "signs": ["白羊座"], "errors": {}})
+        assert {name for name, _ in events[1:]} == {"weather", "horoscope"}
+        weather = next(data for name, data in events if name == "weather")
+        assert weather["city"] == "Beijing" and weather["changes"]["temperature"] == 25.5
+        assert len(update_hub) == 0
+
+    @pytest.mark.asyncio
+    async def test_slow_client_is_dropped(self, override_db, mock_weather_api, monkeypatch):
+        """测试客户端长时间不接收数据时断开连接，不再为其保留待发送的数据"""
+        monkeypatch.setattr(settings, "SUBSCRIPTION_SEND_TIMEOUT_SECONDS", 0.05)
+        never = asyncio.Event()
+
+        async def send(message):
+            if message.get("body"):
+                await never.wait()
+
+        await _call_stream("city=Beijing", send, never)
+        assert len(update_hub) == 0
+        assert update_hub.topics(WEATHER) == []
+
+    def test_stream_validates_topics(self, client: TestClient, monkeypatch):
+        """测试没有订阅内容或超过订阅数量上限时返回400，连接数已满时返回503"""
+        assert client.get("/api/subscriptions/stream").status_code == 400
+        monkeypatch.setattr(settings, "SUBSCRIPTION_MAX_TOPICS", 1)
+        assert client.get("/api/subscriptions/stream?city=Beijing&sign=白羊座").status_code == 400
+
+        monkeypatch.setattr(update_hub, "max_connections", 0)
+        assert client.get("/api/subscriptions/stream?city=Beijing").status_code == 503
+
+    def test_websocket(self, client: TestClient, mock_weather_api):
+        """测试WebSocket订阅后收到订阅结果和完整数据，可以取消订阅，错误的消息返回错误"""
+        with client.websocket_connect("/api/subscriptions/ws") as websocket:
+            websocket.send_text(json.dumps({"action": "subscribe", "cities": ["Beijing"], "signs": ["白羊座"]}))
+            assert websocket.receive_json() == {
+                "event": "subscribed", "cities": {"Beijing": "Beijing"}, "signs": ["白羊座"], "errors": {}
+            }
+            events = {message["event"]: message for message in (websocket.receive_json(), websocket.receive_json())}
+            assert events["weather"]["changes"]["temperature"] == 25.5
+            assert events["horoscope"]["sign"] == "白羊座"
+
+            websocket.send_text(json.dumps({"action": "unsubscribe", "cities": ["Beijing"]}))
+            websocket.send_text("not json")
+            assert websocket.receive_json()["event"] == "error"
+            assert update_hub.topics(WEATHER) == []
+            assert update_hub.topics(HOROSCOPE) == ["白羊座"]
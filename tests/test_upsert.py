@@ -0,0 +1,181 @@
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Iterator, List
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.models.horoscope import Horoscope
+from app.models.weather import Weather, WeatherObservation
+from app.models.weather_rollup import WeatherRollupDaily, WeatherRollupHourly
+from app.services.horoscope_service import HoroscopeService, ZODIAC_SIGNS
+from app.services.rollup_service import apply_observations
+from app.utils import upsert as upsert_module
+from app.utils.upsert import upsert
+from tests.conftest import TestingSessionLocal, engine
+
+
+def _weather(city: str, temperature: float) -> dict:
+    return {
+        "city": city, "country": "CN", "temperature": temperature, "humidity": 50,
+        "wind_speed": 1.0, "description": "晴", "icon": "01d"
+    }
+
+
+@contextmanager
+def _statements() -> Iterator[List[str]]:
+    """记录执行的SQL语句"""
+    statements: List[str] = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+
+class TestUpsert:
+    """批量插入或更新测试类"""
+
+    @pytest.fixture(params=[True, False], ids=["returning", "fallback"])
+    def returning(self, request, monkeypatch):
+        """分别测试ON CONFLICT ... RETURNING和不支持时的退回方式"""
+        monkeypatch.setattr(upsert_module, "supports_upsert_returning", lambda dialect: request.param)
+        return request.param
+
+    def test_inserts_and_updates(self, db_session: Session, returning):
+        """测试已有记录被更新并刷新updated_at，不存在的记录被新建，同一个键以最后一行为准"""
+        created_at = datetime.utcnow() - timedelta(days=1)
+        db_session.add(Weather(**_weather("北京", 1.0), created_at=created_at))
+        db_session.commit()
+
+        saved = upsert(db_session, Weather, [
+            _weather("北京", 10.0), _weather("上海", 20.0), _weather("上海", 21.0)
+        ], key="city")
+        db_session.commit()
+
+        assert saved["北京"].temperature == 10.0
+        assert saved["北京"].created_at.replace(tzinfo=None) == created_at
+        assert saved["北京"].updated_at is not None
+        assert saved["上海"].temperature == 21.0
+        assert saved["上海"].id is not None
+        rows = {row.city: row.temperature for row in db_session.query(Weather)}
+        assert rows == {"北京": 10.0, "上海": 21.0}
+
+    def test_single_statement_without_reload(self, db_session: Session):
+        """测试支持RETURNING时整批只执行一条语句，提交后读取属性不再查询"""
+        with _statements() as statements:
+            saved = upsert(db_session, Weather, [_weather(f"城市{i}", float(i)) for i in range(5)], key="city")
+            db_session.commit()
+            assert [saved[f"城市{i}"].temperature for i in range(5)] == [0.0, 1.0, 2.0, 3.0, 4.0]
+
+        assert len(statements) == 1
+        assert "ON CONFLICT" in statements[0] and "RETURNING" in statements[0]
+
+    def test_chunks_large_batches(self, db_session: Session, monkeypatch):
+        """测试超过UPSERT_CHUNK_SIZE的批量按块执行"""
+        monkeypatch.setattr(upsert_module, "UPSERT_CHUNK_SIZE", 2)
+        with _statements() as statements:
+            saved = upsert(db_session, Weather, [_weather(f"城市{i}", float(i)) for i in range(5)], key="city")
+        db_session.commit()
+
+        assert len(statements) == 3
+        assert len(saved) == 5
+        assert db_session.query(Weather).count() == 5
+
+
+def _observation(temperature: float, humidity: int, wind_speed: float, minute: int) -> WeatherObservation:
+    return WeatherObservation(
+        city="北京", country="CN", temperature=temperature, humidity=humidity, wind_speed=wind_speed,
+        description="晴", icon="01d", observed_at=datetime(2024, 1, 1, 8, minute)
+    )
+
+
+class TestRollupAccumulate:
+    """观测聚合累加测试类"""
+
+    @pytest.fixture(params=[True, False], ids=["on_conflict", "fallback"])
+    def on_conflict(self, request, monkeypatch):
+        """分别测试INSERT ... ON CONFLICT DO UPDATE和不支持时逐条UPDATE的退回方式"""
+        monkeypatch.setattr(upsert_module, "supports_upsert", lambda dialect: request.param)
+        return request.param
+
+    def test_same_bucket_from_two_sessions(self, db_session: Session, on_conflict):
+        """测试两个会话（如两个工作进程）同时写入同一个时间桶时累加，而不是唯一约束冲突或覆盖
+
+        第一个会话写入后暂不提交，第二个会话此时写入同一个时间桶，需等待第一个会话提交后继续。
+        """
+        first_written = threading.Event()
+        errors = []
+
+        def write(observations, wait_for=None, hold=0.0):
+            session = TestingSessionLocal()
+            try:
+                if wait_for is not None:
+                    wait_for.wait(5)
+                apply_observations(session, observations)
+                first_written.set()
+                time.sleep(hold)
+                session.commit()
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                session.close()
+
+        threads = [
+            threading.Thread(target=write, args=(
+                [_observation(10.0, 40, 1.0, 10), _observation(14.0, 60, 3.0, 20)],
+            ), kwargs={"hold": 0.2}),
+            threading.Thread(target=write, args=(
+                [_observation(8.0, 70, 2.0, 30)],
+            ), kwargs={"wait_for": first_written}),
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert errors == []
+        for model in (WeatherRollupHourly, WeatherRollupDaily):
+            rollup = db_session.query(model).one()
+            assert rollup.sample_count == 3
+            assert rollup.temperature_sum == 32.0
+            assert (rollup.temperature_min, rollup.temperature_max) == (8.0, 14.0)
+            assert (rollup.humidity_sum, rollup.humidity_min, rollup.humidity_max) == (170, 40, 70)
+            assert (rollup.wind_speed_sum, rollup.wind_speed_max) == (6.0, 3.0)
+
+    def test_no_read_before_write(self, db_session: Session):
+        """测试每种粒度只执行一条INSERT ... ON CONFLICT DO UPDATE，不先查询已有的时间桶"""
+        apply_observations(db_session, [_observation(10.0, 40, 1.0, 10)])
+        db_session.commit()
+        with _statements() as statements:
+            apply_observations(db_session, [_observation(12.0, 50, 1.0, 20), _observation(9.0, 50, 1.0, 40)])
+            db_session.commit()
+
+        assert len(statements) == 2
+        assert all(statement.startswith("INSERT") and "ON CONFLICT" in statement for statement in statements)
+        assert db_session.query(WeatherRollupHourly).one().sample_count == 3
+
+
+class TestServiceUpsert:
+    """服务层写入测试类"""
+
+    @pytest.mark.asyncio
+    async def test_precompute_twice_keeps_one_row_per_sign(self, db_session: Session):
+        """测试重复预计算时更新已有的星座，不插入重复数据"""
+        service = HoroscopeService(db_session)
+        first = await service.precompute_daily_horoscopes()
+        with _statements() as statements:
+            second = await service.precompute_daily_horoscopes()
+
+        assert [item.sign for item in second] == ZODIAC_SIGNS
+        assert [item.id for item in second] == [item.id for item in first]
+        assert all(item.updated_at is not None for item in second)
+        assert db_session.query(Horoscope).count() == len(ZODIAC_SIGNS)
+        assert [statement.split()[0] for statement in statements] == ["INSERT"]
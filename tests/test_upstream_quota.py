@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+from app.utils.resilience import QuotaExceeded, ResilientUpstream
+from app.utils.upstream_quota import Priority, UpstreamQuota, current_priority, upstream_priority
+
+
+def _quota(calls_per_minute: int = 600, burst: int = 2, **kwargs) -> UpstreamQuota:
+    options = {
+        "reserve": {Priority.REFRESH: 0.0, Priority.BULK: 0.0},
+        "max_wait": {Priority.INTERACTIVE: 1.0, Priority.REFRESH: 1.0, Priority.BULK: 1.0},
+        "max_queue": 100,
+    }
+    options.update(kwargs)
+    return UpstreamQuota("test", calls_per_minute, burst, **options)
+
+
+class TestUpstreamQuota:
+    """上游配额调度测试类"""
+
+    @pytest.mark.asyncio
+    async def test_waiters_served_by_priority(self):
+        """测试令牌用完后排队的调用按优先级取得令牌，同一优先级先到先得"""
+        quota = _quota(calls_per_minute=1200, burst=1)
+        assert await quota.acquire(Priority.BULK)
+        order = []
+
+        async def call(name: str, priority: Priority) -> None:
+            assert await quota.acquire(priority)
+            order.append(name)
+
+        tasks = [asyncio.create_task(call("bulk", Priority.BULK))]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(call("refresh", Priority.REFRESH)))
+        tasks.append(asyncio.create_task(call("interactive-1", Priority.INTERACTIVE)))
+        tasks.append(asyncio.create_task(call("interactive-2", Priority.INTERACTIVE)))
+        await asyncio.gather(*tasks)
+
+        assert order == ["interactive-1", "interactive-2", "refresh", "bulk"]
+
+    @pytest.mark.asyncio
+    async def test_reserve_keeps_tokens_for_interactive(self):
+        """测试批量调用不会用掉为用户请求保留的令牌"""
+        quota = _quota(calls_per_minute=1, burst=4, reserve={Priority.BULK: 0.5},
+                       max_wait={Priority.INTERACTIVE: 0, Priority.BULK: 0})
+        granted = [await quota.acquire(Priority.BULK) for _ in range(4)]
+        assert granted == [True, True, False, False]
+
+        assert await quota.acquire(Priority.INTERACTIVE)
+        assert await quota.acquire(Priority.INTERACTIVE)
+        assert not await quota.acquire(Priority.INTERACTIVE)
+
+    @pytest.mark.asyncio
+    async def test_sheds_when_wait_too_long_or_queue_full(self):
+        """测试等待超过上限或排队已满的调用被放弃，不占用之后的令牌"""
+        quota = _quota(calls_per_minute=60, burst=1, max_queue=1,
+                       max_wait={Priority.REFRESH: 0.05, Priority.BULK: 5})
+        assert await quota.acquire(Priority.INTERACTIVE)
+
+        assert not await quota.acquire(Priority.REFRESH)
+        waiting = asyncio.create_task(quota.acquire(Priority.BULK))
+        await asyncio.sleep(0)
+        assert not await quota.acquire(Priority.BULK, timeout=5)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        assert quota.status()["queued"] == {}
+
+    @pytest.mark.asyncio
+    async def test_upstream_priority_context(self):
+        """测试保护层按上下文中的优先级排队，配额不足时抛出QuotaExceeded且不计入熔断"""
+        quota = _quota(calls_per_minute=1, burst=1, max_wait={Priority.INTERACTIVE: 0, Priority.BULK: 0})
+        upstream = ResilientUpstream("test", failure_threshold=1, recovery_timeout=60, hedge_after=0, quota=quota)
+
+        async def fetch() -> Priority:
+            return current_priority()
+
+        with upstream_priority(Priority.BULK):
+            assert await upstream.call(fetch) == Priority.BULK
+            with pytest.raises(QuotaExceeded):
+                await upstream.call(fetch)
+        assert current_priority() == Priority.INTERACTIVE
+        assert upstream.status()["state"] == "closed"
+        assert upstream.breaker.allow()
+
+    @pytest.mark.asyncio
+    async def test_disabled_quota_never_waits(self):
+        """测试calls_per_minute为0时不限制调用次数"""
+        quota = _quota(calls_per_minute=0, burst=1)
+        assert all([await quota.acquire(Priority.BULK) for _ in range(100)])
+        assert quota.status()["tokens"] is None
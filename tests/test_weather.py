@@ -30,7 +30,7 @@ class TestWeatherAPI:
     def test_get_weather_with_mock_data(self, client: TestClient, db_session: Session, monkeypatch):
         """使用模拟数据测试获取天气接口"""
         # 模拟WeatherService的get_or_fetch_weather方法
-        def mock_get_or_fetch_weather(self, city):
+        async def mock_get_or_fetch_weather(self, city):
             # 创建一个模拟的天气数据
             weather_data = WeatherCreate(
                 city="北京",
@@ -105,7 +105,7 @@ class TestWeatherAPI:
         }
         
         # 模拟fetch_forecast_from_api方法
-        def mock_fetch_forecast_from_api(self, city):
+        async def mock_fetch_forecast_from_api(self, city):
             return mock_api_response
         
         # 使用monkeypatch替换真实方法
@@ -121,3 +121,95 @@ class TestWeatherAPI:
         assert len(response.json()["forecast"]) == 2
         assert response.json()["forecast"][0]["date"] == "2023-12-04"
         assert response.json()["forecast"][1]["date"] == "2023-12-05"
+    
+    def test_get_weather_batch(self, client: TestClient, db_session: Session, monkeypatch):
+        """测试批量获取天气接口"""
+        # 数据库中已有上海的天气数据
+        db_session.add(Weather(**WeatherCreate(
+            city="上海",
+            country="CN",
+            temperature=18.0,
+            humidity=70,
+            wind_speed=2.0,
+            description="多云",
+            icon="02d"
+        ).model_dump()))
+        db_session.commit()
+        
+        fetched = []
+        
+        async def mock_fetch_weather_from_api(self, city):
+            fetched.append(city)
+            if city != "北京":
+                return None
+            return {
+                "name": "北京",
+                "sys": {"country": "CN"},
+                "main": {"temp": 25.5, "humidity": 60},
+                "wind": {"speed": 3.5},
+                "weather": [{"description": "晴", "icon": "01d"}]
+            }
+        
+        from app.services.weather_service import WeatherService
+        monkeypatch.setattr(WeatherService, "fetch_weather_from_api", mock_fetch_weather_from_api)
+        
+        response = client.post(
+            "/api/weather/batch", json={"cities": ["北京", "上海", "不存在的城市", "北京"]}
+        )
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert list(data["results"]) == ["北京", "上海"]
+        assert data["results"]["北京"]["temperature"] == 25.5
+        assert data["results"]["上海"]["temperature"] == 18.0
+        assert "不存在的城市" in data["errors"]
+        assert sorted(fetched) == ["不存在的城市", "北京"]
+    
+    def test_get_weather_batch_too_many_cities(self, client: TestClient, monkeypatch):
+        """测试批量查询城市数超过上限"""
+        from app.utils.config import settings
+        monkeypatch.setattr(settings, "WEATHER_BATCH_MAX_CITIES", 2)
+        
+        response = client.post("/api/weather/batch", json={"cities": ["北京", "上海", "广州"]})
+        assert response.status_code == 400
+    
+    def test_get_weather_history_rollups(self, client: TestClient, db_session: Session):
+        """测试按小时和按天获取聚合的天气历史数据"""
+        from datetime import datetime
+        from app.models.weather import WeatherObservation
+        from app.services.rollup_service import apply_observations
+        
+        observations = [
+            WeatherObservation(
+                city="北京", country="CN", temperature=temperature, humidity=humidity,
+                wind_speed=wind_speed, description="晴", icon="01d", observed_at=observed_at
+            )
+            for temperature, humidity, wind_speed, observed_at in [
+                (10.0, 40, 1.0, datetime(2024, 1, 1, 8, 10)),
+                (14.0, 60, 3.0, datetime(2024, 1, 1, 8, 40)),
+                (20.0, 50, 2.0, datetime(2024, 1, 1, 14, 0)),
+            ]
+        ]
+        db_session.add_all(observations)
+        apply_observations(db_session, observations)
+        db_session.commit()
+        
+        response = client.get("/api/weather/history/北京?resolution=hour&from=2024-01-01T00:00:00")
+        assert response.status_code == 200
+        hours = response.json()
+        assert [hour["bucket_start"] for hour in hours] == ["2024-01-01T08:00:00", "2024-01-01T14:00:00"]
+        assert hours[0]["sample_count"] == 2
+        assert hours[0]["temperature_avg"] == 12.0
+        assert hours[0]["temperature_min"] == 10.0
+        assert hours[0]["temperature_max"] == 14.0
+        
+        response = client.get("/api/weather/history/北京?resolution=day")
+        days = response.json()
+        assert len(days) == 1
+        assert days[0]["sample_count"] == 3
+        assert days[0]["humidity_avg"] == 50.0
+        assert days[0]["wind_speed_max"] == 3.0
+        
+        response = client.get("/api/weather/history/北京?limit=2")
+        raw = response.json()
+        assert [item["temperature"] for item in raw] == [20.0, 14.0]